@@ -0,0 +1,99 @@
+"""
+Shared fixtures for the benchmark suite.
+
+The benchmarks use `pytest-benchmark`, and run offline. Run them from this folder:
+
+    python -m pytest *_benchmarks.py
+
+By default synthetic glossaries are generated at 10^3 and 10^4 entries. Pass `--benchmark-large` to also run at 10^5
+and 10^6 entries; be warned that initializing a catalog at that scale writes millions of files.
+
+The import benchmarks (`import_benchmarks.py`) track cold-start cost instead, recording the `python -X importtime`
+figures of the package's modules in their `extra_info`.
+
+Every other benchmark reports its peak memory use (in KB, as measured by `tracemalloc` over a single extra run) in the
+`peak_memory_kb` field of its `extra_info`. Use `--benchmark-json` to save results, and `--benchmark-compare` to
+compare them against a saved run.
+"""
+
+import sys; sys.path.append('../')
+import copy
+import json
+import tracemalloc
+
+import pytest
+
+SMALL_SIZES = [10 ** 3, 10 ** 4]
+LARGE_SIZES = [10 ** 5, 10 ** 6]
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark-large", action="store_true", default=False,
+                     help="Also run the synthetic glossary benchmarks at 10^5 and 10^6 entries.")
+
+
+def pytest_generate_tests(metafunc):
+    if "glossary_size" in metafunc.fixturenames:
+        sizes = SMALL_SIZES + (LARGE_SIZES if metafunc.config.getoption("benchmark_large") else [])
+        metafunc.parametrize("glossary_size", sizes, scope="module")
+
+
+def read_glossary(fp):
+    """Helper function. Read a glossary from the tests/data folder."""
+    with open("../tests/data/" + fp, "r") as f:
+        return json.load(f)
+
+
+def generate_glossary(n):
+    """
+    Generates a synthetic glossary with `n` entries, by cycling through the entries in the full test glossary. Each
+    copy is given a distinct resource URL. Every other copy keeps the original's name, so that the folder name
+    collision handling in `init_catalog` gets a workout too.
+    """
+    template = read_glossary("full_glossary.json")
+    glossary = []
+    for i in range(n):
+        cycle, original = divmod(i, len(template))
+        entry = copy.deepcopy(template[original])
+        if cycle > 0:
+            entry['resource'] = "{0}#copy-{1}".format(entry['resource'], cycle)
+            if cycle % 2 == 1:
+                entry['name'] = "{0} {1}".format(entry['name'], cycle)
+        glossary.append(entry)
+    return glossary
+
+
+@pytest.fixture(scope="module")
+def synthetic_glossary_filepath(glossary_size, tmp_path_factory):
+    """
+    The filepath of a synthetic glossary of `glossary_size` entries.
+    """
+    filepath = str(tmp_path_factory.mktemp("glossaries") / "glossary-{0}.json".format(glossary_size))
+    with open(filepath, "w") as f:
+        json.dump(generate_glossary(glossary_size), f)
+    return filepath
+
+
+@pytest.fixture
+def fresh_folder(tmp_path_factory):
+    """
+    Returns a function which creates and returns a new, empty folder every time it is called. For benchmarks whose
+    rounds each need a clean slate.
+    """
+    def make_folder():
+        return str(tmp_path_factory.mktemp("root"))
+    return make_folder
+
+
+def record_peak_memory(benchmark, func, *args, **kwargs):
+    """
+    Runs `func` once under `tracemalloc`, recording its peak memory use in the benchmark's `extra_info`. Tracing slows
+    Python down considerably, so this is done in a separate run from the timed ones.
+    """
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info['peak_memory_kb'] = peak / 1024
@@ -0,0 +1,68 @@
+"""
+Benchmarks for the resource list and glossary file I/O shared by the glossarizers.
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import generate_glossary, record_peak_memory
+from urban_physiology_toolkit.glossarizers.utils import write_resource_file, load_glossary_todo
+
+
+@pytest.fixture(scope="module")
+def resource_list(glossary_size):
+    """
+    A synthetic resource list of `glossary_size` entries, with every other resource already processed.
+    """
+    resources = generate_glossary(glossary_size)
+    for i, resource in enumerate(resources):
+        resource['flags'] = ['processed'] if i % 2 == 0 else []
+    return resources
+
+
+def test_write_resource_file(benchmark, resource_list, fresh_folder):
+    """
+    Writes a resource list to a fresh file.
+    """
+    def setup():
+        return (resource_list, fresh_folder() + "/resource-list.json"), dict()
+
+    record_peak_memory(benchmark, write_resource_file, *setup()[0])
+    benchmark.pedantic(write_resource_file, setup=setup, rounds=3)
+
+
+def test_write_resource_file_merge(benchmark, resource_list, fresh_folder):
+    """
+    Merges a resource list into a preexisting resource file which already contains half of its resources.
+    """
+    seed_filepath = fresh_folder() + "/resource-list.json"
+    write_resource_file(resource_list[::2], seed_filepath)
+
+    def setup():
+        filepath = fresh_folder() + "/resource-list.json"
+        shutil.copyfile(seed_filepath, filepath)
+        return (resource_list, filepath), dict()
+
+    record_peak_memory(benchmark, write_resource_file, *setup()[0])
+    benchmark.pedantic(write_resource_file, setup=setup, rounds=3)
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_load_glossary_todo(benchmark, resource_list, fresh_folder, use_cache):
+    """
+    Loads the to-do list for a glossary run which is half done.
+    """
+    folder = fresh_folder()
+    resource_filepath, glossary_filepath = folder + "/resource-list.json", folder + "/glossary.json"
+    write_resource_file(resource_list, resource_filepath)
+    with open(glossary_filepath, "w") as f:
+        json.dump(resource_list[::2], f)
+
+    record_peak_memory(benchmark, load_glossary_todo, resource_filepath, glossary_filepath, use_cache=use_cache)
+    resources, glossary = benchmark(load_glossary_todo, resource_filepath, glossary_filepath, use_cache=use_cache)
+
+    assert len(resources) == (len(resource_list) // 2 if use_cache else len(resource_list))
+    assert os.path.isfile(glossary_filepath) and len(glossary) == len(resource_list[::2])
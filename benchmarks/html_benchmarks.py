@@ -0,0 +1,39 @@
+"""
+Benchmarks for the HTML glossarizer's link extraction, run against the saved HTML fixtures.
+"""
+
+import pytest
+import requests_mock
+
+from conftest import record_peak_memory
+from urban_physiology_toolkit.glossarizers import html, network
+
+
+@pytest.fixture(autouse=True)
+def unlimited_rate(monkeypatch):
+    """
+    Lifts the per-host rate limit, which would otherwise dominate the timings of repeated requests to the same host.
+    """
+    monkeypatch.setattr(network, "limiter", network.HostRateLimiter(rate=10 ** 9, burst=10 ** 9, max_rate=10 ** 9))
+
+
+def read_file(fp):
+    """Helper function. Read a file from the tests/data folder as bytes."""
+    with open("../tests/data/" + fp, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("fixture, selector", [
+    ("example-categorical-table.html", "div.population-census"),
+    ("example-link-table.html", "div.archive-section")
+])
+def test_extract_links(benchmark, fixture, selector):
+    url = "http://www.mdps.gov.qa/en/statistics1/Pages/default.aspx"
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, content=read_file(fixture))
+
+        record_peak_memory(benchmark, html._extract_links, url, selector)
+        links = benchmark(html._extract_links, url, selector)
+
+    assert len(links) > 0
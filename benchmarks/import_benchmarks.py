@@ -0,0 +1,44 @@
+"""
+Cold-start import time benchmarks. Each round imports a module in a fresh interpreter run with `python -X importtime`,
+and the cumulative import time it reports for the module, along with its most expensive dependencies, is recorded
+alongside the wall time of the whole interpreter run.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+MODULES = ['urban_physiology_toolkit', 'urban_physiology_toolkit.workflow',
+           'urban_physiology_toolkit.glossarizers.socrata', 'urban_physiology_toolkit.glossarizers.ckan',
+           'urban_physiology_toolkit.glossarizers.html']
+TOP_DEPENDENCIES = 5
+
+
+def import_times(module):
+    """
+    Imports the given module in a fresh interpreter, returning a {module: cumulative microseconds} dict of every module
+    imported along the way, as reported by `python -X importtime`.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pardir)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], env=env,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time(benchmark, module):
+    times = benchmark.pedantic(import_times, args=(module,), rounds=5)
+
+    dependencies = sorted(((name, us) for name, us in times.items() if not name.startswith(module)),
+                          key=lambda item: -item[1])
+    benchmark.extra_info['import_time_ms'] = times[module] / 1000
+    benchmark.extra_info['top_dependencies_ms'] = {name: us / 1000 for name, us in dependencies[:TOP_DEPENDENCIES]}
@@ -0,0 +1,21 @@
+"""
+End-to-end glossarization benchmarks, run against the synthetic portal server. See `load_test.py` for the harness, and
+for running larger load tests from the command line.
+"""
+
+import pytest
+
+from load_test import run_load_test, GLOSSARIZERS
+from portal_server import PortalConfig
+
+
+@pytest.mark.parametrize("glossarizer", GLOSSARIZERS)
+def test_glossarize_synthetic_portal(benchmark, glossarizer):
+    config = PortalConfig(datasets=50, failure_rate=0.05)
+    report = benchmark.pedantic(run_load_test, args=(glossarizer, config), kwargs={'unlimited_rate': True},
+                                rounds=1)
+
+    benchmark.extra_info.update({key: report[key] for key in ['resources', 'glossary_entries', 'resources_per_second',
+                                                              'server_requests', 'bytes']})
+    assert report['resources'] == 50
+    assert report['outcomes']['failed'] == 0
@@ -0,0 +1,155 @@
+"""
+End-to-end load test harness. Runs the real `write_resource_list` and `write_glossary` methods of a glossarizer against
+the synthetic portal server (see `portal_server.py`), and reports throughput.
+
+Run it from this folder, e.g.:
+
+    python load_test.py socrata --datasets 1000 --latency 0.05 --throttle-rate 20 --failure-rate 0.01
+
+By default the glossarizers' own per-host rate limiter is left in place, so that the numbers reflect what a real run
+would see. Pass `--unlimited-rate` to lift it and measure the glossarizer code itself instead.
+"""
+
+import sys; sys.path.append('../')
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from portal_server import (SyntheticPortalServer, PortalConfig, redirect_to, SOCRATA_DOMAIN, SOCRATA_HOMEPAGE_DOMAIN,
+                           CKAN_DOMAIN, HTML_HOMEPAGE)
+from urban_physiology_toolkit.glossarizers import metrics, network
+
+GLOSSARIZERS = ['socrata', 'ckan', 'html']
+
+
+def _stages(glossarizer, folder):
+    """
+    Helper function. Returns the glossarizer module, and the keyword arguments to run its resource list and glossary
+    stages against the synthetic portals with.
+    """
+    resource_filename, glossary_filename = folder + "/resource-list.json", folder + "/glossary.json"
+
+    if glossarizer == 'socrata':
+        from urban_physiology_toolkit.glossarizers import socrata as module
+        credentials = folder + "/credentials.json"
+        with open(credentials, "w") as fp:
+            json.dump({'token': "load-test"}, fp)
+        resource_list_kwargs = {'domain': SOCRATA_DOMAIN, 'credentials': credentials}
+        glossary_kwargs = {'domain': SOCRATA_HOMEPAGE_DOMAIN}
+    elif glossarizer == 'ckan':
+        from urban_physiology_toolkit.glossarizers import ckan as module
+        resource_list_kwargs = {'domain': CKAN_DOMAIN}
+        glossary_kwargs = {'domain': CKAN_DOMAIN}
+    elif glossarizer == 'html':
+        from urban_physiology_toolkit.glossarizers import html as module
+        resource_list_kwargs = {'domain': HTML_HOMEPAGE}
+        glossary_kwargs = {'domain': HTML_HOMEPAGE}
+    else:
+        raise ValueError("Unknown glossarizer '{0}'. Valid options are {1}.".format(glossarizer,
+                                                                                   ", ".join(GLOSSARIZERS)))
+
+    resource_list_kwargs.update({'filename': resource_filename, 'use_cache': False})
+    glossary_kwargs.update({'resource_filename': resource_filename, 'glossary_filename': glossary_filename,
+                            'use_cache': False})
+    return module, resource_list_kwargs, glossary_kwargs
+
+
+def run_load_test(glossarizer, config=None, folder=None, timeout=60, unlimited_rate=False):
+    """
+    Runs a glossarizer end to end against the synthetic portal server.
+
+    Parameters
+    ----------
+    glossarizer: {'socrata', 'ckan', 'html'}, required
+        The glossarizer to run.
+    config: PortalConfig, optional
+        The synthetic portal configuration. Defaults to `PortalConfig()`.
+    folder: str, optional
+        The folder to write the resource list and glossary to. Defaults to a temporary folder.
+    timeout: int, default 60
+        The per-resource download timeout passed to `write_glossary`.
+    unlimited_rate: bool, default False
+        Whether or not to lift the per-host rate limit for the duration of the run.
+
+    Returns
+    -------
+    A report on the run, as a dict.
+    """
+    config = config or PortalConfig()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        folder = folder or temp_folder
+        module, resource_list_kwargs, glossary_kwargs = _stages(glossarizer, folder)
+
+        # Each run starts with a clean slate of host state.
+        limiter, breaker = network.limiter, network.breaker
+        if unlimited_rate:
+            network.limiter = network.HostRateLimiter(rate=10 ** 9, burst=10 ** 9, max_rate=10 ** 9)
+        network.breaker = network.CircuitBreaker()
+
+        try:
+            with SyntheticPortalServer(config) as server, redirect_to(server):
+                start = time.perf_counter()
+                module.write_resource_list(**resource_list_kwargs)
+                resource_list_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                module.write_glossary(timeout=timeout, **glossary_kwargs)
+                glossary_seconds = time.perf_counter() - start
+        finally:
+            network.limiter, network.breaker = limiter, breaker
+
+        with open(resource_list_kwargs['filename'], "r") as fp:
+            resources = len(json.load(fp))
+        with open(glossary_kwargs['glossary_filename'], "r") as fp:
+            glossary_entries = len(json.load(fp))
+
+    summary = metrics.current.summary()
+    return {
+        'glossarizer': glossarizer,
+        'datasets': config.datasets,
+        'server_requests': server.requests,
+        'resources': resources,
+        'glossary_entries': glossary_entries,
+        'resource_list_seconds': resource_list_seconds,
+        'glossary_seconds': glossary_seconds,
+        'resources_per_second': summary['resources_processed'] / glossary_seconds if glossary_seconds else None,
+        'outcomes': summary['outcomes'],
+        'bytes': summary['bytes']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a glossarizer against a synthetic local portal.")
+    parser.add_argument("glossarizer", choices=GLOSSARIZERS)
+    parser.add_argument("--datasets", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=None)
+    parser.add_argument("--no-chunked", dest="chunked", action="store_false")
+    parser.add_argument("--no-ranges", dest="ranges", action="store_false")
+    parser.add_argument("--zip-fraction", type=float, default=0.1)
+    parser.add_argument("--deleted-fraction", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--unlimited-rate", action="store_true")
+    parser.add_argument("--output", default=None, help="A folder to keep the resource list and glossary in.")
+    args = parser.parse_args()
+
+    config = PortalConfig(datasets=args.datasets, latency=args.latency, throttle_rate=args.throttle_rate,
+                          chunked=args.chunked, ranges=args.ranges, zip_fraction=args.zip_fraction,
+                          deleted_fraction=args.deleted_fraction, failure_rate=args.failure_rate, rows=args.rows,
+                          seed=args.seed)
+    if args.output and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    report = run_load_test(args.glossarizer, config, folder=args.output, timeout=args.timeout,
+                           unlimited_rate=args.unlimited_rate)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
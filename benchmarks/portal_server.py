@@ -0,0 +1,524 @@
+"""
+A local stand-in for the open data portals the glossarizers talk to, for offline end-to-end load testing.
+
+A single `SyntheticPortalServer` plays every portal at once, telling them apart by the `Host` header of each request.
+It mimics:
+
+* A Socrata portal (`SOCRATA_DOMAIN`, with its landing page homepage at `SOCRATA_HOMEPAGE_DOMAIN`) and the Socrata
+  catalog API (`SOCRATA_CATALOG_DOMAIN`). Landing pages embed their state the way real ones do, so that they can be read
+  by the embedded state pager.
+* A CKAN portal (`CKAN_DOMAIN`, in the dialect of data.gov.sg), with the `package_list`, `package_show`, and
+  `package_search` actions, and its file store (`CKAN_STORAGE_DOMAIN`).
+* An HTML listing portal (`HTML_DOMAIN`, in the shape of the Qatari Ministry of Planning and Statistics site).
+
+The catalogs are synthetic, and are generated deterministically from a `PortalConfig`, which also sets the catalog
+size, the response latency, server-side throttling, chunked transfer encoding, the share of ZIP payloads, and failure
+injection. Requests are pointed at the server using `redirect_to` (see `load_test.py`), which leaves the glossarizers
+themselves untouched.
+
+Injected failures only ever affect dataset downloads, never catalog metadata or landing pages: a glossarizer which
+cannot read its catalog cannot be load tested, and the Socrata glossarizer falls back to the Selenium pager (and hence
+needs PhantomJS) when a landing page fails.
+"""
+
+import contextlib
+import http.server
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SOCRATA_DOMAIN = "data.cityofnewyork.us"
+SOCRATA_HOMEPAGE_DOMAIN = "opendata.cityofnewyork.us"
+SOCRATA_CATALOG_DOMAIN = "api.us.socrata.com"
+CKAN_DOMAIN = "data.gov.sg"
+CKAN_STORAGE_DOMAIN = "storage.data.gov.sg"
+HTML_DOMAIN = "www.mdps.gov.qa"
+HTML_HOMEPAGE = "http://www.mdps.gov.qa/en/statistics1/Pages/default.aspx"
+
+DOMAINS = [SOCRATA_DOMAIN, SOCRATA_HOMEPAGE_DOMAIN, SOCRATA_CATALOG_DOMAIN, CKAN_DOMAIN, CKAN_STORAGE_DOMAIN,
+           HTML_DOMAIN]
+
+# The share of each Socrata endpoint type in the synthetic catalog.
+SOCRATA_TYPES = [('dataset', 0.7), ('map', 0.1), ('file', 0.1), ('href', 0.1)]
+
+
+class PortalConfig:
+    """
+    The shape and behavior of the synthetic portals.
+
+    Parameters
+    ----------
+    datasets: int, default 100
+        The number of datasets in each portal's catalog.
+    latency: float, default 0
+        The number of seconds the server waits before responding to each request.
+    throttle_rate: float, optional
+        If set, the number of requests per second each host serves before responding with `429 Too Many Requests`
+        (and a `Retry-After` header).
+    chunked: bool, default True
+        Whether dataset downloads are sent using chunked transfer encoding, and hence without a `Content-Length`
+        header, as Socrata does.
+    ranges: bool, default True
+        Whether dataset downloads honor `Range` requests (with `206 Partial Content`), as most static file servers do.
+    zip_fraction: float, default 0.1
+        The share of downloadable datasets which are ZIP archives (of two CSV files each) rather than CSV files.
+    deleted_fraction: float, default 0.05
+        The share of Socrata tables whose landing pages redirect to the portal homepage, as deleted endpoints do.
+    failure_rate: float, default 0
+        The probability that a dataset download fails with a `500 Internal Server Error`.
+    rows: int, default 1000
+        The number of rows in each CSV payload.
+    seed: int, default 0
+        The random seed the catalogs and failures are generated from.
+    """
+    def __init__(self, datasets=100, latency=0, throttle_rate=None, chunked=True, ranges=True,
+                 zip_fraction=0.1, deleted_fraction=0.05, failure_rate=0, rows=1000, seed=0):
+        self.datasets = datasets
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.chunked = chunked
+        self.ranges = ranges
+        self.zip_fraction = zip_fraction
+        self.deleted_fraction = deleted_fraction
+        self.failure_rate = failure_rate
+        self.rows = rows
+        self.seed = seed
+
+
+##################
+# SYNTHETIC DATA #
+##################
+
+def _csv_payload(rows, seed):
+    """Helper function. Generates a CSV file."""
+    rng = random.Random(seed)
+    lines = ["id,borough,value,recorded"]
+    for i in range(rows):
+        lines.append("{0},{1},{2:.4f},2017-0{3}-1{4}".format(i, rng.choice(["Bronx", "Brooklyn", "Manhattan"]),
+                                                             rng.random() * 1000, rng.randint(1, 9),
+                                                             rng.randint(0, 9)))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _zip_payload(rows, seed):
+    """Helper function. Generates a ZIP archive containing two CSV files."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("data/part-1.csv", _csv_payload(rows, seed))
+        z.writestr("data/part-2.csv", _csv_payload(rows, seed + 1))
+    return buffer.getvalue()
+
+
+def _geojson_payload(rows, seed):
+    """Helper function. Generates a GeoJSON file of points."""
+    rng = random.Random(seed)
+    features = [{'type': 'Feature', 'properties': {'id': i},
+                 'geometry': {'type': 'Point', 'coordinates': [-74 + rng.random(), 40 + rng.random()]}}
+                for i in range(rows)]
+    return json.dumps({'type': 'FeatureCollection', 'features': features}).encode("utf-8")
+
+
+class SyntheticCatalog:
+    """
+    The synthetic catalogs served, generated deterministically from a `PortalConfig`.
+    """
+    def __init__(self, config):
+        self.config = config
+        rng = random.Random(config.seed)
+
+        self.socrata = []
+        for i in range(config.datasets):
+            endpoint = "syn{0}-{1:04d}".format(i // 10000, i % 10000)
+            endpoint_type = rng.choices([t for t, _ in SOCRATA_TYPES], [w for _, w in SOCRATA_TYPES])[0]
+            self.socrata.append({
+                'id': endpoint,
+                'type': endpoint_type,
+                'name': "Synthetic Dataset {0}".format(i),
+                'columns': ["column {0}".format(c) for c in range(rng.randint(2, 40))],
+                'rows': rng.randint(0, 10 ** 6),
+                'deleted': endpoint_type == 'dataset' and rng.random() < config.deleted_fraction,
+                'zipped': rng.random() < config.zip_fraction,
+                'page_views': rng.randint(0, 10 ** 5),
+                'seed': rng.randint(0, 10 ** 6)
+            })
+        self.socrata_by_id = {endpoint['id']: endpoint for endpoint in self.socrata}
+
+        self.ckan = []
+        for i in range(config.datasets):
+            self.ckan.append({
+                'name': "synthetic-dataset-{0}".format(i),
+                'title': "Synthetic Dataset {0}".format(i),
+                'zipped': rng.random() < config.zip_fraction,
+                'seed': rng.randint(0, 10 ** 6)
+            })
+        self.ckan_by_name = {package['name']: package for package in self.ckan}
+
+        # The HTML portal lists its files across ten category pages.
+        self.html = [{'path': "/files/synthetic-{0}.{1}".format(i, "xls" if i % 2 else "pdf"),
+                      'seed': rng.randint(0, 10 ** 6)} for i in range(config.datasets)]
+        self.html_by_path = {f['path']: f for f in self.html}
+
+    def payload(self, seed, zipped):
+        return (_zip_payload if zipped else _csv_payload)(self.config.rows, seed)
+
+    def socrata_metadata(self, endpoint):
+        """The catalog API metadata entry for a Socrata endpoint."""
+        return {
+            'resource': {
+                'id': endpoint['id'],
+                'type': endpoint['type'],
+                'name': endpoint['name'],
+                'description': "A synthetic dataset.",
+                'attribution': "Department of Synthetic Data",
+                'createdAt': "2015-07-13T18:48:56.000Z",
+                'updatedAt': "2017-05-31T21:08:56.000Z",
+                'page_views': {'page_views_total': endpoint['page_views']},
+                'columns_name': endpoint['columns'],
+                'provenance': 'official'
+            },
+            'classification': {
+                'domain_category': "Synthetic",
+                'domain_tags': ["synthetic", "load test"]
+            }
+        }
+
+    def socrata_view(self, endpoint):
+        """The view state embedded in a Socrata landing page."""
+        view = {
+            'id': endpoint['id'],
+            'name': endpoint['name'],
+            'rowCount': endpoint['rows'] if endpoint['type'] == 'dataset' else None,
+            'columns': [{'fieldName': ":id"}] + [{'fieldName': name.replace(" ", "_")}
+                                                 for name in endpoint['columns']]
+        }
+        if endpoint['type'] == 'file':
+            view['blobId'] = "blob-" + endpoint['id']
+            view['blobFilename'] = "{0}.{1}".format(endpoint['id'], "zip" if endpoint['zipped'] else "csv")
+        elif endpoint['type'] == 'href':
+            view['metadata'] = {'accessPoints': {
+                'csv': "https://{0}/download/{1}.csv".format(SOCRATA_DOMAIN, endpoint['id'])
+            }}
+        return view
+
+    def ckan_package(self, package):
+        """The `package_show` result for a CKAN package."""
+        filename = "{0}.{1}".format(package['name'], "zip" if package['zipped'] else "csv")
+        return {
+            'name': package['name'],
+            'title': package['title'],
+            'license': "Singapore Open Data Licence",
+            'publisher': {'name': "Synthetic Agency"},
+            'keywords': ["synthetic"],
+            'description': "A synthetic dataset.",
+            'topics': ["Synthetic"],
+            'sources': ["Synthetic Agency"],
+            'frequency': "Annual",
+            'last_updated': "2017-05-31T21:08:56",
+            'resources': [{
+                'title': package['title'],
+                'format': "ZIP" if package['zipped'] else "CSV",
+                'url': "https://{0}/{1}/resources/{2}".format(CKAN_STORAGE_DOMAIN, package['name'], filename)
+            }]
+        }
+
+
+##########
+# SERVER #
+##########
+
+class _Throttle:
+    """Helper class. A per-host token bucket, used to decide when to respond with a 429."""
+    def __init__(self, rate):
+        self.rate = rate
+        self.buckets = dict()
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(host, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[host] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+
+class _PortalRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Headers and bodies are written separately; with Nagle's algorithm on, every response would stall on a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    @property
+    def config(self):
+        return self.server.catalog.config
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        self.head = head
+        self.server.record_request()
+        host = self.headers.get('Host', "").split(":")[0]
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        if self.config.latency:
+            time.sleep(self.config.latency)
+
+        if self.server.throttle and not self.server.throttle.allow(host):
+            self.respond(429, b"Too Many Requests", "text/plain", headers={'Retry-After': "1"})
+            return
+
+        routes = {
+            SOCRATA_CATALOG_DOMAIN: self.socrata_catalog,
+            SOCRATA_DOMAIN: self.socrata,
+            SOCRATA_HOMEPAGE_DOMAIN: self.homepage,
+            CKAN_DOMAIN: self.ckan,
+            CKAN_STORAGE_DOMAIN: self.ckan_storage,
+            HTML_DOMAIN: self.html
+        }
+        if host not in routes:
+            self.not_found()
+            return
+        routes[host](url.path, query)
+
+    def respond(self, status, body, content_type, headers=None, chunked=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if self.head:
+            return
+        if chunked:
+            for start in range(0, len(body), 64 * 1024):
+                chunk = body[start:start + 64 * 1024]
+                self.wfile.write("{0:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.wfile.write(body)
+
+    def respond_json(self, data):
+        self.respond(200, json.dumps(data).encode("utf-8"), "application/json")
+
+    def respond_download(self, body, content_type):
+        byte_range = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get('Range', ""))
+        if self.server.fail():
+            self.respond(500, b"Internal Server Error", "text/plain")
+        elif self.config.ranges and byte_range and any(byte_range.groups()):
+            start, end = byte_range.groups()
+            if not start:
+                start, end = max(len(body) - int(end), 0), len(body) - 1
+            else:
+                start, end = int(start), min(int(end), len(body) - 1) if end else len(body) - 1
+            self.respond(206, body[start:end + 1], content_type,
+                         headers={'Content-Range': "bytes {0}-{1}/{2}".format(start, end, len(body))})
+        else:
+            self.respond(200, body, content_type, chunked=self.config.chunked)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def not_found(self):
+        self.respond(404, b"Not Found", "text/plain")
+
+    # Socrata.
+    def socrata_catalog(self, path, query):
+        if path != "/api/catalog/v1":
+            self.not_found()
+            return
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 100))
+        endpoints = self.catalog.socrata[offset:offset + limit]
+        self.respond_json({'results': [self.catalog.socrata_metadata(e) for e in endpoints],
+                           'resultSetSize': len(self.catalog.socrata)})
+
+    def socrata(self, path, query):
+        # Landing pages are at /d/{id}, downloads at /api/geospatial/{id}, /api/views/{id}/..., and /download/{id}.csv.
+        parts = path.strip("/").split("/")
+        if parts[0] in ["d", "download"] and len(parts) == 2:
+            endpoint_id = parts[1].split(".")[0]
+        elif parts[0] == "api" and len(parts) > 2:
+            endpoint_id = parts[2]
+        else:
+            endpoint_id = None
+
+        endpoint = self.catalog.socrata_by_id.get(endpoint_id)
+        if endpoint is None:
+            self.not_found()
+        elif parts[0] == "d":
+            if endpoint['deleted']:
+                self.redirect("https://{0}/".format(SOCRATA_HOMEPAGE_DOMAIN))
+            else:
+                page = "<html><head><script>var initialState = {0};</script></head><body></body></html>".format(
+                    json.dumps({'view': self.catalog.socrata_view(endpoint)}))
+                self.respond(200, page.encode("utf-8"), "text/html; charset=utf-8")
+        elif parts[:2] == ["api", "geospatial"]:
+            self.respond_download(_geojson_payload(min(self.config.rows, 100), endpoint['seed']),
+                                  "application/vnd.geo+json")
+        elif parts[:2] == ["api", "views"] and endpoint['zipped'] and endpoint['type'] == 'file':
+            self.respond_download(self.catalog.payload(endpoint['seed'], True), "application/zip")
+        else:
+            self.respond_download(self.catalog.payload(endpoint['seed'], False), "text/csv")
+
+    def homepage(self, path, query):
+        self.respond(200, b"<html><body>Synthetic open data portal</body></html>", "text/html; charset=utf-8")
+
+    # CKAN.
+    def ckan(self, path, query):
+        if path == "/api/3/action/package_list":
+            self.respond_json({'success': True, 'result': [package['name'] for package in self.catalog.ckan]})
+        elif path == "/api/3/action/package_show":
+            package = self.catalog.ckan_by_name.get(query.get('id'))
+            if package is None:
+                self.respond(404, json.dumps({'success': False}).encode("utf-8"), "application/json")
+            else:
+                self.respond_json({'success': True, 'result': self.catalog.ckan_package(package)})
+        elif path == "/api/3/action/package_search":
+            start, rows = int(query.get('start', 0)), int(query.get('rows', 10))
+            packages = self.catalog.ckan[start:start + rows]
+            self.respond_json({'success': True, 'result': {
+                'count': len(self.catalog.ckan),
+                'results': [self.catalog.ckan_package(package) for package in packages]
+            }})
+        else:
+            self.not_found()
+
+    def ckan_storage(self, path, query):
+        package = self.catalog.ckan_by_name.get(path.strip("/").split("/")[0])
+        if package is None:
+            self.not_found()
+        else:
+            self.respond_download(self.catalog.payload(package['seed'], package['zipped']),
+                                  "application/zip" if package['zipped'] else "text/csv")
+
+    # HTML.
+    def html(self, path, query):
+        homepage_path = urllib.parse.urlsplit(HTML_HOMEPAGE).path
+        if path == homepage_path:
+            links = "".join('<a href="/en/statistics1/pages/topicslisting.aspx?child={0}">Category {0}</a>'.format(i)
+                            for i in range(10))
+            page = '<html><body><div class="population-census">{0}</div></body></html>'.format(links)
+            self.respond(200, page.encode("utf-8"), "text/html; charset=utf-8")
+        elif path == "/en/statistics1/pages/topicslisting.aspx":
+            child = int(query.get('child', 0))
+            links = "".join('<a href="{0}">File</a>'.format(f['path']) for f in self.catalog.html[child::10])
+            page = '<html><body><div class="archive-content">{0}</div></body></html>'.format(links)
+            self.respond(200, page.encode("utf-8"), "text/html; charset=utf-8")
+        elif path in self.catalog.html_by_path:
+            self.respond_download(self.catalog.payload(self.catalog.html_by_path[path]['seed'], False),
+                                  "application/vnd.ms-excel" if path.endswith("xls") else "application/pdf")
+        else:
+            self.not_found()
+
+
+class SyntheticPortalServer(http.server.ThreadingHTTPServer):
+    """
+    A local HTTP server playing the synthetic portals, per the given `PortalConfig`. Use as a context manager, which
+    serves requests from a background thread:
+
+        with SyntheticPortalServer(PortalConfig(datasets=1000)) as server:
+            with redirect_to(server):
+                ...
+    """
+    daemon_threads = True
+
+    def __init__(self, config=None, address=("127.0.0.1", 0)):
+        super().__init__(address, _PortalRequestHandler)
+        self.catalog = SyntheticCatalog(config or PortalConfig())
+        self.throttle = _Throttle(self.catalog.config.throttle_rate) if self.catalog.config.throttle_rate else None
+        self.requests = 0
+        self._rng = random.Random(self.catalog.config.seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def fail(self):
+        """Returns whether or not to inject a failure into the current download."""
+        with self._lock:
+            return self._rng.random() < self.catalog.config.failure_rate
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+#############
+# REDIRECTS #
+#############
+
+class _RedirectingAdapter(HTTPAdapter):
+    """
+    A transport adapter which sends requests to the local server instead of the host they are addressed to, passing
+    the original host along in the `Host` header. Responses keep the URL they were requested under, so that redirect
+    handling and deleted endpoint detection work as they would against the real portals.
+    """
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+
+    def send(self, request, **kwargs):
+        url = urllib.parse.urlsplit(request.url)
+        redirected = request.copy()
+        redirected.url = urllib.parse.urlunsplit(('http', "{0}:{1}".format(*self.address), url.path, url.query, ''))
+        redirected.headers['Host'] = url.netloc
+        response = super().send(redirected, **kwargs)
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@contextlib.contextmanager
+def redirect_to(server, domains=DOMAINS):
+    """
+    Sends every request (made via `requests`, from any session) for the given domains to the given local server.
+    """
+    adapter = _RedirectingAdapter(server.server_address[:2])
+    get_adapter = requests.Session.get_adapter
+
+    def redirecting_get_adapter(session, url):
+        if urllib.parse.urlsplit(url).hostname in domains:
+            return adapter
+        return get_adapter(session, url)
+
+    requests.Session.get_adapter = redirecting_get_adapter
+    try:
+        yield adapter
+    finally:
+        requests.Session.get_adapter = get_adapter
+        adapter.close()
@@ -0,0 +1,50 @@
+"""
+Benchmarks for building Socrata resource lists out of catalog API metadata, run against the saved metadata fixtures.
+"""
+
+import copy
+import json
+
+import pytest
+
+from conftest import record_peak_memory
+from urban_physiology_toolkit.glossarizers import socrata
+
+METADATA_SIZES = [10 ** 3, 10 ** 4]
+
+
+def generate_metadata(n):
+    """
+    Generates `n` catalog API metadata records for tables and geospatial datasets, by cycling through the saved
+    fixtures. Each copy is given a distinct endpoint ID and timestamps.
+    """
+    templates = []
+    for endpoint in ["f4rp-2kvy", "ghq4-ydq4"]:
+        with open("../tests/data/example_metadata-{0}.json".format(endpoint), "r") as fp:
+            templates.append(json.load(fp))
+
+    records = []
+    for i in range(n):
+        metadata = copy.deepcopy(templates[i % len(templates)])
+        metadata['resource']['id'] = "{0:04x}-{1:04x}".format(i // 65536, i % 65536)
+        metadata['resource']['createdAt'] = "2016-{0:02d}-{1:02d}T12:00:00.000Z".format(i % 12 + 1, i % 28 + 1)
+        records.append(metadata)
+    return records
+
+
+@pytest.mark.parametrize("n", METADATA_SIZES)
+def test_resourcify_batch(benchmark, n):
+    records = generate_metadata(n)
+    record_peak_memory(benchmark, socrata._resourcify_batch, records, "data.cityofnewyork.us")
+
+    resolved, unresolved = benchmark(socrata._resourcify_batch, records, "data.cityofnewyork.us")
+    assert len(resolved) == n
+
+
+@pytest.mark.parametrize("n", METADATA_SIZES)
+def test_resourcify_per_record(benchmark, n):
+    records = generate_metadata(n)
+
+    resources = benchmark.pedantic(lambda: [socrata._resourcify(metadata, "data.cityofnewyork.us")
+                                            for metadata in records], rounds=3)
+    assert len(resources) == n
@@ -0,0 +1,46 @@
+"""
+Benchmarks for the catalog initialization and DAG generation steps of the portal localization workflow.
+"""
+
+import os
+
+import pytest
+
+from conftest import record_peak_memory
+from urban_physiology_toolkit.workflow import init_catalog, update_dag
+
+
+def _rounds(glossary_size):
+    """Helper function. Large glossaries take long enough that a single round is plenty."""
+    return 3 if glossary_size <= 10 ** 4 else 1
+
+
+def test_init_catalog_full_glossary(benchmark, fresh_folder):
+    glossary_filepath = "../tests/data/full_glossary.json"
+    record_peak_memory(benchmark, init_catalog, glossary_filepath, fresh_folder())
+
+    benchmark.pedantic(init_catalog, setup=lambda: ((glossary_filepath, fresh_folder()), dict()), rounds=5)
+
+
+def test_init_catalog_synthetic(benchmark, glossary_size, synthetic_glossary_filepath, fresh_folder):
+    record_peak_memory(benchmark, init_catalog, synthetic_glossary_filepath, fresh_folder())
+
+    benchmark.pedantic(init_catalog, setup=lambda: ((synthetic_glossary_filepath, fresh_folder()), dict()),
+                       rounds=_rounds(glossary_size))
+
+
+@pytest.fixture(scope="module")
+def synthetic_catalog_root(synthetic_glossary_filepath, tmp_path_factory):
+    """
+    The root folder of a catalog initialized from a synthetic glossary, ready for DAG generation.
+    """
+    root = str(tmp_path_factory.mktemp("catalog"))
+    os.mkdir(root + "/.airflow")
+    init_catalog(synthetic_glossary_filepath, root)
+    return root
+
+
+def test_update_dag(benchmark, glossary_size, synthetic_catalog_root):
+    record_peak_memory(benchmark, update_dag, root=synthetic_catalog_root)
+
+    benchmark.pedantic(update_dag, kwargs={'root': synthetic_catalog_root}, rounds=_rounds(glossary_size))
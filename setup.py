@@ -3,7 +3,7 @@ from setuptools import setup
 setup(
   name='urban_physiology_toolkit',
   packages=['urban_physiology_toolkit'], # this must be the same as the name above
-  install_requires=['numpy', 'pandas', 'requests', 'pysocrata', 'bs4', 'requests-file', 'selenium', 'tqdm',
+  install_requires=['numpy', 'pandas', 'requests', 'bs4', 'requests-file', 'selenium', 'tqdm',
                     'python-magic', 'airscooter', 'nbformat'],
   py_modules=['urban_physiology_toolkit'],
   version='0.0.1',  # note to self: also update the one is the source!
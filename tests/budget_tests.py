@@ -0,0 +1,110 @@
+"""
+Unit tests for run-level time and byte budgets. Glossarizers run against resources served up by a mock server, so
+these tests are not network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import json
+import os
+import shutil
+import unittest
+
+import requests_mock
+
+from urban_physiology_toolkit.glossarizers import ckan, costs, metrics, network
+from urban_physiology_toolkit.glossarizers.budget import RunBudget, within_budget
+
+
+class FakeClock:
+    """Helper class. A clock which only advances when told to."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_resources(n):
+    """Helper function. Returns `n` CKAN resource entries for PDF documents, which are sized up from their headers."""
+    return [{'resource': "https://data.gov.sg/dataset/report-{0}.pdf".format(i), 'name': "Report {0}".format(i),
+             'flags': []} for i in range(n)]
+
+
+class TestRunBudget(unittest.TestCase):
+    def setUp(self):
+        metrics.current = metrics.RunMetrics()
+        self.clock = FakeClock()
+
+    def test_unlimited(self):
+        budget = RunBudget(clock=self.clock)
+        self.clock.now += 10 ** 6
+        metrics.current.record_bytes(10 ** 12)
+        assert not budget.exhausted()
+        assert budget.affords(10 ** 6)
+
+    def test_time_budget(self):
+        budget = RunBudget(seconds=60, clock=self.clock)
+        self.clock.now += 50
+        assert budget.affords(5)
+        assert not budget.affords(15)
+        self.clock.now += 10
+        assert budget.exhausted()
+
+    def test_byte_budget(self):
+        metrics.current.record_bytes(500)
+        budget = RunBudget(bytes=1000, clock=self.clock)
+        metrics.current.record_bytes(900)
+        assert budget.remaining_bytes() == 100
+        assert budget.affords(15)
+        metrics.current.record_bytes(100)
+        assert not budget.affords(0)
+
+    def test_within_budget(self):
+        budget = RunBudget(seconds=10, clock=self.clock)
+        resources = [{'resource': 'a', 'resource_type': 'table', 'flags': []},
+                     {'resource': 'b', 'resource_type': 'blob', 'flags': []}]
+
+        admitted = list(within_budget(resources, budget, costs.CostModel(timeout=60)))
+        assert admitted == resources[:1]
+        assert resources[1]['flags'] == ['deferred']
+        assert metrics.current.outcomes['deferred'] == 1
+
+    def tearDown(self):
+        metrics.current = metrics.RunMetrics()
+
+
+class TestGlossaryBudget(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        with open("temp/resource-list.json", "w") as fp:
+            json.dump(make_resources(4), fp)
+        network.breaker.reset()
+
+    def write_glossary(self, **kwargs):
+        with requests_mock.Mocker() as mock:
+            mock.head(requests_mock.ANY, headers={'content-type': 'application/pdf', 'content-length': '2048'})
+            ckan.write_glossary(domain="data.gov.sg", resource_filename="temp/resource-list.json",
+                                glossary_filename="temp/glossary.json", **kwargs)
+        with open("temp/resource-list.json", "r") as fp:
+            return json.load(fp)
+
+    def test_exhausted_budget(self):
+        resource_list = self.write_glossary(time_budget=0)
+        assert all(r['flags'] == ['deferred'] for r in resource_list)
+        with open("temp/glossary.json", "r") as fp:
+            assert json.load(fp) == []
+        with open("temp/glossary.metrics.json", "r") as fp:
+            assert json.load(fp)['outcomes']['deferred'] == 4
+
+        # The next run picks up where this one left off.
+        resource_list = self.write_glossary()
+        assert all(r['flags'] == ['processed'] for r in resource_list)
+
+    def test_deferred_resources_go_first(self):
+        resources = make_resources(3)
+        resources[2]['flags'].append('deferred')
+        assert costs.schedule(resources)[0] is resources[2]
+
+    def tearDown(self):
+        metrics.current = metrics.RunMetrics()
+        shutil.rmtree("temp")
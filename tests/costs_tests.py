@@ -0,0 +1,93 @@
+"""
+Unit tests for the cost-aware ordering of glossarization work.
+"""
+
+import sys; sys.path.append('../')
+import json
+import os
+import shutil
+import unittest
+
+from urban_physiology_toolkit.glossarizers import costs
+
+
+def resource(name, resource_type, **fields):
+    """Helper function. Returns a minimal resource entry."""
+    return dict({'resource': "https://data.cityofnewyork.us/{0}".format(name), 'name': name,
+                 'resource_type': resource_type, 'flags': []}, **fields)
+
+
+class TestCostModel(unittest.TestCase):
+    def setUp(self):
+        self.table = resource("table", "table", column_names=["a"] * 40)
+        self.blob = resource("blob", "blob")
+        self.geospatial = resource("geospatial", "geospatial dataset")
+
+    def test_defaults(self):
+        model = costs.CostModel(timeout=10)
+        assert model.cost(self.table) == costs.DEFAULT_COSTS['table'] + 40 * costs.COLUMN_COST
+        assert model.cost(self.blob) == 10
+        assert model.cost(resource("file", "resource")) == 10
+
+    def test_history(self):
+        history = [
+            {'resource': self.blob['resource'], 'resource_type': 'blob', 'outcome': 'processed', 'seconds': 0.5},
+            {'resource': "https://data.cityofnewyork.us/other", 'resource_type': 'blob', 'outcome': 'timeout',
+             'seconds': 60.5},
+            {'resource': "https://data.cityofnewyork.us/third", 'resource_type': 'blob', 'outcome': 'processed',
+             'seconds': 2.5},
+            {'resource': self.geospatial['resource'], 'resource_type': 'geospatial dataset',
+             'outcome': 'deferred', 'seconds': 0.01}
+        ]
+        model = costs.CostModel(history, timeout=60)
+
+        assert model.cost(self.blob) == 0.5
+        assert model.cost(resource("unseen", "blob")) == 2.5
+        # Deferred resources were never actually glossarized, so their timings say nothing.
+        assert model.cost(self.geospatial) == costs.DEFAULT_COSTS['geospatial dataset']
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        self.resources = [
+            resource("geospatial", "geospatial dataset"),
+            resource("wide table", "table", column_names=["a"] * 200, page_views=10),
+            resource("narrow table", "table", column_names=["a"] * 5, page_views=10),
+            resource("popular narrow table", "table", column_names=["a"] * 5, page_views=1000),
+            resource("blob", "blob")
+        ]
+
+    def names(self, scheduled):
+        return [r['name'] for r in scheduled]
+
+    def test_cheapest_first(self):
+        assert self.names(costs.schedule(self.resources)) == [
+            "popular narrow table", "narrow table", "wide table", "blob", "geospatial"]
+
+    def test_priority(self):
+        scheduled = costs.schedule(self.resources, priority=lambda r: r['resource_type'] == 'geospatial dataset')
+        assert self.names(scheduled)[0] == "geospatial"
+        assert self.names(scheduled)[1:] == ["popular narrow table", "narrow table", "wide table", "blob"]
+
+    def test_load_history(self):
+        os.mkdir("temp")
+        try:
+            assert costs.load_history("temp/glossary.metrics.json") == []
+            with open("temp/glossary.metrics.json", "w") as fp:
+                json.dump({'resources': [
+                    {'resource': 'a', 'resource_type': 'blob', 'outcome': 'processed', 'seconds': 1.0},
+                    {'resource': 'b', 'resource_type': 'blob', 'outcome': 'timeout', 'seconds': 60.0}
+                ]}, fp)
+            history = costs.load_history("temp/glossary.metrics.json")
+            assert costs.schedule([resource("blob", "blob"), dict(resource("a", "blob"), resource='a')],
+                                  history=history)[0]['resource'] == 'a'
+
+            # Work queue workers write summaries of their own, which are read too.
+            with open("temp/glossary.worker-1.metrics.json", "w") as fp:
+                json.dump({'resources': [
+                    {'resource': 'c', 'resource_type': 'blob', 'outcome': 'processed', 'seconds': 2.0}
+                ]}, fp)
+            history = costs.load_history("temp/glossary.metrics.json")
+            assert [record['resource'] for record in history] == ['a', 'b', 'c']
+        finally:
+            shutil.rmtree("temp")
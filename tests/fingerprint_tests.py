@@ -0,0 +1,69 @@
+"""
+Unit tests for content fingerprints.
+"""
+
+import sys; sys.path.append('../')
+import io
+import os
+import unittest
+import zipfile
+
+from urban_physiology_toolkit.glossarizers import fingerprint
+
+
+def zip_infos(members):
+    """Helper function. Builds a ZIP archive with the given {filename: bytes} members, returning its members."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for filename, data in members.items():
+            z.writestr(filename, data)
+        return z.infolist()
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_streaming(self):
+        data = os.urandom(3 * fingerprint.HEAD_SIZE + 17)
+        fingerprinter = fingerprint.Fingerprinter()
+        for start in range(0, len(data), 1000):
+            fingerprinter.update(data[start:start + 1000])
+
+        assert fingerprinter.fingerprint() == fingerprint.fingerprint_bytes(data)
+        assert fingerprinter.fingerprint()['length'] == len(data)
+
+    def test_head(self):
+        head = os.urandom(fingerprint.HEAD_SIZE)
+        first, second = fingerprint.fingerprint_bytes(head + b"first"), fingerprint.fingerprint_bytes(head + b"second")
+        assert first['head_sha256'] == second['head_sha256']
+        assert fingerprint.fingerprint_key(first) != fingerprint.fingerprint_key(second)
+
+    def test_members(self):
+        # Member names, order and compression don't matter, only contents do.
+        first = fingerprint.fingerprint_members(zip_infos({"a.csv": b"a,b\n1,2\n", "b.csv": b"c\n3\n"}))
+        second = fingerprint.fingerprint_members(zip_infos({"b.csv": b"c\n3\n", "a.csv": b"a,b\n1,2\n"}))
+        third = fingerprint.fingerprint_members(zip_infos({"a.csv": b"a,b\n1,2\n", "b.csv": b"c\n4\n"}))
+        assert fingerprint.fingerprint_key(first) == fingerprint.fingerprint_key(second)
+        assert fingerprint.fingerprint_key(first) != fingerprint.fingerprint_key(third)
+
+        renamed = fingerprint.fingerprint_members(zip_infos({"A.CSV": b"a,b\n1,2\n", "B.CSV": b"c\n3\n"}))
+        assert fingerprint.fingerprint_key(first) == fingerprint.fingerprint_key(renamed)
+
+    def test_member_contents(self):
+        # Archives fingerprinted from the members extracted from them match those fingerprinted from their central
+        # directory.
+        members = {"a.csv": b"a,b\n1,2\n", "b.csv": b"c\n3\n"}
+        assert fingerprint.fingerprint_member_contents(members.values()) == \
+            fingerprint.fingerprint_members(zip_infos(members))
+
+    def test_file(self):
+        members = {"a.csv": b"a,b\n1,2\n", "b.csv": b"c\n3\n"}
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as z:
+            for filename, data in members.items():
+                z.writestr(filename, data)
+        assert fingerprint.fingerprint_file(buffer) == fingerprint.fingerprint_members(zip_infos(members))
+
+        data = os.urandom(3 * fingerprint.HEAD_SIZE + 17)
+        assert fingerprint.fingerprint_file(io.BytesIO(data), chunk_size=1000) == fingerprint.fingerprint_bytes(data)
+
+    def test_no_fingerprint(self):
+        assert fingerprint.fingerprint_key(None) is None
@@ -7,6 +7,7 @@ import sys
 sys.path.append('../')
 
 import unittest
+import unittest.mock
 
 from urban_physiology_toolkit.glossarizers import html
 import requests_mock
@@ -52,3 +53,21 @@ class TestExtractLinks(unittest.TestCase):
 
             assert len(results) == 32
             assert all([r.split(".")[-1] == "pdf" for r in results])
+
+
+class TestGlossary(unittest.TestCase):
+    """Tests for the Qatari glossary routine."""
+    def test_timed_out_resource(self):
+        """
+        Timed-out resources lack a filesize, and are not sampled.
+        """
+        resource_list = [{'resource': "http://www.mdps.gov.qa/en/statistics1/Documents/census.xls", 'flags': []}]
+        timed_out = [dict(resource_list[0], dataset=".")]
+
+        with unittest.mock.patch.object(html, 'generic_glossarize_resource',
+                                        return_value=(resource_list[0], timed_out)), \
+                unittest.mock.patch.object(html.sampling, 'sample_glossary_entry') as sample:
+            _, glossary = html._get_qatari_ministry_of_planning_and_statistics_glossary(resource_list, [])
+
+        assert glossary == timed_out
+        assert not sample.called
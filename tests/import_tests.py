@@ -0,0 +1,33 @@
+"""
+Tests that heavy dependencies are only imported when they are first used, and not when the package is. Each test
+imports modules in a fresh interpreter, since this one has likely imported everything already.
+"""
+
+import sys; sys.path.append('../')
+import json
+import os
+import subprocess
+import unittest
+
+HEAVY_DEPENDENCIES = ['pandas', 'selenium', 'nbformat', 'magic', 'bs4', 'datafy']
+
+
+def loaded_after_import(module):
+    """Helper function. Returns the heavy dependencies loaded by importing the given module in a fresh interpreter."""
+    code = "import sys, json; import {0}; print(json.dumps([m for m in {1} if m in sys.modules]))".format(
+        module, HEAVY_DEPENDENCIES)
+    env = dict(os.environ, PYTHONPATH=os.pardir)
+    output = subprocess.check_output([sys.executable, "-c", code], env=env, universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_package(self):
+        assert loaded_after_import("urban_physiology_toolkit") == []
+
+    def test_workflow(self):
+        assert loaded_after_import("urban_physiology_toolkit.workflow") == []
+
+    def test_glossarizers(self):
+        for glossarizer in ['socrata', 'ckan', 'html']:
+            assert loaded_after_import("urban_physiology_toolkit.glossarizers." + glossarizer) == []
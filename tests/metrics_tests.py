@@ -0,0 +1,108 @@
+"""
+Unit tests for the glossarizer run metrics.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+import json
+import os
+import shutil
+
+from urban_physiology_toolkit.glossarizers import metrics
+
+
+class FakeClock:
+    """Helper class. A clock which only advances when told to."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram():
+    histogram = metrics.Histogram(buckets=(1, 10))
+    for value in [0.5, 0.5, 5, 50]:
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [(1, 2), (10, 3), (float('inf'), 4)]
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.99) == 50
+    assert histogram.summary()['buckets'] == {'1.0': 2, '10.0': 3, '+Inf': 4}
+
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.run = metrics.RunMetrics(glossarizer='socrata', domain='data.cityofnewyork.us', clock=self.clock)
+
+    def measure(self, flags, entries, seconds=1, new_flags=()):
+        resource = {'resource': 'https://data.cityofnewyork.us/api/views/abcd-0000', 'resource_type': 'table',
+                    'flags': list(flags)}
+        with self.run.measure(resource) as measurement:
+            resource['flags'] += list(new_flags)
+            measurement.entries = entries
+            self.clock.now += seconds
+        return self.run.resources[-1]['outcome']
+
+    def test_outcomes(self):
+        assert self.measure([], [{'filesize': 10}]) == 'processed'
+        assert self.measure([], [{'filesize': ">60s"}]) == 'timeout'
+        assert self.measure([], [], new_flags=['removed']) == 'removed'
+        assert self.measure([], [], new_flags=['deferred']) == 'deferred'
+        assert self.measure([], []) == 'skipped'
+
+        # Flags left over from a previous run do not count against this one.
+        assert self.measure(['error'], [{'filesize': 10}]) == 'processed'
+        assert self.measure(['error'], [], new_flags=['error']) == 'error'
+
+    def test_failure(self):
+        resource = {'resource': 'https://data.cityofnewyork.us/api/views/abcd-0000', 'flags': []}
+        with self.assertRaises(ValueError):
+            with self.run.measure(resource):
+                raise ValueError
+
+        assert self.run.outcomes['failed'] == 1
+
+    def test_summary(self):
+        self.measure([], [{'filesize': 10}], seconds=2)
+        self.run.record_bytes(1024)
+        self.run.record_pager_waits({'load': 0.2, 'condition': 3})
+
+        summary = self.run.summary()
+        assert summary['resources_per_second'] == 0.5
+        assert summary['bytes'] == 1024
+        assert summary['latency']['table']['count'] == 1
+        assert summary['latency']['table']['sum'] == 2
+        assert set(summary['pager_waits'].keys()) == {'load', 'condition'}
+
+    def test_prometheus(self):
+        self.measure([], [{'filesize': 10}], seconds=2)
+        text = self.run.to_prometheus()
+
+        labels = 'glossarizer="socrata",domain="data.cityofnewyork.us"'
+        assert 'upt_glossarizer_resources_total{{{0},outcome="processed"}} 1'.format(labels) in text
+        assert 'upt_glossarizer_resource_seconds_bucket{{{0},resource_type="table",le="2.5"}} 1'.format(labels) in text
+        assert 'upt_glossarizer_resource_seconds_bucket{{{0},resource_type="table",le="1.0"}} 0'.format(labels) in text
+
+
+class TestFinishRun(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        self.textfile = os.environ.pop(metrics.TEXTFILE_ENVIRONMENT_VARIABLE, None)
+
+    def test_finish_run(self):
+        os.environ[metrics.TEXTFILE_ENVIRONMENT_VARIABLE] = "temp/upt.prom"
+        metrics.start_run('html', 'example.com')
+        metrics.finish_run("temp/glossary.json")
+
+        with open("temp/glossary.metrics.json", "r") as fp:
+            summary = json.load(fp)
+        assert summary['glossarizer'] == 'html'
+        assert os.path.isfile("temp/upt.prom")
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+        os.environ.pop(metrics.TEXTFILE_ENVIRONMENT_VARIABLE, None)
+        if self.textfile is not None:
+            os.environ[metrics.TEXTFILE_ENVIRONMENT_VARIABLE] = self.textfile
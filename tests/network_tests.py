@@ -0,0 +1,220 @@
+"""
+Unit tests for the network utilities shared by the glossarizers.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+
+import pytest
+import requests
+import requests_mock
+
+from remote_zip_tests import make_zip
+from urban_physiology_toolkit.glossarizers import metrics, network, utils
+
+
+class FakeClock:
+    """Helper class. A clock which only advances when slept on."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestHostRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = network.HostRateLimiter(rate=2, burst=2, min_rate=0.5, max_rate=4, backoff=0.5,
+                                               recovery=1, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_then_rate(self):
+        for _ in range(2):
+            self.limiter.acquire("https://data.cityofnewyork.us/api/views/foo")
+        assert self.clock.now == 0
+
+        self.limiter.acquire("https://data.cityofnewyork.us/api/views/bar")
+        assert self.clock.now == 0.5
+
+    def test_hosts_are_independent(self):
+        for _ in range(2):
+            self.limiter.acquire("https://data.cityofnewyork.us/")
+        self.limiter.acquire("https://data.gov.sg/")
+        assert self.clock.now == 0
+
+    def test_backoff_and_recovery(self):
+        uri = "https://data.cityofnewyork.us/"
+
+        self.limiter.feedback(uri, 429)
+        assert self.limiter.rate_for(uri) == 1
+        self.limiter.feedback(uri, 503)
+        self.limiter.feedback(uri, 503)
+        assert self.limiter.rate_for(uri) == 0.5
+
+        for _ in range(10):
+            self.limiter.feedback(uri, 200)
+        assert self.limiter.rate_for(uri) == 4
+
+    def test_retry_after(self):
+        uri = "https://data.cityofnewyork.us/"
+        self.limiter.feedback(uri, 429, retry_after="30")
+        self.limiter.acquire(uri)
+        assert self.clock.now == 30
+
+
+def test_parse_retry_after():
+    assert network.parse_retry_after("120") == 120
+    assert network.parse_retry_after(None) is None
+    assert network.parse_retry_after("garbage") is None
+    assert network.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = network.CircuitBreaker(threshold=2, cooldown=60, clock=self.clock)
+        self.uri = "https://data.cityofnewyork.us/"
+
+    def test_open_and_half_open(self):
+        self.breaker.record_failure(self.uri)
+        assert self.breaker.allow(self.uri)
+        self.breaker.record_failure(self.uri)
+        assert self.breaker.is_open(self.uri)
+        assert not self.breaker.allow(self.uri)
+        assert self.breaker.allow("https://data.gov.sg/")
+
+        # After the cooldown, exactly one trial request is let through.
+        self.clock.sleep(60)
+        assert self.breaker.allow(self.uri)
+        assert not self.breaker.allow(self.uri)
+
+        self.breaker.record_success(self.uri)
+        assert self.breaker.allow(self.uri)
+        assert not self.breaker.is_open(self.uri)
+
+
+class TestWithRetries(unittest.TestCase):
+    def setUp(self):
+        self.default_breaker = network.breaker
+        network.breaker = network.CircuitBreaker(threshold=3, cooldown=60)
+        self.uri = "https://data.cityofnewyork.us/"
+        self.sleeps = []
+
+    def flaky(self, failures, err=requests.exceptions.ConnectionError):
+        """Helper function. Returns a function which fails `failures` times before succeeding."""
+        calls = []
+
+        def func():
+            calls.append(None)
+            if len(calls) <= failures:
+                raise err()
+            return "ok"
+
+        return func
+
+    def test_transient_failure_is_retried(self):
+        assert network.with_retries(self.flaky(2), self.uri, attempts=3, sleep=self.sleeps.append) == "ok"
+        assert len(self.sleeps) == 2
+        assert self.sleeps[0] <= 1 and self.sleeps[1] <= 2
+
+    def test_permanent_failure_is_not_retried(self):
+        with pytest.raises(ValueError):
+            network.with_retries(self.flaky(1, err=ValueError), self.uri, sleep=self.sleeps.append)
+        assert len(self.sleeps) == 0
+
+    def test_circuit_opens(self):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            network.with_retries(self.flaky(5), self.uri, attempts=3, sleep=self.sleeps.append)
+        with pytest.raises(network.CircuitOpenException):
+            network.with_retries(self.flaky(0), self.uri, sleep=self.sleeps.append)
+
+    def test_throttling_does_not_open_circuit(self):
+        # A host which is throttling us is up, and is left to the rate limiter.
+        response = requests.Response()
+        response.status_code = 429
+        throttled = requests.exceptions.HTTPError(response=response)
+        for _ in range(3):
+            with pytest.raises(requests.exceptions.HTTPError):
+                network.with_retries(self.flaky(5, err=lambda: throttled), self.uri, attempts=2,
+                                     sleep=self.sleeps.append)
+        assert not network.breaker.is_open(self.uri)
+
+    def test_timeout_bounds_retries(self):
+        clock = FakeClock()
+        timeouts = []
+
+        def func(remaining):
+            timeouts.append(remaining)
+            clock.sleep(remaining)
+            raise requests.exceptions.Timeout()
+
+        # Each attempt gets only the time left over by the attempts before it, so the first uses up the lot.
+        with pytest.raises(requests.exceptions.Timeout):
+            network.with_retries(func, self.uri, attempts=3, sleep=clock.sleep, timeout=10, clock=clock)
+        assert timeouts == [10]
+        assert clock.now == 10
+
+        timeouts.clear()
+        clock.now = 0
+        network.breaker.reset()
+
+        def fast_failure(remaining):
+            timeouts.append(remaining)
+            clock.sleep(2)
+            raise requests.exceptions.ConnectionError()
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            network.with_retries(fast_failure, self.uri, attempts=3, sleep=clock.sleep, timeout=10, clock=clock)
+        assert timeouts[0] == 10 and all(t < 10 for t in timeouts[1:]) and len(timeouts) > 1
+        assert clock.now <= 10
+
+    def test_available_first(self):
+        down = {'resource': self.uri + "foo"}
+        up = {'resource': "https://data.gov.sg/foo"}
+        for _ in range(3):
+            network.breaker.record_failure(self.uri)
+        assert list(network.available_first([down, up])) == [up, down]
+
+    def tearDown(self):
+        network.breaker = self.default_breaker
+
+
+class TestSizingFeedback(unittest.TestCase):
+    def setUp(self):
+        self.default_limiter = network.limiter
+        self.clock = FakeClock()
+        network.limiter = network.HostRateLimiter(rate=2, burst=2, clock=self.clock, sleep=self.clock.sleep)
+        network.breaker.reset()
+        self.uri = "https://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv"
+
+    def test_throttled_download(self):
+        # Throttling responses to the sizing download slow the host down, as they do everywhere else.
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, status_code=429, headers={'Retry-After': "30"}, content=b"Slow down.")
+            mock.head(self.uri, headers={'content-length': "10"})
+            with pytest.raises(requests.exceptions.HTTPError):
+                utils.get_sizings(self.uri, timeout=10)
+
+        assert network.limiter.rate_for(self.uri) == 1
+        network.limiter.acquire(self.uri)
+        assert self.clock.now >= 30
+
+    def test_archive_download(self):
+        # An archive is downloaded once, however many members datafy extracts from it.
+        uri = "http://www.nyc.gov/html/dep/downloads/xls/sampling.xls"
+        archive = make_zip({"sampling/{0}.csv".format(i): b"site,value\n" * 1000 for i in range(5)})
+        metrics.current = metrics.RunMetrics()
+        with requests_mock.Mocker(real_http=True) as mock:
+            mock.get(uri, content=archive, headers={'Content-Type': "application/zip"})
+            sizings = utils.get_sizings(uri, timeout=10)
+
+        assert len(sizings) == 5
+        assert network.limiter.rate_for(uri) == pytest.approx(2 + network.limiter.recovery)
+        assert metrics.current.bytes == len(archive)
+
+    def tearDown(self):
+        network.limiter = self.default_limiter
+        metrics.current = metrics.RunMetrics()
@@ -0,0 +1,53 @@
+"""
+Unit tests for the opt-in pipeline stage profiling.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+import os
+import shutil
+
+from urban_physiology_toolkit import profiling
+
+
+class TestStages(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        self.environment_profile_dir = os.environ.pop(profiling.PROFILE_DIR_ENVIRONMENT_VARIABLE, None)
+
+    def test_disabled(self):
+        with profiling.stage("glossary"):
+            pass
+
+        assert os.listdir("temp") == []
+
+    def test_nested_stages(self):
+        profiling.enable("temp")
+
+        with profiling.stage("glossary"):
+            for _ in range(3):
+                with profiling.stage("sizing"):
+                    [str(i) for i in range(1000)]
+
+        runs = os.listdir("temp")
+        assert len(runs) == 1 and runs[0].endswith("-glossary")
+        assert set(os.listdir("temp/" + runs[0])) == {'glossary.prof', 'glossary.txt', 'sizing.prof', 'sizing.txt'}
+
+        with open("temp/{0}/sizing.txt".format(runs[0]), "r") as fp:
+            assert "Runs: 3" in fp.read()
+
+    def test_profiled(self):
+        profiling.enable("temp")
+
+        @profiling.profiled("init-catalog")
+        def init_catalog():
+            return 42
+
+        assert init_catalog() == 42
+        assert len(os.listdir("temp")) == 1
+
+    def tearDown(self):
+        profiling.disable()
+        shutil.rmtree("temp")
+        if self.environment_profile_dir is not None:
+            os.environ[profiling.PROFILE_DIR_ENVIRONMENT_VARIABLE] = self.environment_profile_dir
@@ -0,0 +1,127 @@
+"""
+Unit tests for remote ZIP archive inspection. These tests run against archives served up by a mock server, and are not
+network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import io
+import os
+import re
+import unittest
+import zipfile
+
+import pytest
+import requests_mock
+
+from urban_physiology_toolkit.glossarizers import fingerprint, network, remote_zip, utils
+
+
+def make_zip(members):
+    """Helper function. Builds a ZIP archive with the given {filename: bytes} members, returning it as bytes."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for filename, data in members.items():
+            z.writestr(filename, data)
+    return buffer.getvalue()
+
+
+def serve_ranges(archive):
+    """Helper function. Returns a requests_mock callback which serves up `Range` requests against the archive."""
+    def callback(request, context):
+        match = re.match(r"bytes=(\d*)-(\d*)", request.headers['Range'])
+        start, end = match.groups()
+        if not start:
+            start, end = max(len(archive) - int(end), 0), len(archive) - 1
+        else:
+            start, end = int(start), min(int(end), len(archive) - 1) if end else len(archive) - 1
+
+        context.status_code = 206
+        context.headers['Content-Range'] = "bytes {0}-{1}/{2}".format(start, end, len(archive))
+        return archive[start:end + 1]
+    return callback
+
+
+class TestLooksLikeZip(unittest.TestCase):
+    def test_looks_like_zip(self):
+        assert remote_zip.looks_like_zip("http://www.nyc.gov/html/dcp/download/bytes/nyc_pluto_16v2.zip")
+        assert remote_zip.looks_like_zip("https://data.cityofnewyork.us/api/views/q68s-8qxv/files/511dbe78-65f3"
+                                         "?filename=AnnAvg1_7_300mSurfaces.zip")
+        assert remote_zip.looks_like_zip("https://data.cityofnewyork.us/api/geospatial/tqmj-j8zm"
+                                         "?method=export&format=Shapefile&mimetype=application%2Fzip")
+        assert not remote_zip.looks_like_zip("http://www.nyc.gov/html/dep/downloads/xls/sampling.xls")
+        assert not remote_zip.looks_like_zip("https://data.zipcodes.gov/sampling.csv")
+
+
+class TestRemoteZip(unittest.TestCase):
+    def setUp(self):
+        self.uri = "http://www.nyc.gov/html/dcp/download/bytes/nyc_pluto_16v2.zip"
+
+        # A large incompressible member, so that reading the whole archive would be noticeable.
+        self.archive = make_zip({
+            "pluto/README.txt": b"Primary Land Use Tax Lot Output.",
+            "pluto/MN.csv": b"borough,block,lot\n" * 1000,
+            "pluto/MN.shp": os.urandom(2 ** 20),
+            "pluto/LICENSE": b"Public domain."
+        })
+
+        network.breaker.reset()
+
+    def test_size_up(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=serve_ranges(self.archive))
+            sizings = remote_zip.size_up_remote_zip(self.uri)
+
+        assert [sizing['dataset'] for sizing in sizings] == ["pluto/README.txt", "pluto/MN.csv", "pluto/MN.shp",
+                                                             "pluto/LICENSE"]
+        assert sizings[1]['filesize'] == len(b"borough,block,lot\n" * 1000) / 1024
+        assert sizings[1]['compressed_filesize'] < sizings[1]['filesize']
+        assert sizings[1]['mimetype'] == 'text/csv'
+        assert sizings[1]['extension'] == 'csv'
+        assert sizings[3]['mimetype'] == 'application/octet-stream'
+        assert sizings[3]['extension'] is None
+        assert sizings[0]['fingerprint'] == sizings[3]['fingerprint']
+
+    def test_reads_only_the_end(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=serve_ranges(self.archive))
+            with remote_zip.RemoteFile(self.uri) as remote_file:
+                with zipfile.ZipFile(remote_file) as z:
+                    assert len(z.infolist()) == 4
+
+        assert remote_file.bytes_fetched <= remote_zip.TAIL_SIZE
+        assert mock.call_count == 1
+
+    def test_range_not_supported(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=self.archive)
+            with pytest.raises(remote_zip.RangeNotSupportedException):
+                remote_zip.size_up_remote_zip(self.uri)
+
+    def test_not_a_zip(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=serve_ranges(b"<html>Not found.</html>"))
+            with pytest.raises(zipfile.BadZipFile):
+                remote_zip.size_up_remote_zip(self.uri)
+
+    def test_get_sizings(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=serve_ranges(self.archive))
+            sizings = utils.get_sizings(self.uri, timeout=10)
+
+        assert len(sizings) == 4
+        assert sizings[0]['dataset'] == "pluto/README.txt"
+
+    def test_fingerprint_is_path_independent(self):
+        # The archive has the same fingerprint however it is sized up: from its central directory, by downloading it
+        # (through datafy, which extracts it) when the server ignores Range requests, or once it has been deposited.
+        mirror = "http://www.nyc.gov/html/dcp/download/bytes/mirror/nyc_pluto_16v2.zip"
+        with requests_mock.Mocker(real_http=True) as mock:
+            mock.get(self.uri, content=serve_ranges(self.archive))
+            mock.get(mirror, content=self.archive, headers={'Content-Type': "application/zip"})
+            remote_sizings = utils.get_sizings(self.uri, timeout=10)
+            downloaded_sizings = utils.get_sizings(mirror, timeout=10)
+
+        deposited_fingerprint = fingerprint.fingerprint_file(io.BytesIO(self.archive))
+        assert 'members_sha256' in deposited_fingerprint
+        assert {sizing['fingerprint']['members_sha256'] for sizing in remote_sizings + downloaded_sizings} == \
+            {deposited_fingerprint['members_sha256']}
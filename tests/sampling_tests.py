@@ -0,0 +1,114 @@
+"""
+Unit tests for row and column estimation from sampled prefixes. These tests run against a mock server, and are not
+network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+
+import requests_mock
+
+from urban_physiology_toolkit.glossarizers import network, sampling
+
+
+def make_csv(rows):
+    """Helper function. Builds a CSV file of the given number of rows, returning it as bytes."""
+    lines = ["id,borough,value"] + ["{0:05d},Manhattan,{1:.4f}".format(i, i % 7) for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class TestDelimiterFor(unittest.TestCase):
+    def test_delimiter_for(self):
+        assert sampling.delimiter_for({'preferred_format': 'csv'}) == ","
+        assert sampling.delimiter_for({'preferred_format': 'TSV'}) == "\t"
+        assert sampling.delimiter_for({'preferred_mimetype': 'text/csv; charset=utf-8'}) == ","
+        assert sampling.delimiter_for({'preferred_format': 'xls'}) is None
+        assert sampling.delimiter_for({}) is None
+
+
+class TestEstimateShape(unittest.TestCase):
+    def test_complete(self):
+        shape = sampling.estimate_shape(make_csv(10), complete=True)
+        assert shape['rows'] == 10
+        assert shape['columns'] == 3
+        assert shape['column_names'] == ["id", "borough", "value"]
+        assert shape['rows_confidence'] == "exact"
+        assert shape['preview'][0] == ["00000", "Manhattan", "0.0000"]
+        assert len(shape['preview']) == sampling.PREVIEW_ROWS
+
+    def test_estimated(self):
+        data = make_csv(10000)
+        shape = sampling.estimate_shape(data[:16 * 1024], total_size=len(data))
+        assert abs(shape['rows'] - 10000) / 10000 < 0.05
+        assert shape['columns'] == 3
+        assert shape['rows_confidence'] == "high"
+
+    def test_few_rows(self):
+        data = make_csv(10000)
+        shape = sampling.estimate_shape(data[:300], total_size=len(data))
+        assert shape['rows_confidence'] == "low"
+
+    def test_unknown_size(self):
+        data = make_csv(10000)
+        shape = sampling.estimate_shape(data[:16 * 1024])
+        assert shape['rows'] is None
+        assert shape['columns'] == 3
+
+    def test_cut_off_row(self):
+        # The last row in the prefix is cut off and should not be previewed.
+        shape = sampling.estimate_shape(b"id,borough,value\n0,Manhattan,0.0\n1,Manh", total_size=10 ** 6)
+        assert shape['preview'] == [["0", "Manhattan", "0.0"]]
+
+    def test_tsv(self):
+        shape = sampling.estimate_shape(b"id\tborough\n0\tBronx\n", complete=True, delimiter="\t")
+        assert shape['columns'] == 2
+        assert shape['rows'] == 1
+
+
+class TestSampleGlossaryEntry(unittest.TestCase):
+    def setUp(self):
+        self.uri = "https://storage.data.gov.sg/example/example.csv"
+        self.data = make_csv(10000)
+        network.breaker.reset()
+
+    def test_range(self):
+        def callback(request, context):
+            assert request.headers['Range'] == "bytes=0-{0}".format(sampling.SAMPLE_SIZE - 1)
+            context.status_code = 206
+            context.headers['Content-Range'] = "bytes 0-{0}/{1}".format(sampling.SAMPLE_SIZE - 1, len(self.data))
+            return self.data[:sampling.SAMPLE_SIZE]
+
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=callback)
+            entry = sampling.sample_glossary_entry({'resource': self.uri, 'preferred_format': 'csv', 'dataset': '.'})
+
+        assert abs(entry['rows'] - 10000) / 10000 < 0.05
+        assert entry['columns'] == 3
+
+    def test_range_not_supported(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=self.data, headers={'Content-Length': str(len(self.data))})
+            entry = sampling.sample_glossary_entry({'resource': self.uri, 'preferred_format': 'csv', 'dataset': '.'})
+
+        assert abs(entry['rows'] - 10000) / 10000 < 0.05
+
+    def test_small_file(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=make_csv(20))
+            entry = sampling.sample_glossary_entry({'resource': self.uri, 'preferred_format': 'csv', 'dataset': '.'})
+
+        assert entry['rows'] == 20
+        assert entry['rows_confidence'] == "exact"
+
+    def test_not_delimited(self):
+        entry = {'resource': self.uri, 'preferred_format': 'xls', 'dataset': '.'}
+        assert sampling.sample_glossary_entry(dict(entry)) == entry
+
+    def test_failure(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, status_code=404)
+            with self.assertWarns(UserWarning):
+                entry = sampling.sample_glossary_entry({'resource': self.uri, 'preferred_format': 'csv',
+                                                        'dataset': '.'})
+
+        assert 'rows' not in entry
@@ -0,0 +1,68 @@
+"""
+Unit tests for the multi-portal scheduler.
+"""
+
+import json
+import os
+import shutil
+import sys; sys.path.append('../')
+import unittest
+
+import pytest
+
+from urban_physiology_toolkit.glossarizers import scheduler
+
+
+class TestReadManifest(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+
+    def write_manifest(self, manifest):
+        with open("temp/manifest.json", "w") as fp:
+            json.dump(manifest, fp)
+        return "temp/manifest.json"
+
+    def test_valid_manifest(self):
+        manifest = [{'domain': 'data.gov.sg', 'glossarizer': 'ckan', 'resource_filename': 'temp/sg-resources.json',
+                     'glossary_filename': 'temp/sg-glossary.json'}]
+        assert scheduler.read_manifest(self.write_manifest(manifest)) == manifest
+
+    def test_shared_output_file(self):
+        manifest = [{'domain': 'data.gov.sg', 'glossarizer': 'ckan', 'resource_filename': 'temp/resources.json',
+                     'glossary_filename': 'temp/sg-glossary.json'},
+                    {'domain': 'catalog.data.ug', 'glossarizer': 'ckan', 'resource_filename': 'temp/resources.json',
+                     'glossary_filename': 'temp/ug-glossary.json'}]
+        with pytest.raises(ValueError):
+            scheduler.read_manifest(self.write_manifest(manifest))
+
+    def test_socrata_without_credentials(self):
+        manifest = [{'domain': 'data.cityofnewyork.us', 'glossarizer': 'socrata',
+                     'resource_filename': 'temp/nyc-resources.json', 'glossary_filename': 'temp/nyc-glossary.json'}]
+        with pytest.raises(ValueError):
+            scheduler.read_manifest(self.write_manifest(manifest))
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+
+class TestRunManifest(unittest.TestCase):
+    """
+    Tests that a failing portal is isolated and reported on, without stopping the run.
+    """
+    def setUp(self):
+        os.mkdir("temp")
+
+    def test_failure_report(self):
+        manifest = [{'domain': 'example.com', 'glossarizer': 'html', 'resource_filename': 'temp/resources.json',
+                     'glossary_filename': 'temp/glossary.json'}]
+        report = scheduler.run_manifest(manifest, workers=1, report_filename="temp/report.json")
+
+        assert report[0]['status'] == 'failed'
+        assert report[0]['stage'] == 'resource list'
+        assert 'NotImplementedError' in report[0]['error']
+
+        with open("temp/report.json", "r") as fp:
+            assert json.load(fp) == report
+
+    def tearDown(self):
+        shutil.rmtree("temp")
@@ -0,0 +1,152 @@
+"""
+Unit tests for the persistent sizing cache. Revalidation requests are made against a mock server, so these tests are not
+network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import json
+import os
+import shutil
+import unittest
+
+import requests_mock
+
+from remote_zip_tests import make_zip, serve_ranges
+from urban_physiology_toolkit.glossarizers import metrics, network, sizing_cache, utils
+
+URI = "http://www.nyc.gov/html/dep/downloads/xls/sampling.xls"
+SIZINGS = [{'filesize': 12.5, 'dataset': '.', 'mimetype': 'application/vnd.ms-excel', 'extension': 'xls',
+            'fingerprint': {'sha256': '0' * 64, 'length': 12800, 'head_sha256': '0' * 64}}]
+VALIDATORS = {'ETag': '"abc"', 'Last-Modified': 'Tue, 01 Aug 2017 00:00:00 GMT', 'Content-Length': '12800'}
+
+
+class FakeClock:
+    """Helper class. A clock which only advances when told to."""
+    def __init__(self):
+        self.now = 1500000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_validators_of():
+    assert sizing_cache.validators_of(dict(VALIDATORS, Server='nginx')) == VALIDATORS
+    assert sizing_cache.validators_of({'Last-Modified': VALIDATORS['Last-Modified']}) == {
+        'Last-Modified': VALIDATORS['Last-Modified']}
+    assert sizing_cache.validators_of({'Content-Length': '12800'}) is None
+
+
+class TestSizingCache(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        self.clock = FakeClock()
+        self.cache = sizing_cache.SizingCache("temp/sizings", max_age=3600, clock=self.clock)
+
+    def test_get_and_put(self):
+        assert self.cache.get(URI, VALIDATORS) is None
+
+        self.cache.put(URI, VALIDATORS, SIZINGS)
+        assert self.cache.get(URI, VALIDATORS) == SIZINGS
+        assert self.cache.get(URI, dict(VALIDATORS, ETag='"def"')) is None
+        assert self.cache.get(URI, None) is None
+        assert self.cache.get(URI + "?v=2", VALIDATORS) is None
+
+    def test_old_format(self):
+        # Entries written before fingerprints were computed the way they are now are not reused.
+        self.cache.put(URI, VALIDATORS, SIZINGS)
+        with open(self.cache._path(URI), "r") as fp:
+            entry = json.load(fp)
+        del entry['format']
+        with open(self.cache._path(URI), "w") as fp:
+            json.dump(entry, fp)
+        assert self.cache.get(URI, VALIDATORS) is None
+
+    def test_no_validators(self):
+        self.cache.put(URI, None, SIZINGS)
+        assert not os.path.exists("temp/sizings")
+
+    def test_expiry(self):
+        self.cache.put(URI, VALIDATORS, SIZINGS)
+        self.clock.now += 3601
+        assert self.cache.get(URI, VALIDATORS) is None
+
+        self.cache.evict()
+        assert os.listdir("temp/sizings") == []
+
+    def test_eviction_by_size(self):
+        for i in range(5):
+            self.cache.put("{0}?v={1}".format(URI, i), VALIDATORS, SIZINGS)
+            self.clock.now += 1
+        entry_size = os.path.getsize(os.path.join("temp/sizings", os.listdir("temp/sizings")[0]))
+
+        self.cache.max_size = entry_size * 2
+        self.cache.evict()
+        assert len(os.listdir("temp/sizings")) == 2
+        assert self.cache.get("{0}?v=4".format(URI), VALIDATORS) == SIZINGS
+        assert self.cache.get("{0}?v=0".format(URI), VALIDATORS) is None
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+
+class TestCachedSizings(unittest.TestCase):
+    def setUp(self):
+        sizing_cache.enable("temp")
+        metrics.current = metrics.RunMetrics()
+        network.breaker.reset()
+        self.calls = []
+
+    def size_up(self, uri):
+        self.calls.append(uri)
+        return SIZINGS
+
+    def test_disabled(self):
+        sizing_cache.disable()
+        with requests_mock.Mocker() as mock:
+            assert sizing_cache.cached_sizings(URI, self.size_up, timeout=10) == SIZINGS
+            assert sizing_cache.cached_sizings(URI, self.size_up, timeout=10) == SIZINGS
+            assert mock.call_count == 0
+        assert len(self.calls) == 2
+
+    def test_revalidation(self):
+        with requests_mock.Mocker() as mock:
+            mock.head(URI, headers=VALIDATORS)
+            assert sizing_cache.cached_sizings(URI, self.size_up, timeout=10) == SIZINGS
+            assert sizing_cache.cached_sizings(URI, self.size_up, timeout=10) == SIZINGS
+            assert len(self.calls) == 1
+
+            # The resource changes.
+            mock.head(URI, headers=dict(VALIDATORS, ETag='"def"'))
+            assert sizing_cache.cached_sizings(URI, self.size_up, timeout=10) == SIZINGS
+            assert len(self.calls) == 2
+
+        assert metrics.current.sizing_cache == {'hit': 1, 'miss': 2, 'uncacheable': 0}
+
+    def test_uncacheable(self):
+        with requests_mock.Mocker() as mock:
+            mock.head(URI, status_code=405)
+            sizing_cache.cached_sizings(URI, self.size_up, timeout=10)
+            sizing_cache.cached_sizings(URI, self.size_up, timeout=10)
+
+        assert len(self.calls) == 2
+        assert metrics.current.sizing_cache['uncacheable'] == 2
+
+    def test_get_sizings(self):
+        uri = "http://www.nyc.gov/html/dcp/download/bytes/nyc_pluto_16v2.zip"
+        archive = make_zip({"pluto/MN.csv": b"borough,block,lot\n" * 1000})
+        with requests_mock.Mocker() as mock:
+            mock.head(uri, headers={'ETag': '"abc"'})
+            mock.get(uri, content=serve_ranges(archive))
+            first = utils.get_sizings(uri, timeout=10)
+            requests_made = mock.call_count
+
+            second = utils.get_sizings(uri, timeout=10)
+            assert mock.call_count == requests_made + 1
+            assert mock.last_request.method == 'HEAD'
+
+        assert first == second
+
+    def tearDown(self):
+        sizing_cache.disable()
+        metrics.current = metrics.RunMetrics()
+        shutil.rmtree("temp", ignore_errors=True)
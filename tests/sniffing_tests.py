@@ -0,0 +1,93 @@
+"""
+Unit tests for early HTML landing page detection. These tests run against a mock server, and are not
+network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+
+import pytest
+import requests
+import requests_mock
+
+from urban_physiology_toolkit.glossarizers import ckan, network, sniffing, utils
+
+LANDING_PAGE = b"<!DOCTYPE html>\n<html><head><title>Register</title></head><body>" + b"<p>Sign up.</p>" * 10000 + \
+               b"</body></html>"
+
+
+class TestNeedsSniffing(unittest.TestCase):
+    def test_needs_sniffing(self):
+        assert sniffing.needs_sniffing("http://datamine.mta.info/user/register")
+        assert sniffing.needs_sniffing("http://ddcftp.nyc.gov/rfpweb/rfp_rss.aspx?q=open")
+        assert sniffing.needs_sniffing("http://www.nyc.gov/html/dot/html/about/datafeeds.html")
+        assert not sniffing.needs_sniffing("http://www.nyc.gov/html/dep/downloads/xls/sampling.xls")
+        assert not sniffing.needs_sniffing("https://data.cityofnewyork.us/api/views/q68s-8qxv/files/511dbe78"
+                                           "?filename=AnnAvg1_7_300mSurfaces.zip")
+
+        # Socrata geospatial exports name their format in the query string instead.
+        assert not sniffing.needs_sniffing("https://data.cityofnewyork.us/api/geospatial/tqmj-j8zm"
+                                           "?method=export&format=GeoJSON")
+        assert not sniffing.needs_sniffing("https://data.cityofnewyork.us/api/geospatial/tqmj-j8zm"
+                                           "?method=export&format=Shapefile")
+        assert not sniffing.needs_sniffing("https://data.cityofnewyork.us/api/views/kku6-nxdu/rows?format=csv")
+        assert sniffing.needs_sniffing("https://data.cityofnewyork.us/d/kku6-nxdu?format=html")
+
+
+class TestIsHTML(unittest.TestCase):
+    def test_is_html(self):
+        assert sniffing.is_html(LANDING_PAGE[:sniffing.SNIFF_SIZE])
+        assert sniffing.is_html(b"<div>Sign up.</div>", "text/html; charset=utf-8")
+        assert not sniffing.is_html(b"id,borough\n0,Bronx\n", "text/csv")
+        assert not sniffing.is_html(b"id,borough\n0,Bronx\n", "text/html")
+        assert not sniffing.is_html(b"")
+
+
+class TestSniffHTML(unittest.TestCase):
+    def setUp(self):
+        self.uri = "http://datamine.mta.info/user/register"
+        network.breaker.reset()
+
+    def test_landing_page(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=LANDING_PAGE, headers={'Content-Type': "text/html"})
+            assert sniffing.sniff_html(self.uri)
+
+    def test_data(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=b"id,borough\n0,Bronx\n", headers={'Content-Type': "text/csv"})
+            assert not sniffing.sniff_html(self.uri)
+
+    def test_failure(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, status_code=404)
+            with pytest.raises(requests.exceptions.HTTPError):
+                sniffing.sniff_html(self.uri)
+
+    def test_get_sizings(self):
+        # The page is only read as far as its first few kilobytes, and datafy is never called on it.
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=LANDING_PAGE, headers={'Content-Type': "text/html"})
+            sizings = utils.get_sizings(self.uri, timeout=10)
+
+        assert mock.call_count == 1
+        assert sizings[0]['mimetype'] == 'text/html'
+
+    def test_generic_glossarize_resource(self):
+        resource = {'resource': self.uri, 'flags': []}
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=LANDING_PAGE, headers={'Content-Type': "text/html"})
+            resource, glossarized_resource = utils.generic_glossarize_resource(resource, timeout=10)
+
+        assert glossarized_resource == []
+
+    def test_ckan_glossary(self):
+        # CKAN leaves landing pages out of the glossary, as they have no filesize to filter the catalog by.
+        resource = {'resource': self.uri, 'name': "Register", 'flags': []}
+        with requests_mock.Mocker() as mock:
+            mock.head(self.uri, headers={'Content-Type': "text/html"})
+            mock.get(self.uri, content=LANDING_PAGE, headers={'Content-Type': "text/html"})
+            resource_list, glossary = ckan.get_glossary([resource], [], timeout=10)
+
+        assert glossary == []
+        assert resource_list[0]['flags'] == ['processed']
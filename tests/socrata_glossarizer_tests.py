@@ -6,6 +6,9 @@ import json
 import sys; sys.path.append('../')
 import unittest
 
+import pandas as pd
+import requests_mock
+
 from urban_physiology_toolkit.glossarizers import socrata
 
 
@@ -37,6 +40,36 @@ def test_get_portal_metadata():
                                            'columns_description'}
 
 
+def test_stream_portal_metadata():
+    """
+    Test that the streaming catalog fetcher pages through the entire catalog, drops stories, community datasets, and
+    the duplicates the catalog API returns when it wraps around, and yields everything else. This test uses a mocked
+    catalog API and is not network-dependent.
+    """
+    with open("data/example_metadata-f4rp-2kvy.json", "r") as fp:
+        template = json.load(fp)
+
+    def metadata(i, type='dataset', provenance='official'):
+        entry = json.loads(json.dumps(template))
+        entry['resource'].update({'id': 'abcd-{0:04d}'.format(i), 'type': type, 'provenance': provenance})
+        return entry
+
+    catalog = [metadata(i) for i in range(7)] + [metadata(7, type='story'), metadata(8, provenance='community')]
+    catalog.append(catalog[0])  # wrap-around
+
+    def page(request, context):
+        offset, limit = int(request.qs['offset'][0]), int(request.qs['limit'][0])
+        return {'resultSetSize': len(catalog), 'results': catalog[offset:offset + limit]}
+
+    with requests_mock.Mocker() as mock:
+        mock.get(socrata.CATALOG_API_ENDPOINT, json=page)
+        results = list(socrata._stream_portal_metadata("data.cityofnewyork.us", "data/example_credentials.json",
+                                                       page_size=3, workers=2))
+
+    assert mock.call_count == 4
+    assert sorted(r['resource']['id'] for r in results) == ['abcd-{0:04d}'.format(i) for i in range(7)]
+
+
 def test_resourcify():
     """
     The resourcify method transforms the metadata we get by processing what we get from querying Socrata (above)
@@ -51,6 +84,23 @@ def test_resourcify():
                                'landing_page', 'resource_type'}
 
 
+def test_resourcify_batch():
+    """
+    The batch resourcify method should agree with the single-record one, and hold back blobs and links (which need
+    paging for their download links) unresolved.
+    """
+    records = []
+    for endpoint in ["f4rp-2kvy", "ghq4-ydq4", "q68s-8qxv"]:
+        with open("data/example_metadata-{0}.json".format(endpoint), "r") as fp:
+            records.append(json.load(fp))
+
+    resolved, unresolved = socrata._resourcify_batch(records, "data.cityofnewyork.us")
+    assert [resource['resource_type'] for resource in resolved] == ['table', 'geospatial dataset']
+    assert resolved[0] == socrata._resourcify(records[0], domain="data.cityofnewyork.us")
+    assert len(unresolved) == 1 and unresolved[0]['resource'] is None
+    assert unresolved[0]['created'] == str(pd.Timestamp(records[2]['resource']['createdAt']))
+
+
 class TestGlossarize(unittest.TestCase):
     """
     Tests that the methods for turning resource entries into glossary entries (`_glossarize_table` and
@@ -0,0 +1,197 @@
+"""
+Unit tests for the browser-free Socrata pager, which reads sizing information and download links out of the state
+embedded in Socrata landing pages. These tests run against saved landing pages and are not network-dependent. The
+wait conditions of the Selenium pager are tested here too, against a fake driver; tests of the Selenium pager against
+live portals are in `glossarizers/pager/tests`.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+import unittest.mock
+
+import pytest
+import requests_mock
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
+from urban_physiology_toolkit.glossarizers import network, pager
+
+# The Selenium pager starts up a PhantomJS driver on import, which the fake driver below stands in for.
+with unittest.mock.patch("selenium.webdriver.PhantomJS"):
+    from urban_physiology_toolkit.glossarizers.pager import pager as selenium_pager
+
+
+def read_file(fp):
+    """Helper function. Read a file from the /data folder as string."""
+    with open('data/' + fp, 'r') as f:
+        return f.read()
+
+
+class TestParseLandingPageState(unittest.TestCase):
+    def test_parse(self):
+        view = pager.parse_socrata_landing_page_state(read_file("example-socrata-table-landing-page.html"))
+        assert view['id'] == 'f4rp-2kvy'
+
+    def test_parse_failure(self):
+        # A page without any embedded state, like the ones served up by the old Socrata UI.
+        with pytest.raises(pager.EmbeddedStateException):
+            pager.parse_socrata_landing_page_state(read_file("example-link-table.html"))
+
+        with pytest.raises(pager.EmbeddedStateException):
+            pager.parse_socrata_landing_page_state("<script>var initialState = {'view': ...};</script>")
+
+
+class TestPageSocrataState(unittest.TestCase):
+    def setUp(self):
+        self.domain = "opendata.cityofnewyork.us"
+
+        # Network-dependent tests run earlier may have tripped the portal's circuit breaker.
+        network.breaker.reset()
+
+    def test_endpoint_size(self):
+        uri = "https://data.cityofnewyork.us/d/f4rp-2kvy"
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, text=read_file("example-socrata-table-landing-page.html"))
+            sizing = pager.page_socrata_state_for_endpoint_size(self.domain, uri)
+
+        # System columns (":id", ":@computed_region...") are not counted.
+        assert sizing == {'rows': 24016, 'columns': 3}
+
+    def test_endpoint_size_of_blob(self):
+        uri = "https://data.cityofnewyork.us/d/q68s-8qxv"
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, text=read_file("example-socrata-blob-landing-page.html"))
+            with pytest.raises(pager.EmbeddedStateException):
+                pager.page_socrata_state_for_endpoint_size(self.domain, uri)
+
+    def test_blob_link(self):
+        uri = "https://data.cityofnewyork.us/d/q68s-8qxv"
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, text=read_file("example-socrata-blob-landing-page.html"))
+            link = pager.page_socrata_state_for_resource_link("data.cityofnewyork.us", uri)
+
+        assert link == "https://data.cityofnewyork.us/api/views/q68s-8qxv/files/511dbe78-65f3-470f-9cc8" \
+                       "-c1415f75a6e6?filename=AnnAvg1_7_300mSurfaces.zip"
+
+    def test_href_link(self):
+        uri = "https://data.cityofnewyork.us/d/p94q-8hxh"
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, text=read_file("example-socrata-href-landing-page.html"))
+            link = pager.page_socrata_state_for_resource_link("data.cityofnewyork.us", uri)
+
+        assert link == "http://www.nyc.gov/html/dep/downloads/xls/sampling.xls"
+
+    def test_deleted_endpoint(self):
+        # Socrata redirects requests for endpoints that no longer exist to the portal homepage.
+        uri = "https://data.cityofnewyork.us/d/gkne-dk5s"
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, status_code=302, headers={'Location': "https://opendata.cityofnewyork.us/"})
+            mock.get("https://opendata.cityofnewyork.us/", text="<html></html>")
+            with pytest.raises(pager.DeletedEndpointException):
+                pager.page_socrata_state_for_endpoint_size(self.domain, uri)
+
+
+class FakeElement:
+    """
+    Helper class. A stand-in for a Selenium web element, with the given text and children (keyed by class name). An
+    element made `stale` raises a `StaleElementReferenceException` when read, like one removed from the DOM would.
+    """
+    def __init__(self, text="", children=None, stale=False):
+        self._text = text
+        self.children = children or dict()
+        self.stale = stale
+
+    @property
+    def text(self):
+        if self.stale:
+            raise StaleElementReferenceException()
+        return self._text
+
+    def find_elements_by_class_name(self, name):
+        return self.children.get(name, [])
+
+
+class FakeDriver:
+    """
+    Helper class. A stand-in for a Selenium webdriver on a Socrata landing page. Each time the dataset contents block
+    is looked up the next of the given `snapshots` of it is returned, the last one for good, simulating AJAX loads.
+    """
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+        self.current_url = None
+        self.queries = 0
+
+    def get(self, uri):
+        self.current_url = uri
+
+    def find_elements_by_class_name(self, name):
+        assert name == 'dataset-contents'
+        self.queries += 1
+        return self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0]
+
+    def find_element(self, by, value):
+        elements = self.find_elements_by_class_name(value)
+        if len(elements) == 0:
+            raise NoSuchElementException()
+        return elements[0]
+
+
+def dataset_contents(pairs, stale=False):
+    """Helper function. Returns a snapshot of a dataset contents block holding the given metadata pairs."""
+    elements = [FakeElement(children={'metadata-pair-key': [FakeElement(key, stale=stale)],
+                                      'metadata-pair-value': [FakeElement(value, stale=stale)]})
+                for key, value in pairs]
+    return [FakeElement(children={'metadata-pair': elements})]
+
+
+class TestMetadataPairsLoaded(unittest.TestCase):
+    def setUp(self):
+        network.breaker.reset()
+        self.driver = selenium_pager.driver
+
+    def test_condition(self):
+        condition = selenium_pager.metadata_pairs_loaded()
+
+        # Not met until the contents block is there and the rows and columns pairs are filled in.
+        assert condition(FakeDriver([[]])) is False
+        assert condition(FakeDriver([dataset_contents([("Rows", ""), ("Columns", "")])])) is False
+        assert condition(FakeDriver([dataset_contents([("Rows", "342K")])])) is False
+        assert condition(FakeDriver([dataset_contents([("Rows", "342K"), ("Updated", "Today")])])) is False
+
+        pairs = condition(FakeDriver([dataset_contents([(" Rows ", " 342K "), ("Columns", "5")])]))
+        assert pairs == {'rows': '342K', 'columns': '5'}
+
+    def test_stale_elements_are_requeried(self):
+        # The contents block appears empty, then its pairs are re-rendered (leaving stale elements behind) once they
+        # are filled in.
+        selenium_pager.driver = FakeDriver([
+            [],
+            dataset_contents([("Rows", ""), ("Columns", "")]),
+            dataset_contents([("Rows", ""), ("Columns", "")]),
+            dataset_contents([("Rows", ""), ("Columns", "")]),
+            dataset_contents([("Rows", "1,234"), ("Columns", "5")], stale=True),
+            dataset_contents([("Rows", "1,234"), ("Columns", "5")])
+        ])
+        timings = dict()
+        sizing = selenium_pager.page_socrata_for_endpoint_size("data.cityofnewyork.us",
+                                                               "https://data.cityofnewyork.us/d/f4rp-2kvy",
+                                                               timeout=5, timings=timings)
+
+        assert sizing == {'rows': 1234, 'columns': 5}
+        assert selenium_pager.driver.queries == 6
+        assert set(timings) == {'load', 'condition', 'metadata'}
+        assert all(t >= 0 for t in timings.values())
+
+    def test_timeout(self):
+        selenium_pager.driver = FakeDriver([dataset_contents([("Rows", ""), ("Columns", "")])])
+        timings = dict()
+        with pytest.raises(selenium_pager.TimeoutException):
+            selenium_pager.page_socrata_for_endpoint_size("data.cityofnewyork.us",
+                                                          "https://data.cityofnewyork.us/d/f4rp-2kvy",
+                                                          timeout=0.3, timings=timings)
+
+        # The time spent waiting on the pairs is recorded even though they never arrived.
+        assert set(timings) == {'load', 'condition', 'metadata'}
+        assert timings['metadata'] > 0
+
+    def tearDown(self):
+        selenium_pager.driver = self.driver
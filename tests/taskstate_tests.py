@@ -0,0 +1,160 @@
+"""
+Unit tests for the freshness tracking of catalog tasks.
+"""
+
+import sys; sys.path.append('../')
+import os
+import shlex
+import shutil
+import time
+import unittest
+
+from urban_physiology_toolkit import taskstate
+from urban_physiology_toolkit.workflow import update_dag
+
+DEPOSITOR = """with open("./temp/catalog/example/data.csv", "w") as f:
+    f.write("{0}")
+with open("./temp/runs.txt", "a") as f:
+    f.write("depositor\\n")
+
+outputs = ["./temp/catalog/example/data.csv"]
+"""
+
+TRANSFORM = """with open("./temp/catalog/example/data.csv", "r") as f:
+    data = f.read()
+with open("./temp/catalog/example/transformed.csv", "w") as f:
+    f.write(data.upper())
+with open("./temp/runs.txt", "a") as f:
+    f.write("transform\\n")
+
+outputs = ["./temp/catalog/example/transformed.csv"]
+"""
+
+DEPOSITOR_FILENAME = "./temp/tasks/example/depositor.py"
+TRANSFORM_FILENAME = "./temp/tasks/example/transform.py"
+
+
+class TestTaskState(unittest.TestCase):
+    def setUp(self):
+        os.makedirs("temp/tasks/example")
+        os.makedirs("temp/catalog/example")
+        os.makedirs("temp/.airflow")
+        self.write(DEPOSITOR_FILENAME, DEPOSITOR.format("a,b"))
+        self.write(TRANSFORM_FILENAME, TRANSFORM)
+
+    def write(self, filename, content):
+        with open(filename, "w") as f:
+            f.write(content)
+
+    def runs(self):
+        with open("./temp/runs.txt", "r") as f:
+            return f.read().split()
+
+    def run_all(self):
+        assert taskstate.run_task(DEPOSITOR_FILENAME) == 0
+        assert taskstate.run_task(TRANSFORM_FILENAME) == 0
+
+    def test_task_inputs(self):
+        assert taskstate.task_inputs(DEPOSITOR_FILENAME) == []
+        assert taskstate.task_inputs(TRANSFORM_FILENAME) == taskstate.task_outputs(DEPOSITOR_FILENAME)
+
+    def test_run_task(self):
+        assert not taskstate.is_fresh(DEPOSITOR_FILENAME)
+        self.run_all()
+        assert os.path.exists("./temp/.taskstate/example-depositor.json")
+        assert taskstate.is_fresh(DEPOSITOR_FILENAME) and taskstate.is_fresh(TRANSFORM_FILENAME)
+
+        # Fresh tasks are skipped.
+        self.run_all()
+        assert self.runs() == ["depositor", "transform"]
+
+    def test_changed_script(self):
+        self.run_all()
+        self.write(TRANSFORM_FILENAME, "# A comment.\n" + TRANSFORM)
+        assert taskstate.is_fresh(DEPOSITOR_FILENAME)
+        assert not taskstate.is_fresh(TRANSFORM_FILENAME)
+
+    def test_changed_inputs(self):
+        self.run_all()
+
+        # Data re-downloaded unchanged leaves the transform fresh...
+        time.sleep(0.01)
+        self.write("./temp/catalog/example/data.csv", "a,b")
+        assert taskstate.is_fresh(TRANSFORM_FILENAME)
+
+        # ...but changed data does not.
+        self.write("./temp/catalog/example/data.csv", "c,d")
+        assert not taskstate.is_fresh(DEPOSITOR_FILENAME)
+        assert not taskstate.is_fresh(TRANSFORM_FILENAME)
+
+    def test_missing_outputs(self):
+        self.run_all()
+        os.remove("./temp/catalog/example/transformed.csv")
+        assert not taskstate.is_fresh(TRANSFORM_FILENAME)
+
+    def test_max_age(self):
+        self.run_all()
+        assert taskstate.is_fresh(DEPOSITOR_FILENAME, max_age=60)
+        time.sleep(0.01)
+        assert not taskstate.is_fresh(DEPOSITOR_FILENAME, max_age=0.001)
+
+    def test_failed_task(self):
+        self.write(DEPOSITOR_FILENAME, "raise ValueError()\n\noutputs = []\n")
+        assert taskstate.run_task(DEPOSITOR_FILENAME) != 0
+        assert taskstate.read_record(DEPOSITOR_FILENAME) is None
+
+    def test_incremental_dag(self):
+        update_dag(root="./temp", incremental=True)
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        assert "{0} -m urban_physiology_toolkit.taskstate ./temp/tasks/example/depositor.py".format(
+            shlex.quote(sys.executable)) in dag
+        assert "var_example_transform.set_upstream(var_example_depositor)" in dag
+
+        # Once run, the tasks drop out of the DAG.
+        self.run_all()
+        update_dag(root="./temp", incremental=True)
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            assert "var_example" not in f.read()
+
+        # A stale transform goes back in, without its fresh depositor.
+        self.write(TRANSFORM_FILENAME, "# A comment.\n" + TRANSFORM)
+        update_dag(root="./temp", incremental=True)
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        assert "var_example_transform = " in dag and "var_example_depositor" not in dag
+
+        # Without incremental, every task goes in, run as before.
+        update_dag(root="./temp")
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        assert "var_example_depositor = " in dag and "taskstate" not in dag
+
+    def test_incremental_dag_max_age(self):
+        self.run_all()
+        time.sleep(0.01)
+
+        # Depositors run too long ago are stale, and are run with the same cutoff.
+        update_dag(root="./temp", incremental=True, max_age=0.001)
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        assert "var_example_depositor = " in dag
+        assert "depositor.py --max-age 0.001" in dag
+
+        update_dag(root="./temp", incremental=True, max_age=60)
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            assert "var_example" not in f.read()
+
+    def test_incremental_dag_quoting(self):
+        os.makedirs("./temp/a catalog/tasks/example")
+        os.makedirs("./temp/a catalog/.airflow")
+        self.write("./temp/a catalog/tasks/example/depositor.py", "outputs = []\n")
+
+        update_dag(root="./temp/a catalog", incremental=True)
+        with open("./temp/a catalog/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        assert "'./temp/a catalog/tasks/example/depositor.py'" in dag
+        compile(dag, "airscooter_dag.py", "exec")
+
+    def tearDown(self):
+        shutil.rmtree("temp")
@@ -0,0 +1,58 @@
+"""
+Unit tests for timeline tracing.
+"""
+
+import sys; sys.path.append('../')
+import unittest
+import json
+import os
+import shutil
+
+from urban_physiology_toolkit import tracing
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+
+    def test_disabled(self):
+        tracing.disable()
+        assert tracing.span("glossary") is tracing.span("sizing", "sizing", uri="https://example.com")
+
+    def test_trace_file(self):
+        tracing.enable("temp/trace.json")
+
+        @tracing.traced("get_glossary")
+        def get_glossary():
+            for i in range(2):
+                with tracing.span("resource {0}".format(i), "resource", resource=i):
+                    pass
+
+        get_glossary()
+
+        with open("temp/trace.json", "r") as fp:
+            trace = json.load(fp)
+
+        events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        assert [event['name'] for event in events] == ["resource 0", "resource 1", "get_glossary"]
+        assert events[0]['args'] == {'resource': 0}
+
+        # Spans nest in time.
+        outer = events[-1]
+        assert all(outer['ts'] <= event['ts'] and event['ts'] + event['dur'] <= outer['ts'] + outer['dur']
+                   for event in events[:-1])
+
+    def test_error(self):
+        tracing.enable("temp/trace.json")
+
+        with self.assertRaises(ValueError):
+            with tracing.span("glossary"):
+                raise ValueError
+
+        with open("temp/trace.json", "r") as fp:
+            trace = json.load(fp)
+        assert trace['traceEvents'][-1]['args'] == {'error': 'ValueError'}
+
+    def tearDown(self):
+        tracing.disable()
+        shutil.rmtree("temp")
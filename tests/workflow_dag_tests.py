@@ -2,6 +2,7 @@
 Unit tests for the DAG generated as a part of the portal localization workflow. See also the IO tests.
 """
 
+import json
 import os
 import unittest
 import shutil
@@ -108,3 +109,137 @@ class TestBashFormat(unittest.TestCase):
 
     def tearDown(self):
         shutil.rmtree("temp")
+
+
+class TestShardedDAG(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        os.mkdir("temp/.airflow/")
+        init_catalog("./data/full_glossary.json", "temp")
+
+    def dag_tasks(self, dag_filename):
+        """Helper function. Returns the names of the tasks defined in a DAG file."""
+        with open("./temp/.airflow/dags/" + dag_filename, "r") as f:
+            return [line.split(" = ")[0] for line in f if line.startswith("var_")]
+
+    def test_sharding(self):
+        update_dag(root="./temp")
+        all_tasks = self.dag_tasks("airscooter_dag.py")
+
+        update_dag(root="./temp", shards=3)
+        assert set(os.listdir("./temp/.airflow")) == {'shards', 'dags'}
+        assert set(os.listdir("./temp/.airflow/dags")) == {'airscooter_dag_0.py', 'airscooter_dag_1.py',
+                                                           'airscooter_dag_2.py'}
+        assert set(os.listdir("./temp/.airflow/shards")) == {'airscooter_0.yml', 'airscooter_1.yml',
+                                                             'airscooter_2.yml'}
+
+        shard_tasks = [self.dag_tasks("airscooter_dag_{0}.py".format(i)) for i in range(3)]
+        assert sorted(task for tasks in shard_tasks for task in tasks) == sorted(all_tasks)
+        for tasks in shard_tasks:
+            # Depositors and transforms stay together.
+            assert {task.rsplit("_", 1)[0] for task in tasks if task.endswith("_transform")} <= \
+                {task.rsplit("_", 1)[0] for task in tasks if task.endswith("_depositor")}
+
+        for i in range(3):
+            with open("./temp/.airflow/dags/airscooter_dag_{0}.py".format(i), "r") as f:
+                assert "DAG('airscooter_dag_{0}'".format(i) in f.read()
+
+    def test_resharding(self):
+        update_dag(root="./temp", shards=3)
+        update_dag(root="./temp", shards=2)
+        assert set(os.listdir("./temp/.airflow/dags")) == {'airscooter_dag_0.py', 'airscooter_dag_1.py'}
+        assert set(os.listdir("./temp/.airflow/shards")) == {'airscooter_0.yml', 'airscooter_1.yml'}
+
+        update_dag(root="./temp")
+        assert set(os.listdir("./temp/.airflow")) == {'airscooter.yml', 'dags'}
+        assert os.listdir("./temp/.airflow/dags") == ['airscooter_dag.py']
+
+    def test_shard_by_host(self):
+        # Spread the catalog's depositors across several hosts.
+        hosts = ["data.cityofnewyork.us", "data.cityofchicago.org", "data.sfgov.org", "data.seattle.gov",
+                 "data.austintexas.gov"]
+        for i, folder in enumerate(sorted(os.listdir("./temp/tasks"))):
+            with open("./temp/tasks/{0}/depositor.py".format(folder), "r") as f:
+                depositor = f.read()
+            with open("./temp/tasks/{0}/depositor.py".format(folder), "w") as f:
+                f.write(depositor.replace("data.cityofnewyork.us", hosts[i % len(hosts)]))
+
+        update_dag(root="./temp", shards=4, shard_by="host")
+
+        dags = []
+        for i in range(4):
+            with open("./temp/.airflow/dags/airscooter_dag_{0}.py".format(i), "r") as f:
+                dags.append(f.read())
+
+        shard_hosts = dict()
+        for folder in os.listdir("./temp/tasks"):
+            with open("./temp/tasks/{0}/depositor.py".format(folder), "r") as f:
+                host = f.read().split('requests.get("', 1)[1].split("/")[2]
+            shard = next(i for i, dag in enumerate(dags) if "/tasks/{0}/depositor.py".format(folder) in dag)
+            shard_hosts.setdefault(host, set()).add(shard)
+
+        # Every host's tasks are in a single shard.
+        assert len(shard_hosts) > 1
+        assert all(len(shards) == 1 for shards in shard_hosts.values())
+
+        with self.assertRaises(ValueError):
+            update_dag(root="./temp", shards=4, shard_by="format")
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+
+class TestHostPools(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        os.mkdir("temp/.airflow/")
+        init_catalog("./data/full_glossary.json", "temp")
+
+        # Spread the catalog's depositors across two hosts, three to one.
+        for i, folder in enumerate(sorted(os.listdir("./temp/tasks"))):
+            if i % 4 == 0:
+                with open("./temp/tasks/{0}/depositor.py".format(folder), "r") as f:
+                    depositor = f.read()
+                with open("./temp/tasks/{0}/depositor.py".format(folder), "w") as f:
+                    f.write(depositor.replace("data.cityofnewyork.us", "data.cityofchicago.org"))
+
+    def read_pools(self):
+        with open("./temp/.airflow/pools.json", "r") as f:
+            return json.load(f)
+
+    def test_host_slots(self):
+        update_dag(root="./temp", host_slots=4)
+
+        pools = self.read_pools()
+        assert set(pools) == {'downloads_data_cityofnewyork_us', 'downloads_data_cityofchicago_org'}
+        assert all(pool['slots'] == 4 for pool in pools.values())
+
+        with open("./temp/.airflow/dags/airscooter_dag.py", "r") as f:
+            dag = f.read()
+        depositors = [line for line in dag.split("\n") if line.startswith("var_") and "_depositor = " in line]
+        transforms = [line for line in dag.split("\n") if line.startswith("var_") and "_transform = " in line]
+        assert depositors and all(line.endswith("pool='downloads_data_cityofnewyork_us')") or
+                                  line.endswith("pool='downloads_data_cityofchicago_org')") for line in depositors)
+        assert not any("pool=" in line for line in transforms)
+
+        # Without pools, the pools file goes away.
+        update_dag(root="./temp")
+        assert not os.path.exists("./temp/.airflow/pools.json")
+
+    def test_max_downloads(self):
+        update_dag(root="./temp", max_downloads=5)
+        assert self.read_pools()['downloads_data_cityofnewyork_us']['slots'] == 3
+        assert self.read_pools()['downloads_data_cityofchicago_org']['slots'] == 2
+
+        update_dag(root="./temp", host_slots=2, max_downloads=5)
+        assert all(pool['slots'] == 2 for pool in self.read_pools().values())
+
+    def test_sharded_pools(self):
+        update_dag(root="./temp", shards=2, host_slots=1)
+        assert set(os.listdir("./temp/.airflow")) == {'shards', 'dags', 'pools.json'}
+        for i in range(2):
+            with open("./temp/.airflow/dags/airscooter_dag_{0}.py".format(i), "r") as f:
+                assert "pool='downloads_" in f.read()
+
+    def tearDown(self):
+        shutil.rmtree("temp")
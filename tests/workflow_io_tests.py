@@ -5,12 +5,22 @@ and execution, a longer-running process, are in a separate file.
 
 import unittest
 # import pytest
+from ast import literal_eval
+import hashlib
 import json
 import os
 import shutil
+import subprocess
+import zipfile
+
+import pytest
+import requests
+import requests_mock
 
 import sys; sys.path.insert(0, './../')
 # noinspection PyUnresolvedReferences
+from urban_physiology_toolkit import taskstate
+from urban_physiology_toolkit.glossarizers import fingerprint
 from urban_physiology_toolkit.workflow import (init_catalog, generate_data_package_from_glossary_entry,
                                                finalize_catalog)
 
@@ -189,6 +199,49 @@ class TestFilteringByNColumns(unittest.TestCase):
         shutil.rmtree("temp")
 
 
+class TestDeduplication(unittest.TestCase):
+    """
+    Ascertains that resources whose content fingerprints match are folded into a single deposit when deduplicating,
+    and only then.
+    """
+    def setUp(self):
+        os.mkdir("temp")
+
+        with open("./data/double_resource_glossary.json", "r") as f:
+            glossary = json.load(f)
+
+        # Mirror each resource at a second URL, with the same content. Archive members share their archive's
+        # fingerprint.
+        for entry in glossary:
+            entry['fingerprint'] = {'sha256': hashlib.sha256(entry['resource'].encode("utf-8")).hexdigest(),
+                                    'length': 1024}
+        mirrors = [dict(entry, resource=entry['resource'] + "&mirror=true", name=entry['name'] + " (Mirror)")
+                   for entry in glossary]
+
+        with open("./temp/glossary.json", "w") as f:
+            json.dump(glossary + mirrors, f)
+        self.resources = {entry['resource'] for entry in glossary}
+
+    def test_init(self):
+        init_catalog("./temp/glossary.json", "temp", dedupe=True)
+
+        catalog_folders = os.listdir("./temp/catalog")
+        assert len(catalog_folders) == len(self.resources)
+
+        aliases = []
+        for folder in catalog_folders:
+            with open("./temp/catalog/{0}/datapackage.json".format(folder), "r") as f:
+                aliases += json.load(f)['aliases']
+        assert set(aliases) == {resource + "&mirror=true" for resource in self.resources}
+
+    def test_init_without_dedupe(self):
+        init_catalog("./temp/glossary.json", "temp")
+        assert len(os.listdir("./temp/catalog")) == 2 * len(self.resources)
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+
 class TestFullInitializationIO(unittest.TestCase):
     """
     Smoke test. Makes sure that folder initialization fires and works for a large glossary---in this case,
@@ -246,3 +299,130 @@ class TestFinalization(unittest.TestCase):
 
     def tearDown(self):
         shutil.rmtree("temp")
+
+
+class TestDepositor(unittest.TestCase):
+    """
+    Ascertains that the depositors written for resources download and fingerprint them, and refuse error pages.
+    """
+    def setUp(self):
+        os.mkdir("temp")
+
+        with open("./data/csv_glossary_entry.json", "r") as f:
+            entry = json.load(f)
+        with open("./temp/glossary.json", "w") as f:
+            json.dump([entry], f)
+        init_catalog("./temp/glossary.json", "temp")
+
+        self.uri = entry['resource']
+        self.depositor = "./temp/tasks/{0}/depositor.py".format(os.listdir("./temp/tasks")[0])
+        self.data, self.sidecar = taskstate.task_outputs(self.depositor)
+
+    def run_depositor(self):
+        with open(self.depositor, "r") as f:
+            exec(compile(f.read(), self.depositor, "exec"), dict())
+
+    def test_deposit(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, content=b"a,b\n1,2\n")
+            self.run_depositor()
+
+        # The fingerprint is declared as an output, so that freshness tracking sees it.
+        assert self.sidecar == self.data + ".fingerprint.json"
+        with open(self.sidecar, "r") as f:
+            assert json.load(f) == fingerprint.fingerprint_bytes(b"a,b\n1,2\n")
+
+    def test_error_page(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.uri, status_code=404, content=b"<html>Not found.</html>")
+            with pytest.raises(requests.exceptions.HTTPError):
+                self.run_depositor()
+
+        assert not os.path.exists(self.data) and not os.path.exists(self.sidecar)
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+
+class TestArchiveTransform(unittest.TestCase):
+    """
+    Ascertains that the transforms written for archival resources extract the archive members named in the glossary,
+    and only those.
+    """
+    def setUp(self):
+        os.mkdir("temp")
+
+        with open("./data/blob_resource_glossary.json", "r") as f:
+            glossary = json.load(f)
+        glossary[-1]['dataset'] = "surveys/" + glossary[-1]['dataset']
+        glossary.append(dict(glossary[-1], dataset="../../evil.txt"))
+        self.members = [entry['dataset'] for entry in glossary[:-1]]
+
+        with open("./temp/glossary.json", "w") as f:
+            json.dump(glossary, f)
+        init_catalog("./temp/glossary.json", "temp")
+
+        self.folder = "./temp/catalog/{0}".format(os.listdir("./temp/catalog")[0])
+        self.transform = "./temp/tasks/{0}/transform.py".format(os.listdir("./temp/tasks")[0])
+        with zipfile.ZipFile(self.folder + "/data.zip", "w") as z:
+            for member in self.members + ["unlisted.txt", "../../evil.txt"]:
+                z.writestr(member, "Contents of {0}.".format(member) * 1000)
+
+    def run_transform(self):
+        subprocess.check_call([sys.executable, self.transform])
+
+    def test_extraction(self):
+        self.run_transform()
+
+        for member in self.members:
+            with open("{0}/data/{1}".format(self.folder, member), "r") as f:
+                assert f.read() == "Contents of {0}.".format(member) * 1000
+        assert not os.path.exists(self.folder + "/data/unlisted.txt")
+        assert not os.path.exists("./temp/evil.txt") and not os.path.exists("./evil.txt")
+
+        with open(self.transform, "r") as f:
+            outputs = literal_eval(f.readlines()[-1].split("=")[-1].strip())
+        assert sorted(outputs) == sorted(os.path.abspath("{0}/data/{1}".format(self.folder, member))
+                                         for member in self.members)
+
+    def test_mismatched_member_names(self):
+        # Member names as sized up by datafy, which keep part of its temporary folder path, and a member which is not
+        # in the archive at all.
+        with open("./temp/glossary.json", "r") as f:
+            glossary = json.load(f)[:-1]
+        for entry in glossary:
+            entry['dataset'] = "package/123456/" + entry['dataset']
+        glossary.append(dict(glossary[-1], dataset="package/123456/missing.csv"))
+        with open("./temp/mismatched.json", "w") as f:
+            json.dump(glossary, f)
+
+        os.mkdir("./temp/mismatched")
+        init_catalog("./temp/mismatched.json", "temp/mismatched")
+        folder = "./temp/mismatched/catalog/{0}".format(os.listdir("./temp/mismatched/catalog")[0])
+        transform = "./temp/mismatched/tasks/{0}/transform.py".format(os.listdir("./temp/mismatched/tasks")[0])
+        shutil.copy(self.folder + "/data.zip", folder + "/data.zip")
+
+        result = subprocess.run([sys.executable, transform], stderr=subprocess.PIPE, universal_newlines=True)
+        assert result.returncode == 0
+        assert "package/123456/missing.csv could not be found" in result.stderr
+
+        for member in self.members:
+            with open("{0}/data/package/123456/{1}".format(folder, member), "r") as f:
+                assert f.read() == "Contents of {0}.".format(member) * 1000
+        assert not os.path.exists(folder + "/data/package/123456/missing.csv")
+
+    def test_reextraction(self):
+        self.run_transform()
+        unchanged = "{0}/data/{1}".format(self.folder, self.members[0])
+        changed = "{0}/data/{1}".format(self.folder, self.members[1])
+        mtime = os.stat(unchanged).st_mtime_ns
+        with open(changed, "w") as f:
+            f.write("Tampered with.")
+
+        self.run_transform()
+        assert os.stat(unchanged).st_mtime_ns == mtime
+        with open(changed, "r") as f:
+            assert f.read() == "Contents of {0}.".format(self.members[1]) * 1000
+
+    def tearDown(self):
+        shutil.rmtree("temp")
@@ -0,0 +1,180 @@
+"""
+Unit tests for the lease-based glossarization work queue. Workers glossarize resources served up by a mock server, so
+these tests are not network-dependent.
+"""
+
+import sys; sys.path.append('../')
+import json
+import os
+import shutil
+import time
+import unittest
+
+import requests_mock
+
+from urban_physiology_toolkit.glossarizers import costs, metrics, network, workqueue
+
+
+class FakeClock:
+    """Helper class. A clock which only advances when told to."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_resources(n):
+    """Helper function. Returns `n` CKAN resource entries for PDF documents, which are sized up from their headers."""
+    return [{'resource': "https://data.gov.sg/dataset/report-{0}.pdf".format(i), 'name': "Report {0}".format(i),
+             'flags': []} for i in range(n)]
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        self.clock = FakeClock()
+        self.queue = workqueue.WorkQueue("temp/queue.sqlite", worker="a", lease_seconds=60, clock=self.clock)
+        self.other = workqueue.WorkQueue("temp/queue.sqlite", worker="b", lease_seconds=60, clock=self.clock)
+        self.resources = make_resources(5)
+
+    def test_populate(self):
+        assert self.queue.populate(self.resources) == 5
+        assert self.other.populate(self.resources + make_resources(6)[5:]) == 1
+        assert self.queue.counts() == {'pending': 6, 'leased': 0, 'done': 0, 'merged': 0}
+
+    def test_claims_are_disjoint(self):
+        self.queue.populate(self.resources)
+        first = self.queue.claim(2)
+        second = self.other.claim(2)
+        third = self.queue.claim(2)
+
+        assert [r['resource'] for r in first + second + third] == [r['resource'] for r in self.resources]
+        assert self.other.claim(2) == []
+        assert self.queue.counts()['leased'] == 5
+
+    def test_lease_expiry(self):
+        self.queue.populate(self.resources)
+        batch = self.queue.claim(2)
+
+        self.clock.now += 30
+        assert self.queue.renew() == 2
+        self.clock.now += 45
+        assert self.other.claim(5) == self.resources[2:]
+
+        # Worker a's leases were renewed, so have not lapsed yet...
+        self.clock.now += 30
+        assert self.other.claim(5) == batch
+
+        # ...but now that they have, worker a's results are discarded.
+        assert not self.queue.complete(batch[0], [])
+        assert self.other.complete(batch[0], [])
+
+    def test_release(self):
+        self.queue.populate(self.resources)
+        batch = self.queue.claim(2)
+        self.queue.release(batch)
+        assert self.other.claim(2) == batch
+
+    def test_heartbeat(self):
+        self.queue.populate(self.resources)
+        self.queue.claim(2)
+        self.clock.now += 45
+        with self.queue.heartbeat(interval=0.01):
+            time.sleep(0.1)
+        self.clock.now += 45
+
+        # The heartbeat renewed worker a's leases, so they have not lapsed.
+        assert self.other.claim(5) == self.resources[2:]
+
+    def test_merge(self):
+        with open("temp/resource-list.json", "w") as fp:
+            json.dump(self.resources, fp)
+        with open("temp/glossary.json", "w") as fp:
+            json.dump([{'resource': 'https://data.gov.sg/dataset/old.pdf'}], fp)
+
+        self.queue.populate(self.resources)
+        for resource in reversed(self.queue.claim(2)):
+            resource['flags'].append('processed')
+            self.queue.complete(resource, [dict(resource, dataset='.')])
+
+        assert self.queue.merge("temp/resource-list.json", "temp/glossary.json") == 2
+        assert self.queue.merge("temp/resource-list.json", "temp/glossary.json") == 0
+
+        with open("temp/resource-list.json", "r") as fp:
+            resource_list = json.load(fp)
+        with open("temp/glossary.json", "r") as fp:
+            glossary = json.load(fp)
+        assert [r['flags'] for r in resource_list] == [['processed'], ['processed'], [], [], []]
+        assert [entry['resource'] for entry in glossary] == ['https://data.gov.sg/dataset/old.pdf'] + \
+            [r['resource'] for r in self.resources[:2]]
+        assert self.queue.counts()['merged'] == 2
+
+    def tearDown(self):
+        self.queue.close()
+        self.other.close()
+        shutil.rmtree("temp")
+
+
+class TestRunWorker(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("temp")
+        self.resources = make_resources(5)
+        with open("temp/resource-list.json", "w") as fp:
+            json.dump(self.resources, fp)
+        network.breaker.reset()
+
+    def run_worker(self, worker):
+        with requests_mock.Mocker() as mock:
+            mock.head(requests_mock.ANY, headers={'content-type': 'application/pdf', 'content-length': '2048'})
+            return workqueue.run_worker('ckan', "data.gov.sg", "temp/resource-list.json", "temp/glossary.json",
+                                        batch_size=2, worker=worker)
+
+    def test_run_worker(self):
+        assert self.run_worker("a") == {'pending': 0, 'leased': 0, 'done': 0, 'merged': 5}
+
+        with open("temp/resource-list.json", "r") as fp:
+            resource_list = json.load(fp)
+        with open("temp/glossary.json", "r") as fp:
+            glossary = json.load(fp)
+        assert all('processed' in r['flags'] for r in resource_list)
+        assert [entry['resource'] for entry in glossary] == [r['resource'] for r in self.resources]
+        assert os.path.isfile("temp/glossary.a.metrics.json")
+
+    def test_requeues_deferred_resources(self):
+        # The host is down, so every resource is deferred...
+        for _ in range(network.breaker.threshold):
+            network.breaker.record_failure("https://data.gov.sg/")
+        assert self.run_worker("a")['merged'] == 5
+        with open("temp/resource-list.json", "r") as fp:
+            assert all(r['flags'] == ['deferred'] for r in json.load(fp))
+
+        # ...and retried by the next run, once it is back up.
+        network.breaker.reset()
+        assert self.run_worker("b")['merged'] == 5
+        with open("temp/resource-list.json", "r") as fp:
+            assert all(r['flags'] == ['processed'] for r in json.load(fp))
+        with open("temp/glossary.json", "r") as fp:
+            assert len(json.load(fp)) == 5
+
+    def test_worker_history(self):
+        # The next run is scheduled using the timings of every worker.
+        self.run_worker("a")
+        history = costs.load_history(metrics.summary_filename("temp/glossary.json"))
+        assert sorted(record['resource'] for record in history) == sorted(r['resource'] for r in self.resources)
+
+    def test_reclaims_abandoned_batches(self):
+        # Worker a claims a batch and dies, leaving a lease which has already lapsed.
+        abandoned = workqueue.WorkQueue(workqueue.queue_filename("temp/resource-list.json"), worker="a",
+                                        lease_seconds=-1)
+        abandoned.populate(self.resources)
+        abandoned.claim(2)
+        abandoned.close()
+
+        assert self.run_worker("b")['merged'] == 5
+        with open("temp/glossary.json", "r") as fp:
+            assert len(json.load(fp)) == 5
+
+    def tearDown(self):
+        metrics.current = metrics.RunMetrics()
+        shutil.rmtree("temp")
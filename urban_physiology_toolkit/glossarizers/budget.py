@@ -0,0 +1,74 @@
+"""
+Run-level time and byte budgets for glossarization runs.
+
+The per-resource `timeout` bounds how long any one download may take, but not how long a run takes, nor how much data
+it transfers. A `RunBudget` bounds both: a nightly run may be given a wall-clock budget that fits its window, and a
+byte budget that fits its metered egress.
+
+As a budget runs down, the run stops taking on work it can no longer afford: a resource whose expected cost (see
+`costs`) exceeds the time left is deferred rather than started, and once the byte budget is spent every remaining
+resource is deferred. Deferred resources are flagged as such in the resource file, which is written out as usual when
+the run ends, and are glossarized first by the next run (see `costs.schedule`).
+
+Bytes are counted as they are recorded in the run metrics (see `metrics`), so resources in progress when the byte
+budget runs out are finished, and the budget may be overshot by as much as a single resource transfers.
+"""
+
+import time
+
+from urban_physiology_toolkit.glossarizers import metrics
+from urban_physiology_toolkit.glossarizers.utils import defer
+
+
+class RunBudget:
+    """
+    A run's time and byte budgets. Budgets start counting down when the `RunBudget` is created.
+
+    Parameters
+    ----------
+    seconds: float, optional
+        The wall-clock budget, in seconds. Unlimited if not provided.
+    bytes: int, optional
+        The transfer budget, in bytes. Unlimited if not provided.
+    clock: callable, optional
+        The time source to use. This exists for testing purposes.
+    """
+    def __init__(self, seconds=None, bytes=None, clock=time.perf_counter):
+        self.seconds = seconds
+        self.bytes = bytes
+        self.clock = clock
+        self.start = clock()
+        self.start_bytes = metrics.current.bytes
+
+    def remaining_seconds(self):
+        if self.seconds is None:
+            return float('inf')
+        return self.seconds - (self.clock() - self.start)
+
+    def remaining_bytes(self):
+        if self.bytes is None:
+            return float('inf')
+        return self.bytes - (metrics.current.bytes - self.start_bytes)
+
+    def exhausted(self):
+        return self.remaining_seconds() <= 0 or self.remaining_bytes() <= 0
+
+    def affords(self, cost):
+        """
+        Returns whether or not there is budget left for a resource expected to take `cost` seconds.
+        """
+        return not self.exhausted() and cost <= self.remaining_seconds()
+
+
+def within_budget(resources, budget, model):
+    """
+    Yields the given resources for as long as the budget affords them, going by the expected costs of the given
+    `costs.CostModel`. Resources which the budget does not afford are deferred, and not yielded.
+    """
+    for resource in resources:
+        if budget is None or budget.affords(model.cost(resource)):
+            yield resource
+            continue
+
+        with metrics.current.measure(resource):
+            defer(resource)
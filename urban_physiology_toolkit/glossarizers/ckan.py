@@ -4,14 +4,19 @@ https://github.com/ResidentMario/urban-physiology-toolkit/wiki/Glossarization-No
 """
 
 import warnings
-import pandas as pd
 import requests
 from tqdm import tqdm
 
+from urban_physiology_toolkit import profiling, tracing
+from urban_physiology_toolkit.glossarizers import costs, metrics, network, sampling
+from urban_physiology_toolkit.glossarizers.budget import RunBudget, within_budget
 from urban_physiology_toolkit.glossarizers.utils import (preexisting_cache, load_glossary_todo, write_resource_file,
-                                                         write_glossary_file, get_sizings)
+                                                         write_glossary_file, get_sizings, defer, undefer,
+                                                         mark_processed)
 
 
+@profiling.profiled("resource-list")
+@tracing.traced("ckan.write_resource_list")
 def write_resource_list(domain="data.gov.sg", filename=None, use_cache=True, protocol='https'):
     """
     Creates a resource list for the given CKAN domain and writes it to disc.
@@ -30,12 +35,14 @@ def write_resource_list(domain="data.gov.sg", filename=None, use_cache=True, pro
         many of the portals online are still on HTTP.
     """
 
+    import pandas as pd
+
     # If the file already exists and we specify `use_cache=True`, simply return.
     if preexisting_cache(filename, use_cache):
         return
 
     package_list_slug = "{0}://{1}/api/3/action/package_list".format(protocol, domain)
-    package_list = requests.get(package_list_slug).json()
+    package_list = network.get_with_retries(package_list_slug).json()
 
     if 'success' not in package_list or package_list['success'] != True:
         raise requests.RequestException("The CKAN catalog page did not resolve successfully.")
@@ -47,9 +54,9 @@ def write_resource_list(domain="data.gov.sg", filename=None, use_cache=True, pro
     try:
         for resource in tqdm(resources):
             # package_metadata_show vs. package_show?
-            metadata = requests.get("{0}://{1}/api/3/action/package_show?id={2}".format(protocol,
-                                                                                        domain,
-                                                                                        resource)).json()
+            metadata = network.get_with_retries("{0}://{1}/api/3/action/package_show?id={2}".format(protocol,
+                                                                                                    domain,
+                                                                                                    resource)).json()
 
             # Individual fields vary between providers.
             if domain == "data.gov.sg":
@@ -181,41 +188,36 @@ def write_resource_list(domain="data.gov.sg", filename=None, use_cache=True, pro
         write_resource_file(roi_repr, filename)
 
 
-def write_glossary(domain="data.gov.sg", resource_filename=None, glossary_filename=None,
-                   use_cache=True, timeout=60):
+def get_glossary(resource_list, glossary, domain="data.gov.sg", timeout=60, priority=None, history=None,
+                 budget=None):
     """
-    Use a resource file to write a glossary to disc.
+    Given a resource list and an extant glossary, generate and return an updated glossary.
 
-    Parameters
-    ----------
-    domain: str, default "data.gov.sg"
-        The open data portal landing page URI.
-    resource_filename: str
-        A path to a resource file to read processing jobs from.
-    glossary_filename: str
-        A path to a glossary file to write output to.
-    use_cache: bool, default True
-        If a glossary file is already present at `glossary_filename` and `use_cache` is `True`, endpoints already in
-        that file will be left untouched and ones that are not will be appended on. If `use_cache` is `False` the
-        file will be overwritten instead.
-    timeout: int, default 60
-        A timeout on how long the glossarizer can spend downloading a resource before timing it out. This prevents
-        occasional very large datasets from overwhelming your CPU. Resources that time out will be populated in the
-        glossary with a `filesize` field indicating how long they were downloading for before timing out.
+    Resources are glossarized cheapest first, unless a `priority` function says otherwise (see `costs.schedule`).
+    `history` is a list of past resource timings, as returned by `costs.load_history`. Resources which the `budget` (a
+    `budget.RunBudget`) does not afford are deferred.
+
+    Non-IO subroutine of the user-facing `write_glossary` method.
     """
+    model = costs.CostModel(history, timeout=timeout)
+    scheduled = costs.schedule(resource_list, priority=priority, model=model)
 
-    # Load the glossarization to-do list.
-    resource_list, glossary = load_glossary_todo(resource_filename, glossary_filename, use_cache=use_cache)
-
-    # Whether we succeed or fail, we'll want to save the data we have at the end with a try-finally block.
-    try:
-        for i, resource in tqdm(list(enumerate(resource_list))):
+    # Resources on hosts which are down are pushed to the end of the run.
+    for resource in tqdm(within_budget(network.available_first(scheduled), budget, model), total=len(scheduled)):
+        with tracing.span(resource['name'], "resource", resource=resource['resource']), \
+                metrics.current.measure(resource) as measurement:
+            undefer(resource)
 
             glossarized_resource = resource.copy()
 
             # Get the sizing information.
             # If the resource is its own dataset, this is provided in the content header. Sometimes it is not.
-            headers = requests.head(resource['resource']).headers
+            try:
+                with tracing.span("head", "request", resource=resource['resource']):
+                    headers = network.head_with_retries(resource['resource']).headers
+            except network.CircuitOpenException:
+                defer(resource)
+                continue
 
             try:
                 glossarized_resource['preferred_mimetype'] = headers['content-type']
@@ -227,14 +229,33 @@ def write_glossary(domain="data.gov.sg", resource_filename=None, glossary_filena
             try:
                 glossarized_resource['filesize'] = headers['content-length']
                 glossarized_resource['dataset'] = '.'
+                # Resources sized up from their headers are not downloaded, and so are left without a fingerprint.
+                # Their depositors fingerprint them instead (see `workflow.init_catalog`).
+                total_size = int(headers['content-length'])
                 succeeded = True
 
             # If we error out, this is a packaged/gzipped file. Do sizing the basic way, with a GET request.
             except KeyError:
-                dataset_repr = get_sizings(resource['resource'])
+                try:
+                    dataset_repr = network.with_retries(
+                        lambda remaining: get_sizings(resource['resource'], timeout=remaining),
+                        resource['resource'], timeout=timeout)
+                except network.CircuitOpenException:
+                    defer(resource)
+                    continue
+
+                # Landing pages are not data, and have no filesize to speak of, so they are left out of the glossary.
+                if dataset_repr and dataset_repr[0]['mimetype'] == 'text/html':
+                    mark_processed(resource)
+                    measurement.entries = []
+                    continue
+
                 try:
                     glossarized_resource['filesize'] = dataset_repr[0]['filesize']
                     glossarized_resource['dataset'] = dataset_repr[0]['dataset']
+                    if 'fingerprint' in dataset_repr[0]:
+                        glossarized_resource['fingerprint'] = dataset_repr[0]['fingerprint']
+                    total_size = dataset_repr[0]['filesize'] and int(dataset_repr[0]['filesize'] * 1024)
                     succeeded = True
                 except TypeError:
                     # Transient failure.
@@ -244,15 +265,75 @@ def write_glossary(domain="data.gov.sg", resource_filename=None, glossary_filena
                             .format(resource['resource'])
                     )
 
+            # CKAN doesn't tell us the shape of tabular data, so estimate it from the first few kilobytes.
+            if succeeded:
+                with tracing.span("sample", "sizing", resource=resource['resource']):
+                    sampling.sample_glossary_entry(glossarized_resource, total_size=total_size, timeout=timeout)
+
             # Update the resource list to make note of the fact that this job has been processed.
-            if 'processed' not in resource['flags'] and succeeded:
-                resource["flags"].append("processed")
+            if succeeded:
+                mark_processed(resource)
 
             glossary.append(glossarized_resource)
+            measurement.entries = [glossarized_resource] if succeeded else []
+
+    return resource_list, glossary
+
+
+@profiling.profiled("glossary")
+@tracing.traced("ckan.write_glossary")
+def write_glossary(domain="data.gov.sg", resource_filename=None, glossary_filename=None,
+                   use_cache=True, timeout=60, priority=None, time_budget=None, byte_budget=None):
+    """
+    Use a resource file to write a glossary to disc.
+
+    Parameters
+    ----------
+    domain: str, default "data.gov.sg"
+        The open data portal landing page URI.
+    resource_filename: str
+        A path to a resource file to read processing jobs from.
+    glossary_filename: str
+        A path to a glossary file to write output to.
+    use_cache: bool, default True
+        If a glossary file is already present at `glossary_filename` and `use_cache` is `True`, endpoints already in
+        that file will be left untouched and ones that are not will be appended on. If `use_cache` is `False` the
+        file will be overwritten instead.
+    timeout: int, default 60
+        A timeout on how long the glossarizer can spend downloading a resource before timing it out. This prevents
+        occasional very large datasets from overwhelming your CPU. Resources that time out will be populated in the
+        glossary with a `filesize` field indicating how long they were downloading for before timing out.
+    priority: callable, optional
+        A function mapping each resource to a number. Resources with higher priorities are glossarized first;
+        otherwise resources are glossarized cheapest first, going by their types and by the timings recorded in the
+        previous run's metrics summary. See further `costs.schedule`.
+    time_budget: float, optional
+        A wall-clock budget for the run, in seconds. Once the time left is less than a resource is expected to take,
+        it is deferred rather than started. See further `budget`.
+    byte_budget: int, optional
+        A budget on the number of bytes transferred by the run. Once it is spent, all remaining resources are
+        deferred. Deferred resources are flagged as such in the resource file, and are picked up first by the next
+        run.
+    """
+
+    # Load the glossarization to-do list.
+    resource_list, glossary = load_glossary_todo(resource_filename, glossary_filename, use_cache=use_cache)
+    # The previous run's timings are overwritten by this run's, so read them first.
+    history = costs.load_history(metrics.summary_filename(glossary_filename))
+    metrics.start_run('ckan', domain)
+    budget = RunBudget(seconds=time_budget, bytes=byte_budget)
+
+    # Whether we succeed or fail, we'll want to save the data we have at the end with a try-finally block.
+    try:
+        resource_list, glossary = get_glossary(resource_list, glossary, domain=domain, timeout=timeout,
+                                               priority=priority, history=history, budget=budget)
 
     # Whether we succeeded or got caught on a fatal error, in either case clean up.
     finally:
         # Save output.
-        write_resource_file(resource_list, resource_filename)
-        write_glossary_file(glossary, glossary_filename)
+        with tracing.span("write resource file", "io"):
+            write_resource_file(resource_list, resource_filename, update=True)
+        with tracing.span("write glossary file", "io"):
+            write_glossary_file(glossary, glossary_filename)
+        metrics.finish_run(glossary_filename)
 
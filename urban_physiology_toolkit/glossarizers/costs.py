@@ -0,0 +1,133 @@
+"""
+Cost-aware ordering of glossarization work.
+
+Glossarizing a resource can take anywhere from a fraction of a second (a file whose size is in its headers) to the
+full download timeout (a large archive). When a run is time-boxed, working through resources in resource list order
+lets a few expensive resources at the front eat up the time while thousands of cheap ones wait. `schedule` orders
+resources cheapest first instead, which covers as many resources as possible in a given amount of time.
+
+The expected cost of a resource is, in order of preference:
+
+* The time it took to glossarize in the previous run (unless it was deferred or skipped), as recorded in that run's
+  metrics summary (see `metrics`).
+* The median time resources of its type took in the previous run.
+* A default for its type, from `DEFAULT_COSTS`.
+
+Tables additionally cost `COLUMN_COST` per column (from their `column_names`), unless their own past timing is known.
+Download costs are capped at the download timeout. Among resources of equal expected cost, those with more
+`page_views` go first.
+
+Resources deferred by the previous run (because their host was down, or because the run ran out of budget, see
+`budget`) go before all others, so that they are not starved by a run of deferrals.
+
+A user-supplied `priority` function, mapping resources to numbers, takes precedence over all of the above: resources
+with a higher priority go first, and resources of equal priority are ordered as above.
+"""
+
+import glob
+import json
+import os
+import statistics
+
+# Default expected costs, in seconds. Tables are paged for (see `pager`), everything else is downloaded.
+DEFAULT_COSTS = {
+    'table': 5,
+    'geospatial dataset': 20,
+    'blob': 15,
+    'link': 15
+}
+DEFAULT_COST = 15
+COLUMN_COST = 0.05
+
+# Outcomes whose timings reflect the work of glossarizing a resource. Deferred resources, for example, were skipped.
+MEASURED_OUTCOMES = {'processed', 'removed', 'error', 'timeout'}
+
+# Resource types which are paged for rather than downloaded, and whose cost is not bounded by the download timeout.
+PAGED_TYPES = {'table'}
+
+# The suffix of metrics summary filenames, see `metrics.summary_filename`.
+SUMMARY_SUFFIX = ".metrics.json"
+
+
+def load_history(summary_filename):
+    """
+    Reads the per-resource timings out of a metrics summary (see `metrics.summary_filename`), and out of the summaries
+    written next to it by work queue workers (`<glossary>.<worker>.metrics.json`, see `workqueue.run_worker`),
+    returning a list of `{'resource': str, 'resource_type': str, 'outcome': str, 'seconds': float}` dicts. Records
+    from more recently written summaries come later, and take precedence. Returns an empty list if there are no
+    summaries.
+    """
+    stem = summary_filename[:-len(SUMMARY_SUFFIX)] if summary_filename.endswith(SUMMARY_SUFFIX) else \
+        os.path.splitext(summary_filename)[0]
+    filenames = [summary_filename] + glob.glob(glob.escape(stem) + ".*" + SUMMARY_SUFFIX)
+
+    history = []
+    for filename in sorted((f for f in filenames if os.path.isfile(f)), key=os.path.getmtime):
+        try:
+            with open(filename, "r") as fp:
+                history += json.load(fp).get('resources', [])
+        except (OSError, ValueError):
+            continue
+    return history
+
+
+class CostModel:
+    """
+    Estimates the cost of glossarizing resources.
+
+    Parameters
+    ----------
+    history: list, optional
+        Past per-resource timings, as returned by `load_history`.
+    timeout: int, optional
+        The download timeout in effect.
+    """
+    def __init__(self, history=None, timeout=60):
+        self.timeout = timeout
+        self.timings = dict()
+        by_type = dict()
+        for record in history or []:
+            if record.get('outcome') not in MEASURED_OUTCOMES:
+                continue
+            self.timings[record['resource']] = record['seconds']
+            by_type.setdefault(record.get('resource_type', 'resource'), []).append(record['seconds'])
+        self.type_costs = {resource_type: statistics.median(seconds) for resource_type, seconds in by_type.items()}
+
+    def cost(self, resource):
+        """
+        Returns the expected cost of glossarizing the given resource, in seconds.
+        """
+        if resource['resource'] in self.timings:
+            return self.timings[resource['resource']]
+
+        resource_type = resource.get('resource_type', 'resource')
+        cost = self.type_costs.get(resource_type, DEFAULT_COSTS.get(resource_type, DEFAULT_COST))
+        if resource_type in PAGED_TYPES:
+            return cost + COLUMN_COST * len(resource.get('column_names') or [])
+        return min(cost, self.timeout)
+
+
+def schedule(resources, priority=None, history=None, timeout=60, model=None):
+    """
+    Returns the given resources in the order they should be glossarized in. See the module docstring for details.
+
+    Parameters
+    ----------
+    resources: list, required
+        The resource entries to be glossarized.
+    priority: callable, optional
+        A function mapping each resource to a number. Resources with higher priorities are glossarized first.
+    history: list, optional
+        Past per-resource timings, as returned by `load_history`.
+    timeout: int, optional
+        The download timeout in effect.
+    model: CostModel, optional
+        The cost model to use, instead of one built from `history` and `timeout`.
+    """
+    model = model or CostModel(history, timeout=timeout)
+
+    def key(resource):
+        return (-priority(resource) if priority else 0, 'deferred' not in resource['flags'], model.cost(resource),
+                -(resource.get('page_views') or 0))
+
+    return sorted(resources, key=key)
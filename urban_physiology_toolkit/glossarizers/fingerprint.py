@@ -0,0 +1,122 @@
+"""
+Content fingerprints, for recognizing the same data mirrored at different URLs.
+
+The same dataset often appears on several portals (a city portal and a state mirror, say), or under several Socrata
+view IDs. A fingerprint of the content of each resource is recorded in its glossary entries, which lets
+`workflow.init_catalog` fold such duplicates into a single deposit.
+
+Resources are sized up in several ways (from their central directory, by downloading them, or from their headers), and
+fingerprints are only comparable if they are computed the same way, so each resource has exactly one fingerprint
+scheme, chosen by its content alone. Resources in the ZIP format (archives, but also e.g. KMZ files) have a fingerprint
+of the following format:
+
+    {'members_sha256': str}
+
+Where `members_sha256` is the hash of the CRC-32 checksums and uncompressed sizes of the archive's members. This can be
+had from the central directory of an archive without downloading it (see `remote_zip`), but also from the members
+extracted from one which was downloaded, which is why member names, which `datafy` does not report reliably, are left
+out of it. An archive has one fingerprint, shared by the glossary entries of all of its members.
+
+All other resources have a fingerprint of the following format:
+
+    {'sha256': str, 'length': int, 'head_sha256': str}
+
+Where `sha256` is the hash of the resource's bytes, `length` is their number, and `head_sha256` is the hash of the first
+`HEAD_SIZE` of them, which is cheap to recompute (using a `Range` request) when checking a candidate duplicate.
+
+`fingerprint_file` picks the scheme for, and computes the fingerprint of, a resource which has been downloaded.
+
+Resources sized up from their headers alone (by the CKAN glossarizer, say) are never downloaded while glossarizing, and
+so have no fingerprint in the glossary; downloading them just to fingerprint them would defeat the purpose. They are
+fingerprinted by their depositors instead, which write a `<data>.fingerprint.json` file alongside the data.
+"""
+
+import hashlib
+import zipfile
+import zlib
+
+HEAD_SIZE = 64 * 1024
+
+
+class Fingerprinter:
+    """
+    Computes the fingerprint of a stream of bytes, fed to it a chunk at a time with `update`.
+    """
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._head = hashlib.sha256()
+        self.length = 0
+
+    def update(self, chunk):
+        if self.length < HEAD_SIZE:
+            self._head.update(chunk[:HEAD_SIZE - self.length])
+        self._hash.update(chunk)
+        self.length += len(chunk)
+
+    def fingerprint(self):
+        return {'sha256': self._hash.hexdigest(), 'length': self.length, 'head_sha256': self._head.hexdigest()}
+
+
+def fingerprint_bytes(data, chunk_size=1024 * 1024):
+    """
+    Returns the fingerprint of the given bytes.
+    """
+    fingerprinter = Fingerprinter()
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        fingerprinter.update(view[start:start + chunk_size])
+    return fingerprinter.fingerprint()
+
+
+def _fingerprint_checksums(checksums):
+    """Helper function. Returns the fingerprint of a ZIP archive whose members have the given (CRC-32, size) pairs."""
+    members = hashlib.sha256()
+    for crc, size in sorted(checksums):
+        members.update("{0:08x}\0{1}\n".format(crc, size).encode("utf-8"))
+    return {'members_sha256': members.hexdigest()}
+
+
+def fingerprint_members(infos):
+    """
+    Returns the fingerprint of a ZIP archive with the given members (`zipfile.ZipInfo` objects), going by their central
+    directory entries alone. Directories are not members.
+    """
+    return _fingerprint_checksums((info.CRC, info.file_size) for info in infos if not info.is_dir())
+
+
+def fingerprint_member_contents(contents):
+    """
+    Returns the fingerprint of a ZIP archive whose members, once extracted, have the given contents (as bytes). This is
+    the same as that of `fingerprint_members` for the archive.
+    """
+    return _fingerprint_checksums((zlib.crc32(data), len(data)) for data in contents)
+
+
+def fingerprint_file(f, chunk_size=1024 * 1024):
+    """
+    Returns the fingerprint of the resource in the given seekable binary file object: that of its members, if it is in
+    the ZIP format, and that of its bytes otherwise.
+    """
+    try:
+        with zipfile.ZipFile(f) as z:
+            return fingerprint_members(z.infolist())
+    except zipfile.BadZipFile:
+        pass
+
+    f.seek(0)
+    fingerprinter = Fingerprinter()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        fingerprinter.update(chunk)
+    return fingerprinter.fingerprint()
+
+
+def fingerprint_key(fingerprint):
+    """
+    Returns a hashable key which two fingerprints share if and only if they fingerprint the same content, or `None` if
+    there is no fingerprint.
+    """
+    if not fingerprint:
+        return None
+    if 'sha256' in fingerprint:
+        return 'sha256', fingerprint['sha256'], fingerprint['length']
+    return 'members_sha256', fingerprint['members_sha256']
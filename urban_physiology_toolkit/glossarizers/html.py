@@ -3,9 +3,10 @@ HTML glossarizer. Currently limited to non-AJAX HTML tables. A general implement
 https://github.com/ResidentMario/urban-physiology-toolkit/wiki/Glossarization-Notes:-HTML.
 """
 
-import requests
-import bs4
 import itertools
+from urban_physiology_toolkit import profiling, tracing
+from urban_physiology_toolkit.glossarizers import costs, metrics, network, sampling
+from urban_physiology_toolkit.glossarizers.budget import RunBudget, within_budget
 from urban_physiology_toolkit.glossarizers.utils import (preexisting_cache, load_glossary_todo,
                                                          write_resource_file, write_glossary_file,
                                                          generic_glossarize_resource)
@@ -35,7 +36,9 @@ def _extract_links(url, selector, filter=None):
     -------
     A list of links extracted from the page.
     """
-    soup = bs4.BeautifulSoup(requests.get(url).content, 'html.parser')
+    import bs4
+
+    soup = bs4.BeautifulSoup(network.get_with_retries(url).content, 'html.parser')
     matches = soup.select(selector)
     hrefs = itertools.chain(*[match.find_all("a") for match in matches])
     links = [a['href'] for a in hrefs if 'href' in a.attrs]
@@ -76,7 +79,6 @@ def get_resource_list(domain=None):
     -------
     Returns the resource list for the given domain.
     """
-    # TODO: Harden against network failures using https://github.com/rholder/retrying
     if "mdps.gov.qa/en/statistics1/Pages/default.aspx" in domain:
         return _get_qatari_ministry_of_planning_and_statistics_resource_list()
     # All other HTML grabbers have not been implemented yet.
@@ -86,6 +88,8 @@ def get_resource_list(domain=None):
         raise NotImplementedError("Glossarization has not yet been implemented for the {0} domain.".format(domain))
 
 
+@profiling.profiled("resource-list")
+@tracing.traced("html.write_resource_list")
 def write_resource_list(domain=None, filename=None, use_cache=True):
     """
     Creates a resource list for the given domain and writes it to disc.
@@ -105,17 +109,26 @@ def write_resource_list(domain=None, filename=None, use_cache=True):
         write_resource_file(get_resource_list(domain=domain), filename)
 
 
-def get_glossary(domain, resource_list=None, glossary=None, timeout=60):
+@tracing.traced("html.get_glossary")
+def get_glossary(domain, resource_list=None, glossary=None, timeout=60, priority=None, history=None, budget=None):
     """
     Fetches and returns a glossary for the given domain.
 
+    Resources are glossarized cheapest first, unless a `priority` function says otherwise (see `costs.schedule`).
+    `history` is a list of past resource timings, as returned by `costs.load_history`. Resources which the `budget` (a
+    `budget.RunBudget`) does not afford are deferred.
+
     Non-IO subroutine of the user-facing `write_glossary`.
     """
     resource_list = [] if resource_list is None else resource_list
     glossary = [] if glossary is None else glossary
 
     if "mdps.gov.qa/en/statistics1/Pages/default.aspx" in domain:
-        return _get_qatari_ministry_of_planning_and_statistics_glossary(resource_list, glossary, timeout=timeout)
+        model = costs.CostModel(history, timeout=timeout)
+        scheduled = costs.schedule(resource_list, priority=priority, model=model)
+        _get_qatari_ministry_of_planning_and_statistics_glossary(scheduled, glossary, timeout=timeout, budget=budget,
+                                                                 model=model)
+        return resource_list, glossary
 
     # All other HTML grabbers have not been implemented yet.
     elif domain is None:
@@ -124,7 +137,10 @@ def get_glossary(domain, resource_list=None, glossary=None, timeout=60):
         raise NotImplementedError("Glossarization has not yet been implemented for the {0} domain.".format(domain))
 
 
-def write_glossary(domain=None, resource_filename=None, glossary_filename=None, timeout=60, use_cache=True):
+@profiling.profiled("glossary")
+@tracing.traced("html.write_glossary")
+def write_glossary(domain=None, resource_filename=None, glossary_filename=None, timeout=60, use_cache=True,
+                   priority=None, time_budget=None, byte_budget=None):
     """
     Use a resource file to write a glossary to disc.
 
@@ -144,16 +160,35 @@ def write_glossary(domain=None, resource_filename=None, glossary_filename=None,
         If a glossary file is already present at `glossary_filename` and `use_cache` is `True`, endpoints already in
         that file will be left untouched and ones that are not will be appended on. If `use_cache` is `False` the
         file will be overwritten instead.
+    priority: callable, optional
+        A function mapping each resource to a number. Resources with higher priorities are glossarized first;
+        otherwise resources are glossarized cheapest first, going by their types and by the timings recorded in the
+        previous run's metrics summary. See further `costs.schedule`.
+    time_budget: float, optional
+        A wall-clock budget for the run, in seconds. Once the time left is less than a resource is expected to take,
+        it is deferred rather than started. See further `budget`.
+    byte_budget: int, optional
+        A budget on the number of bytes transferred by the run. Once it is spent, all remaining resources are
+        deferred. Deferred resources are flagged as such in the resource file, and are picked up first by the next
+        run.
     """
     resource_list, glossary = load_glossary_todo(resource_filename, glossary_filename, use_cache)
+    # The previous run's timings are overwritten by this run's, so read them first.
+    history = costs.load_history(metrics.summary_filename(glossary_filename))
+    metrics.start_run('html', domain)
+    budget = RunBudget(seconds=time_budget, bytes=byte_budget)
 
     try:
-        resource_list, glossary = get_glossary(domain, resource_list, glossary, timeout=timeout)
+        resource_list, glossary = get_glossary(domain, resource_list, glossary, timeout=timeout, priority=priority,
+                                               history=history, budget=budget)
 
     # Save output.
     finally:
-        write_resource_file(resource_list, resource_filename)
-        write_glossary_file(glossary, glossary_filename)
+        with tracing.span("write resource file", "io"):
+            write_resource_file(resource_list, resource_filename, update=True)
+        with tracing.span("write glossary file", "io"):
+            write_glossary_file(glossary, glossary_filename)
+        metrics.finish_run(glossary_filename)
 
 
 #####################
@@ -179,12 +214,24 @@ def _get_qatari_ministry_of_planning_and_statistics_resource_list():
              'flags': []} for r in rlinks]
 
 
-def _get_qatari_ministry_of_planning_and_statistics_glossary(resource_list, glossary, timeout=60):
+def _get_qatari_ministry_of_planning_and_statistics_glossary(resource_list, glossary, timeout=60, budget=None,
+                                                             model=None):
     """
     Generates a glossary for the Qatar Ministry of Planning and Statistics open datasets.
     """
-    for resource in tqdm(resource_list):
-        modified_resource, glossarized_resource = generic_glossarize_resource(resource, timeout)
+    resources = within_budget(network.available_first(resource_list), budget, model or costs.CostModel())
+    for resource in tqdm(resources, total=len(resource_list)):
+        with tracing.span(resource['resource'], "resource", resource=resource['resource']), \
+                metrics.current.measure(resource) as measurement:
+            modified_resource, glossarized_resource = generic_glossarize_resource(resource, timeout)
+            for entry in glossarized_resource:
+                # Timed-out downloads have no filesize (or one of the form ">Ns"), and are not worth sampling.
+                filesize = entry.get('filesize')
+                if not isinstance(filesize, (int, float)) or isinstance(filesize, bool):
+                    continue
+                with tracing.span("sample", "sizing", resource=entry['resource']):
+                    sampling.sample_glossary_entry(entry, total_size=int(filesize * 1024), timeout=timeout)
+            measurement.entries = glossarized_resource
         resource.update(modified_resource)
         glossary += glossarized_resource
 
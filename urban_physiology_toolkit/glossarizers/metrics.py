@@ -0,0 +1,299 @@
+"""
+Run-level metrics for the glossarizers.
+
+Every glossary run records how long each resource took to process (as a histogram, per resource type), what became of
+it (an outcome counter: processed, removed, error, timeout, deferred, or skipped), how many bytes were transferred, how
+often the sizing cache (see `sizing_cache`) was hit, and how long the pagers spent waiting on portal landing pages.
+The metrics for the run in progress live in the module-level `current` object, which the glossarizers and the network
+utilities report into.
+
+When a glossary run finishes, a JSON summary of its metrics is written next to the glossary file (`glossary.json` gets
+a `glossary.metrics.json`). If the `UPT_METRICS_TEXTFILE` environment variable is set, the metrics are also written to
+that path in the Prometheus text exposition format, for pickup by the node exporter's textfile collector.
+
+Recording a measurement is a lock-protected counter increment, so the overhead is negligible next to the network
+requests being measured.
+"""
+
+import bisect
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+OUTCOMES = ('processed', 'removed', 'error', 'timeout', 'deferred', 'skipped', 'failed')
+
+SIZING_CACHE_OUTCOMES = ('hit', 'miss', 'uncacheable')
+
+TEXTFILE_ENVIRONMENT_VARIABLE = "UPT_METRICS_TEXTFILE"
+
+
+class Histogram:
+    """
+    A cumulative histogram of observations, with fixed bucket upper bounds. Observations above the highest bound
+    fall into an implicit `+Inf` bucket.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self):
+        """
+        Returns a list of `(upper bound, number of observations less than or equal to it)` tuples, ending with the
+        `+Inf` bucket.
+        """
+        running, cumulative = 0, []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative
+
+    def quantile(self, q):
+        """
+        Returns an upper bound on the `q`-th quantile of the observations: the upper bound of the bucket it falls in.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, running in self.cumulative_counts():
+            if running >= rank:
+                return bound if bound != float('inf') else self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {_format_bound(bound): running for bound, running in self.cumulative_counts()}
+        }
+
+
+def _format_bound(bound):
+    """Helper function. Formats a histogram bucket bound the way Prometheus does."""
+    return "+Inf" if bound == float('inf') else repr(float(bound))
+
+
+class Measurement:
+    """
+    The measurement of a single resource's processing, as handed out by `RunMetrics.measure`. The glossary entries
+    generated for the resource should be assigned to `entries`, as they are used to determine its outcome.
+    """
+    def __init__(self, resource):
+        self.resource = resource
+        self.flags_before = list(resource['flags'])
+        self.entries = []
+
+    def outcome(self):
+        flags = self.resource['flags']
+
+        def flagged(flag):
+            return flags.count(flag) > self.flags_before.count(flag)
+
+        if 'deferred' in flags:
+            return 'deferred'
+        elif flagged('removed'):
+            return 'removed'
+        elif flagged('error'):
+            return 'error'
+        elif any(isinstance(entry.get('filesize'), str) and entry['filesize'].startswith(">")
+                 for entry in self.entries):
+            return 'timeout'
+        elif self.entries:
+            return 'processed'
+        else:
+            return 'skipped'
+
+
+class RunMetrics:
+    """
+    Metrics for a single glossary run.
+
+    Parameters
+    ----------
+    glossarizer: str, optional
+        The name of the glossarizer being run, e.g. "socrata".
+    domain: str, optional
+        The domain being glossarized.
+    clock: callable, optional
+        The time source to use. This exists for testing purposes.
+    """
+    def __init__(self, glossarizer=None, domain=None, clock=time.perf_counter):
+        self.glossarizer = glossarizer
+        self.domain = domain
+        self.clock = clock
+        self.started = datetime.datetime.now().isoformat()
+        self.start = clock()
+        self.latencies = dict()
+        self.pager_waits = dict()
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self.bytes = 0
+        self.sizing_cache = {outcome: 0 for outcome in SIZING_CACHE_OUTCOMES}
+        self.resources = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, resource):
+        """
+        Measures the processing of a resource, recording its latency and outcome. Use as follows:
+
+            with metrics.current.measure(resource) as measurement:
+                measurement.entries = glossarize(resource)
+
+        Fatal errors are recorded as a "failed" outcome before being re-raised.
+        """
+        measurement = Measurement(resource)
+        start = self.clock()
+        outcome = 'failed'
+        try:
+            yield measurement
+            outcome = measurement.outcome()
+        finally:
+            self.record_resource(resource, outcome, self.clock() - start)
+
+    def record_resource(self, resource, outcome, seconds):
+        resource_type = resource.get('resource_type', 'resource')
+        with self._lock:
+            if resource_type not in self.latencies:
+                self.latencies[resource_type] = Histogram()
+            self.latencies[resource_type].observe(seconds)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.resources.append({'resource': resource['resource'], 'resource_type': resource_type,
+                                   'outcome': outcome, 'seconds': seconds})
+
+    def record_bytes(self, n):
+        with self._lock:
+            self.bytes += n
+
+    def record_sizing_cache(self, outcome):
+        """
+        Records a sizing cache lookup (see `sizing_cache`), whose `outcome` is one of `SIZING_CACHE_OUTCOMES`.
+        """
+        with self._lock:
+            self.sizing_cache[outcome] += 1
+
+    def record_pager_waits(self, timings):
+        """
+        Records a pager `timings` dict, of the form `{phase: seconds}`.
+        """
+        with self._lock:
+            for phase, seconds in timings.items():
+                if phase not in self.pager_waits:
+                    self.pager_waits[phase] = Histogram()
+                self.pager_waits[phase].observe(seconds)
+
+    def elapsed(self):
+        return self.clock() - self.start
+
+    def summary(self):
+        """
+        Returns a JSON-serializable summary of the run's metrics.
+        """
+        with self._lock:
+            elapsed = self.elapsed()
+            return {
+                'glossarizer': self.glossarizer,
+                'domain': self.domain,
+                'started': self.started,
+                'elapsed': elapsed,
+                'resources_processed': len(self.resources),
+                'resources_per_second': len(self.resources) / elapsed if elapsed > 0 else None,
+                'outcomes': dict(self.outcomes),
+                'bytes': self.bytes,
+                'sizing_cache': dict(self.sizing_cache),
+                'latency': {resource_type: histogram.summary() for resource_type, histogram in
+                            self.latencies.items()},
+                'pager_waits': {phase: histogram.summary() for phase, histogram in self.pager_waits.items()},
+                'resources': list(self.resources)
+            }
+
+    def to_prometheus(self):
+        """
+        Returns the run's metrics in the Prometheus text exposition format.
+        """
+        labels = 'glossarizer="{0}",domain="{1}"'.format(self.glossarizer or "", self.domain or "")
+        lines = []
+
+        def histogram_lines(name, label, histograms):
+            lines.append("# TYPE {0} histogram".format(name))
+            for key, histogram in sorted(histograms.items()):
+                key_labels = '{0},{1}="{2}"'.format(labels, label, key)
+                for bound, running in histogram.cumulative_counts():
+                    lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, key_labels, _format_bound(bound),
+                                                                          running))
+                lines.append("{0}_sum{{{1}}} {2}".format(name, key_labels, repr(float(histogram.sum))))
+                lines.append("{0}_count{{{1}}} {2}".format(name, key_labels, histogram.count))
+
+        with self._lock:
+            lines.append("# TYPE upt_glossarizer_resources_total counter")
+            for outcome, count in sorted(self.outcomes.items()):
+                lines.append('upt_glossarizer_resources_total{{{0},outcome="{1}"}} {2}'.format(labels, outcome,
+                                                                                               count))
+            lines.append("# TYPE upt_glossarizer_bytes_total counter")
+            lines.append("upt_glossarizer_bytes_total{{{0}}} {1}".format(labels, self.bytes))
+            lines.append("# TYPE upt_glossarizer_sizing_cache_lookups_total counter")
+            for outcome, count in sorted(self.sizing_cache.items()):
+                lines.append('upt_glossarizer_sizing_cache_lookups_total{{{0},outcome="{1}"}} {2}'.format(
+                    labels, outcome, count))
+            lines.append("# TYPE upt_glossarizer_run_seconds gauge")
+            lines.append("upt_glossarizer_run_seconds{{{0}}} {1}".format(labels, repr(float(self.elapsed()))))
+            histogram_lines("upt_glossarizer_resource_seconds", "resource_type", self.latencies)
+            histogram_lines("upt_glossarizer_pager_wait_seconds", "phase", self.pager_waits)
+
+        return "\n".join(lines) + "\n"
+
+
+current = RunMetrics()
+
+
+def start_run(glossarizer, domain):
+    """
+    Starts recording metrics for a new glossary run, discarding those of the previous one.
+    """
+    global current
+    current = RunMetrics(glossarizer=glossarizer, domain=domain)
+    return current
+
+
+def summary_filename(glossary_filename):
+    """
+    Returns the path that the metrics summary for the given glossary file is written to.
+    """
+    return os.path.splitext(glossary_filename)[0] + ".metrics.json"
+
+
+def _write_atomically(contents, filename):
+    """Helper function. Textfile collectors may read at any time, so files are moved into place once complete."""
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w") as fp:
+        fp.write(contents)
+    os.replace(temp_filename, filename)
+
+
+def finish_run(glossary_filename):
+    """
+    Writes out the metrics for the current glossary run: a JSON summary next to the glossary file, and a Prometheus
+    textfile, if the `UPT_METRICS_TEXTFILE` environment variable is set.
+    """
+    _write_atomically(json.dumps(current.summary(), indent=4), summary_filename(glossary_filename))
+
+    textfile = os.environ.get(TEXTFILE_ENVIRONMENT_VARIABLE)
+    if textfile:
+        _write_atomically(current.to_prometheus(), textfile)
@@ -0,0 +1,422 @@
+"""
+Network utilities shared by the glossarizers.
+
+Open data portals throttle clients which request too much too quickly; Socrata portals in particular are known to
+throttle page requests heavily. Every HTTP request and headless browser page load the glossarizers make is therefore
+routed through a per-host rate limiter, `limiter`, which adapts its rate to what each host tolerates: it backs off
+sharply whenever a host responds with a `429 Too Many Requests` or `503 Service Unavailable` (respecting any
+`Retry-After` header it sends along), and then recovers gradually as requests succeed again.
+
+Portals (and the servers external links point to) also fail transiently, and occasionally go down outright. Requests
+which fail for transient reasons are retried with jittered exponential backoff by `with_retries`, within an overall
+timeout. Failures other than throttling are also tallied per host by a circuit breaker, `breaker`: once a host fails
+enough times in a row, it is considered down, and requests to it fail fast with a `CircuitOpenException` until a
+cooldown period has passed. Glossarizers iterate over their resources using `available_first`, which pushes resources
+on hosts that are down to the end of the run.
+"""
+
+import email.utils
+import io
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from urban_physiology_toolkit.glossarizers import metrics
+
+# Status codes which signal that we are being throttled.
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Status codes and exceptions which signal a transient failure, one worth retrying.
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+TRANSIENT_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+# Status codes which signal that a host is up, but throttling us. These are left to the rate limiter, and do not count
+# towards tripping the host's circuit breaker.
+RATE_LIMITED_STATUS_CODES = {429}
+
+# Retries are not attempted with less than this many seconds left before the timeout.
+MIN_ATTEMPT_SECONDS = 1
+
+
+# Errors for throwing.
+class CircuitOpenException(Exception):
+    pass
+
+
+def host_of(uri):
+    """
+    Returns the host component of a URI, which is what rate limits (and circuit breakers) are keyed by.
+    """
+    return urllib.parse.urlparse(uri).netloc.lower()
+
+
+def parse_retry_after(value):
+    """
+    Parses the value of a `Retry-After` header, which may be either a number of seconds or an HTTP date, into a number
+    of seconds. Returns `None` if the value is missing or cannot be parsed.
+    """
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class _TokenBucket:
+    """
+    Token bucket state for a single host. Internal to `HostRateLimiter`.
+    """
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = now
+        self.lock = threading.Lock()
+
+
+class HostRateLimiter:
+    """
+    An adaptive token bucket rate limiter, keyed by host.
+
+    Each host starts out allowed `rate` requests per second, with bursts of up to `burst` requests. Every throttling
+    response multiplies the host's rate by `backoff` (down to a floor of `min_rate`) and, if the server says how long
+    to wait via `Retry-After`, blocks the host for that long. Every successful request adds `recovery` requests per
+    second back to the rate (up to a ceiling of `max_rate`). This additive-increase, multiplicative-decrease scheme
+    settles on the highest rate each host tolerates.
+
+    Parameters
+    ----------
+    rate: float, default 4
+        The initial number of requests per second allowed per host.
+    burst: int, default 4
+        The bucket size: the number of requests that may be made back-to-back after a host has been idle.
+    min_rate: float, default 0.05
+        The lowest rate a host will be backed off to.
+    max_rate: float, default 16
+        The highest rate a host will be recovered to.
+    backoff: float, default 0.5
+        The factor a host's rate is multiplied by when it throttles us.
+    recovery: float, default 0.05
+        The amount a host's rate is increased by when a request to it succeeds.
+    clock, sleep: callables, optional
+        The time source and sleep function to use. These exist for testing purposes.
+    """
+    def __init__(self, rate=4, burst=4, min_rate=0.05, max_rate=16, backoff=0.5, recovery=0.05,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = dict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, uri):
+        host = host_of(uri)
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = _TokenBucket(self.rate, self.burst, self.clock())
+            return self._buckets[host]
+
+    def rate_for(self, uri):
+        """
+        Returns the number of requests per second currently allowed to the host of the given URI.
+        """
+        return self._bucket(uri).rate
+
+    def acquire(self, uri):
+        """
+        Blocks until a request to the host of the given URI is allowed, then claims it.
+        """
+        bucket = self._bucket(uri)
+
+        with bucket.lock:
+            now = self.clock()
+            bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+
+            # Claim a token, even if that puts the bucket into debt; the debt is what we wait out. Claiming under the
+            # lock means concurrent callers queue up behind one another instead of all waking up at once.
+            bucket.tokens -= 1
+            wait = max(-bucket.tokens / bucket.rate, bucket.blocked_until - now, 0)
+
+        if wait > 0:
+            self.sleep(wait)
+
+    def slow_down(self, uri, retry_after=None):
+        """
+        Registers that the host of the given URI is throttling us.
+        """
+        bucket = self._bucket(uri)
+
+        with bucket.lock:
+            now = self.clock()
+            bucket.rate = max(bucket.rate * self.backoff, self.min_rate)
+            bucket.tokens = min(bucket.tokens, 0)
+            if retry_after is not None:
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+
+    def speed_up(self, uri):
+        """
+        Registers that a request to the host of the given URI went through without being throttled.
+        """
+        bucket = self._bucket(uri)
+
+        with bucket.lock:
+            bucket.rate = min(bucket.rate + self.recovery, self.max_rate)
+
+    def feedback(self, uri, status_code, retry_after=None):
+        """
+        Adjusts the rate for the host of the given URI based on the status code (and `Retry-After` header value,
+        if any) of a response from it.
+        """
+        if status_code in THROTTLE_STATUS_CODES:
+            self.slow_down(uri, parse_retry_after(retry_after))
+        else:
+            self.speed_up(uri)
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker, keyed by host.
+
+    A host's circuit opens once `threshold` requests to it fail transiently in a row. While it is open, requests to the
+    host are refused outright. After `cooldown` seconds the circuit half-opens, letting a single trial request through:
+    if that request succeeds, the circuit closes again; if it fails, the circuit re-opens for another cooldown.
+
+    Parameters
+    ----------
+    threshold: int, default 5
+        The number of consecutive failures after which a host is considered down.
+    cooldown: float, default 120
+        The number of seconds a host is considered down for before it is tried again.
+    clock: callable, optional
+        The time source to use. This exists for testing purposes.
+    """
+    def __init__(self, threshold=5, cooldown=120, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._failures = dict()
+        self._opened_at = dict()
+        self._lock = threading.Lock()
+
+    def is_open(self, uri):
+        """
+        Returns whether or not requests to the host of the given URI are currently being refused.
+        """
+        host = host_of(uri)
+        with self._lock:
+            return host in self._opened_at and self.clock() - self._opened_at[host] < self.cooldown
+
+    def allow(self, uri):
+        """
+        Returns whether or not a request to the host of the given URI may be made. If the host's cooldown has expired,
+        this lets a single trial request through, and refuses any others until that request is recorded as a success
+        or a failure.
+        """
+        host = host_of(uri)
+        with self._lock:
+            if host not in self._opened_at:
+                return True
+            now = self.clock()
+            if now - self._opened_at[host] < self.cooldown:
+                return False
+            # Half-open: restart the cooldown, so that only this request gets through in the meantime.
+            self._opened_at[host] = now
+            return True
+
+    def reset(self):
+        """
+        Closes every circuit, forgetting all recorded failures.
+        """
+        with self._lock:
+            self._failures.clear()
+            self._opened_at.clear()
+
+    def record_success(self, uri):
+        host = host_of(uri)
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, uri):
+        host = host_of(uri)
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.threshold:
+                self._opened_at[host] = self.clock()
+
+
+limiter = HostRateLimiter()
+breaker = CircuitBreaker()
+
+
+def is_transient(err):
+    """
+    Returns whether or not the given exception signals a transient failure, one worth retrying.
+    """
+    if isinstance(err, TRANSIENT_EXCEPTIONS):
+        return True
+    if isinstance(err, requests.exceptions.HTTPError) and err.response is not None:
+        return err.response.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def is_rate_limited(err):
+    """
+    Returns whether or not the given exception signals that the host is throttling us, rather than failing.
+    """
+    return (isinstance(err, requests.exceptions.HTTPError) and err.response is not None and
+            err.response.status_code in RATE_LIMITED_STATUS_CODES)
+
+
+def with_retries(func, uri, attempts=3, base_delay=1, max_delay=30, sleep=time.sleep, timeout=None,
+                 clock=time.monotonic):
+    """
+    Calls `func`, a request to the host of the given URI, retrying it if it fails transiently.
+
+    Retries are spaced out using exponential backoff with "full jitter": before retry `n` we sleep for a random amount
+    of time between zero and `min(max_delay, base_delay * 2 ** n)` seconds. Outcomes are reported to the circuit
+    breaker, except for throttling (`429 Too Many Requests`) responses, which come from hosts that are up, and which
+    the rate limiter handles instead. If the host's circuit is open, a `CircuitOpenException` is raised instead of
+    making the request. Errors which are not transient are raised immediately, as are transient errors on the last
+    attempt.
+
+    If a `timeout` is given, it bounds the time taken by all of the attempts together. `func` is then called with the
+    number of seconds left, to be used as the timeout of that attempt, and no retry is made once fewer than
+    `MIN_ATTEMPT_SECONDS` would be left for it.
+    """
+    start = clock()
+    for attempt in range(attempts):
+        if not breaker.allow(uri):
+            raise CircuitOpenException("The {0} host is down; not sending a request to {1}.".format(
+                host_of(uri), uri))
+
+        try:
+            result = func() if timeout is None else func(timeout - (clock() - start))
+        except Exception as err:
+            if not is_transient(err):
+                raise
+            if not is_rate_limited(err):
+                breaker.record_failure(uri)
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if attempt == attempts - 1:
+                raise
+            if timeout is not None and timeout - (clock() - start) - delay < MIN_ATTEMPT_SECONDS:
+                raise
+            sleep(delay)
+        else:
+            breaker.record_success(uri)
+            return result
+
+
+def available_first(resources, key=lambda resource: resource['resource']):
+    """
+    Iterates over the given resources, postponing resources on hosts whose circuit is open to the end of the run.
+
+    By the time the postponed resources come back around, their hosts may have come back up. If not, attempting to
+    process them fails fast with a `CircuitOpenException`.
+    """
+    postponed = []
+    for resource in resources:
+        if breaker.is_open(key(resource)):
+            postponed.append(resource)
+        else:
+            yield resource
+
+    yield from postponed
+
+
+def request(method, uri, **kwargs):
+    """
+    Makes a rate-limited HTTP request. Takes the same arguments as `requests.request`.
+    """
+    limiter.acquire(uri)
+    r = requests.request(method, uri, **kwargs)
+    limiter.feedback(uri, r.status_code, r.headers.get('Retry-After'))
+    # Streamed response bodies are not read here, so their size is not known here either.
+    if not kwargs.get('stream'):
+        metrics.current.record_bytes(len(r.content))
+    return r
+
+
+def get(uri, **kwargs):
+    """
+    Makes a rate-limited GET request. Takes the same arguments as `requests.get`.
+    """
+    kwargs.setdefault('allow_redirects', True)
+    return request('GET', uri, **kwargs)
+
+
+def head(uri, **kwargs):
+    """
+    Makes a rate-limited HEAD request. Takes the same arguments as `requests.head`.
+    """
+    kwargs.setdefault('allow_redirects', False)
+    return request('HEAD', uri, **kwargs)
+
+
+def get_prefix(uri, size, **kwargs):
+    """
+    Makes a rate-limited GET request for the first `size` bytes of a resource, asking for only those using a `Range`
+    header, and cutting the download short if the server sends more anyway. Takes the same arguments as
+    `requests.get`.
+
+    Returns the bytes read and the (closed) response, whose headers tell how much of the resource there is. Raises an
+    `HTTPError` if the request fails.
+    """
+    headers = dict(kwargs.pop('headers', None) or dict())
+    headers['Range'] = "bytes=0-{0}".format(size - 1)
+    r = get(uri, headers=headers, stream=True, **kwargs)
+    try:
+        r.raise_for_status()
+        buffer = io.BytesIO()
+        for chunk in r.iter_content(chunk_size=16 * 1024):
+            buffer.write(chunk)
+            if buffer.tell() >= size:
+                break
+    finally:
+        r.close()
+
+    prefix = buffer.getvalue()[:size]
+    metrics.current.record_bytes(len(prefix))
+    return prefix, r
+
+
+def _raise_for_transient_status(r):
+    """Helper function. Raises an `HTTPError` for responses with transient error codes."""
+    if r.status_code in TRANSIENT_STATUS_CODES:
+        r.raise_for_status()
+    return r
+
+
+def get_with_retries(uri, **kwargs):
+    """
+    Makes a rate-limited GET request, retrying it if it fails transiently. See further `with_retries`.
+    """
+    return with_retries(lambda: _raise_for_transient_status(get(uri, **kwargs)), uri)
+
+
+def head_with_retries(uri, **kwargs):
+    """
+    Makes a rate-limited HEAD request, retrying it if it fails transiently. See further `with_retries`.
+    """
+    return with_retries(lambda: _raise_for_transient_status(head(uri, **kwargs)), uri)
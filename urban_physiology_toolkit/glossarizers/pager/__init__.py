@@ -1 +1,31 @@
-from .pager import *
+"""
+Pagers: scrapers for metadata which portals display on their landing pages but do not expose via an API.
+
+There are two of them. The embedded state pager (`embedded`) reads the data a landing page embeds in its initial HTML
+payload, and needs nothing more than a plain HTTP request. The Selenium pager (`pager`) loads the landing page in a
+headless browser instead, and is used as a fallback. Since the Selenium pager starts up a browser as soon as it is
+imported, it is only loaded the first time one of its members is asked for.
+"""
+
+import importlib
+import sys
+
+from .exceptions import DeletedEndpointException, EmbeddedStateException
+from .embedded import *
+
+_SELENIUM_PAGER = __name__ + ".pager"
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    selenium_pager = importlib.import_module(_SELENIUM_PAGER)
+    return selenium_pager if name == "pager" else getattr(selenium_pager, name)
+
+
+def quit_driver():
+    """
+    Shuts down the Selenium pager's headless browser, if one was ever started.
+    """
+    if _SELENIUM_PAGER in sys.modules:
+        sys.modules[_SELENIUM_PAGER].driver.quit()
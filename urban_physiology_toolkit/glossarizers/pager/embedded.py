@@ -0,0 +1,110 @@
+"""
+Browser-free Socrata pager.
+
+Socrata dataset landing pages are rendered client-side, but the state they are rendered from is embedded as JSON in
+the initial HTML payload, in a script assigning it to an `initialState` variable. That state includes everything the
+Selenium pager waits on the browser for---the row count, the column list, and blob download links---so in most cases
+a plain HTTP request for the landing page is all we need.
+
+The embedded state is an implementation detail of Socrata's front end, not a published API, so it may change out from
+under us. Whenever it cannot be found or does not have the shape we expect, an `EmbeddedStateException` is raised, and
+callers should fall back to the Selenium pager.
+"""
+
+import json
+import re
+import urllib.parse
+
+from urban_physiology_toolkit.glossarizers import network
+from urban_physiology_toolkit.glossarizers.pager.exceptions import DeletedEndpointException, EmbeddedStateException
+
+__all__ = ['parse_socrata_landing_page_state', 'fetch_socrata_landing_page_state',
+           'page_socrata_state_for_endpoint_size', 'page_socrata_state_for_resource_link']
+
+_INITIAL_STATE_ASSIGNMENT = re.compile(r"(?:\bvar\s+|\bwindow\.)initialState\s*=\s*")
+
+
+def parse_socrata_landing_page_state(html):
+    """
+    Given the HTML contents of a Socrata landing page, returns the `view` part of the state embedded in it.
+    """
+    match = _INITIAL_STATE_ASSIGNMENT.search(html)
+    if match is None:
+        raise EmbeddedStateException("No embedded state was found in the landing page.")
+
+    try:
+        state, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        raise EmbeddedStateException("The state embedded in the landing page could not be parsed.")
+
+    if not isinstance(state, dict) or not isinstance(state.get('view'), dict):
+        raise EmbeddedStateException("The state embedded in the landing page has an unexpected format.")
+
+    return state['view']
+
+
+def fetch_socrata_landing_page_state(domain, uri, timeout=10):
+    """
+    Fetches the Socrata landing page at the given URI and returns the `view` part of the state embedded in it.
+
+    Socrata redirects requests for deleted (or private) endpoints to the portal homepage; when this happens, a
+    `DeletedEndpointException` is raised. See the notes in `socrata.write_glossary` on which `domain` to use.
+    """
+    r = network.get_with_retries(uri, timeout=timeout)
+
+    # Make sure that the endpoint hasn't been deleted.
+    if r.url.rstrip("/") == "https://" + domain:
+        raise DeletedEndpointException
+
+    if r.status_code != 200:
+        raise EmbeddedStateException("The landing page responded with a {0} status code.".format(r.status_code))
+
+    return parse_socrata_landing_page_state(r.text)
+
+
+def _count_columns(view):
+    """Helper function. Counts the user-facing columns of a view, excluding system columns like ":id"."""
+    return len([c for c in view['columns'] if not c.get('fieldName', '').startswith(':')])
+
+
+def page_socrata_state_for_endpoint_size(domain, uri, timeout=10):
+    """
+    Given the domain and URI of a table on a Socrata portal, returns information on the number of rows and columns
+    thereof, read from the state embedded in its landing page. Browser-free counterpart to
+    `pager.page_socrata_for_endpoint_size`.
+    """
+    view = fetch_socrata_landing_page_state(domain, uri, timeout=timeout)
+
+    try:
+        rows, columns = view['rowCount'], _count_columns(view)
+    except (KeyError, TypeError):
+        raise EmbeddedStateException("{0} could not be processed because the embedded state has probably "
+                                     "changed.".format(uri))
+    if not isinstance(rows, int):
+        raise EmbeddedStateException("{0} does not have a row count in its embedded state.".format(uri))
+
+    return {'rows': rows, 'columns': columns}
+
+
+def page_socrata_state_for_resource_link(domain, uri, timeout=10):
+    """
+    Given the domain and URI of a link or blob on a Socrata portal, returns a download link for that resource, read
+    from the state embedded in its landing page. Browser-free counterpart to `pager.page_socrata_for_resource_link`.
+    """
+    view = fetch_socrata_landing_page_state(domain, uri, timeout=timeout)
+
+    # Blobs are files uploaded to the portal itself.
+    if view.get('blobId'):
+        filename = urllib.parse.quote(view.get('blobFilename') or view['blobId'])
+        return "https://{0}/api/views/{1}/files/{2}?filename={3}".format(domain, view['id'], view['blobId'],
+                                                                         filename)
+
+    # Links (hrefs) point elsewhere. The portal lists them as "access points", keyed by format; we take the first one.
+    metadata = view.get('metadata') or dict()
+    urls = list((metadata.get('accessPoints') or dict()).values())
+    for additional_access_point in metadata.get('additionalAccessPoints') or []:
+        urls += list((additional_access_point.get('urls') or dict()).values())
+    if urls:
+        return urls[0]
+
+    raise EmbeddedStateException("{0} has no download link in its embedded state.".format(uri))
@@ -0,0 +1,12 @@
+"""
+Errors raised by the pagers.
+"""
+
+
+# Errors for throwing.
+class DeletedEndpointException(Exception):
+    pass
+
+
+class EmbeddedStateException(Exception):
+    pass
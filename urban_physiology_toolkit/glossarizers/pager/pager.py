@@ -44,21 +44,58 @@ from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException  # WebDriverException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException  # WebDriverException
+import time
+
+from urban_physiology_toolkit.glossarizers.network import limiter
+from urban_physiology_toolkit.glossarizers.pager.exceptions import DeletedEndpointException
 
 
 driver = webdriver.PhantomJS()
 
 
-# Errors for throwing.
-class DeletedEndpointException(Exception):
-    pass
+class metadata_pairs_loaded:
+    """
+    A Selenium wait condition which is met once the "What's in this Dataset?" block of a Socrata landing page has at
+    least `n` metadata pairs with non-empty keys and values loaded into it, including every key in `required`.
+
+    The DOM is re-queried every time the condition is checked, so pairs which are still moving over the pipe when we
+    start waiting are picked up as soon as they arrive. Once met, the condition returns the pairs as a dict, keyed by
+    lowercased metadata key.
+    """
+    def __init__(self, n=2, required=('rows', 'columns')):
+        self.n = n
+        self.required = required
+
+    def __call__(self, driver):
+        dataset_contents_list = driver.find_elements_by_class_name('dataset-contents')
+        if len(dataset_contents_list) != 1:
+            return False
+
+        pairs = dict()
+        for m in dataset_contents_list[0].find_elements_by_class_name('metadata-pair'):
+            keys = m.find_elements_by_class_name('metadata-pair-key')
+            values = m.find_elements_by_class_name('metadata-pair-value')
+            if len(keys) == 0 or len(values) == 0:
+                continue
+
+            key, value = keys[0].text.strip(), values[0].text.strip()
+            if key and value:
+                pairs[key.lower()] = value
+
+        if len(pairs) >= self.n and all(key in pairs for key in self.required):
+            return pairs
+        else:
+            return False
 
 
 def page_socrata(domain, uri, condition=EC.presence_of_element_located((By.CLASS_NAME, "dataset-contents")),
-                 timeout=10):
+                 timeout=10, timings=None):
     """
     Returns the portal page HTML contents in a Selenium webdriver. Waits until the specified condition is True.
+
+    If a `timings` dict is passed, the number of seconds spent loading the page (`load`) and waiting on the condition
+    (`condition`) are recorded in it.
     """
     # Choose a condition as close to the target elements of interest as possible. Failures may occur when a partial page
     # load occurs if that page load includes the conditioned element but not the targeted element. See further the
@@ -84,27 +121,47 @@ def page_socrata(domain, uri, condition=EC.presence_of_element_located((By.CLASS
     # except WebDriverException:
     #     driver = webdriver.PhantomJS()
     #     driver.get(uri)
+    timings = dict() if timings is None else timings
+
+    # Page loads are held to the same per-host rate limit as every other request we make.
+    limiter.acquire(uri)
+    start = time.time()
     driver.get(uri)
+    timings['load'] = time.time() - start
 
     try:
         # Make sure that the endpoint hasn't been deleted.
         if driver.current_url == "https://" + domain + "/":
             raise DeletedEndpointException
-        WebDriverWait(driver, timeout).until(
-            condition
-        )
+        start = time.time()
+        try:
+            WebDriverWait(driver, timeout).until(
+                condition
+            )
+        finally:
+            timings['condition'] = time.time() - start
+        limiter.speed_up(uri)
         return driver
     except TimeoutException:
+        # The browser gives us no status codes to go on, but a page which fails to load in time is our best signal
+        # that the portal is throttling us.
+        limiter.slow_down(uri)
         raise TimeoutException("{0} could not be processed within {1} seconds. The server was likely too slow to "
                                "respond".format(uri, timeout))
 
 
-def page_socrata_for_endpoint_size(domain, uri, timeout=10):
+def page_socrata_for_endpoint_size(domain, uri, timeout=10, timings=None):
     """
     Given the domain and URI of a table on a Socrata portal, returns information on the number of rows and columns
     thereof, if that information can be had within the allotted timeout.
+
+    If a `timings` dict is passed, the number of seconds spent in each phase of the scrape are recorded in it: loading
+    the page (`load`), waiting for the dataset contents block to appear (`condition`), and waiting for the sizing
+    information to be filled into that block (`metadata`).
     """
-    driver = page_socrata(domain, uri, timeout=timeout)
+    timings = dict() if timings is None else timings
+    start = time.time()
+    driver = page_socrata(domain, uri, timeout=timeout, timings=timings)
 
     # Now pull out the DOM element containing the desired sizing information.
     dataset_contents_list = driver.find_elements_by_class_name('dataset-contents')
@@ -112,39 +169,28 @@ def page_socrata_for_endpoint_size(domain, uri, timeout=10):
     if len(dataset_contents_list) != 1:
         raise ValueError("{0} could not be processed because the portal UI has probably changed.".format(uri))
 
-    metadata_pairs = dataset_contents_list[0].find_elements_by_class_name('metadata-pair')
-
-    # Again we assert that we have the information that we need. However, it's important to note that in some cases,
-    # there are *more* than two elements in the "What's in this Dataset?" content block. I'm not at all sure what
-    # the rules for this are, but compare one without extras:
+    # It's important to note that in some cases, there are *more* than two elements in the "What's in this Dataset?"
+    # content block. I'm not at all sure what the rules for this are, but compare one without extras:
     # https://data.cityofnewyork.us/Public-Safety/NYPD-Motor-Vehicle-Collisions/h9gi-nx95
     # With one that has them:
     # https://data.cityofnewyork.us/Housing-Development/Housing-New-York-Units-by-Building/hg8x-zxpr
     # That's ok. We'll include that data but ignore it in the read script itself.
 
-    # It's difficult to design a wait condition that will guarantee that the metadata-pair element that we
-    # need is loaded onto the page (and not still moving over the pipe). Socrata uses AJAX, and makes no
-    # guarantees that one part of the screen will load before or after another. Checking that the metadata-pair
-    # parent element is present is sufficient in 95% of cases, but for the remaining cases I've not yet found
-    # a better way than just polling whether or not the deal is done using time.sleep.
-
-    # Socrata portals appear to heavily throttle page requests, even 10-second intervals are insufficient at times.
-    import time
-    for i in range(0, 100):
-        if len(metadata_pairs) < 2:
-            time.sleep(0.1)
-        else:
-            break
-
-    if len(metadata_pairs) < 2:
+    # The dataset contents block being present does not guarantee that the metadata pairs we need are loaded into it:
+    # Socrata uses AJAX, and makes no guarantees that one part of the screen will load before or after another. So we
+    # wait on the pairs themselves, for whatever is left of the timeout. Socrata portals appear to heavily throttle
+    # page requests, so this may take a while.
+    remaining = max(timeout - (time.time() - start), 0)
+    metadata_start = time.time()
+    try:
+        rowcol = WebDriverWait(driver, remaining, poll_frequency=0.1,
+                               ignored_exceptions=[StaleElementReferenceException]).until(metadata_pairs_loaded())
+    except TimeoutException:
+        limiter.slow_down(uri)
         raise TimeoutException("{0} could not be processed to get file size within the {1} seconds allotted. Either "
                                "the server was too slow or the portal UI has changed.".format(uri, timeout))
-
-    rowcol = dict()
-    for m in metadata_pairs:
-        key = m.find_element_by_class_name('metadata-pair-key').text
-        value = m.find_element_by_class_name('metadata-pair-value').text
-        rowcol.update({key.lower(): value})
+    finally:
+        timings['metadata'] = time.time() - metadata_start
 
     # Convert to a machine format. 342K -> 342000, 1M -> 1000000
     rowcol['columns'] = int(rowcol['columns'])
@@ -161,14 +207,15 @@ def page_socrata_for_endpoint_size(domain, uri, timeout=10):
     return rowcol
 
 
-def page_socrata_for_resource_link(domain, uri, timeout=10):
+def page_socrata_for_resource_link(domain, uri, timeout=10, timings=None):
     """
     Given the domain and URI of a link or blob on a Socrata portal, returns a download link for that resource,
-    assuming that it can be had within the timeout allotted.
+    assuming that it can be had within the timeout allotted. If a `timings` dict is passed, wait times are recorded
+    in it, as in `page_socrata`.
     """
     # Unlike dataset size the download button is isolated to a unique element that can always be waited on.
     condition = EC.presence_of_element_located((By.CLASS_NAME, "download-buttons"))
-    driver = page_socrata(domain, uri, condition=condition, timeout=timeout)
+    driver = page_socrata(domain, uri, condition=condition, timeout=timeout, timings=timings)
 
     # Now pull out the DOM element containing the link.
     download_placard = driver.find_elements_by_class_name('download-buttons')
@@ -0,0 +1,185 @@
+"""
+Remote ZIP archive inspection.
+
+Sizing an archive resource means listing its members, which `datafy` does by downloading and extracting the whole
+thing. But a ZIP archive keeps a listing of its members---the central directory---at its very end, along with their
+names and their compressed and uncompressed sizes. When a server supports HTTP `Range` requests, fetching the end of
+the central directory record and the central directory itself, typically a few kilobytes, is all that sizing an
+archive takes, however large it is.
+
+`RemoteFile` is a read-only, seekable file object backed by `Range` requests, which `zipfile` does the actual parsing
+of ZIP (and ZIP64) structures through. Servers which do not honor `Range` requests raise a
+`RangeNotSupportedException`, in which case callers should fall back to a full download.
+"""
+
+import io
+import mimetypes
+import re
+import urllib.parse
+import zipfile
+
+from urban_physiology_toolkit.glossarizers import fingerprint, metrics, network
+
+# The end of central directory record is 22 bytes long, and may be followed by a comment of up to 65535 bytes. Fetching
+# this much of the end of the file up front finds it in a single request (and, for small archives, the central
+# directory along with it).
+TAIL_SIZE = 22 + 65535
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+_ZIP_URI = re.compile(r"\.zip(\W|$)|application/zip")
+
+
+# Errors for throwing.
+class RangeNotSupportedException(Exception):
+    pass
+
+
+def looks_like_zip(uri):
+    """
+    Returns whether or not the given URI looks like it points to a ZIP archive, going by its path and query string
+    (Socrata blob links, for example, carry a `filename` parameter).
+    """
+    return _ZIP_URI.search(urllib.parse.unquote(uri).lower()) is not None
+
+
+class RemoteFile(io.RawIOBase):
+    """
+    A read-only, seekable file object for a remote resource, reading the byte ranges asked of it using HTTP `Range`
+    requests. Every range fetched is kept, so reading it again is free.
+
+    Parameters
+    ----------
+    uri: str, required
+        The resource URI.
+    timeout: int, default 60
+        The timeout on each request.
+    tail_size: int, default `TAIL_SIZE`
+        The number of bytes at the end of the resource to fetch up front. This first request also tells us the size
+        of the resource.
+    """
+    def __init__(self, uri, timeout=60, tail_size=TAIL_SIZE):
+        super().__init__()
+        self.uri = uri
+        self.timeout = timeout
+        self.segments = []
+        self.position = 0
+        self.size = None
+        self.bytes_fetched = 0
+        self._fetch("bytes=-{0}".format(tail_size))
+
+    def _fetch(self, byte_range):
+        """Helper function. Fetches the given byte range, keeping it."""
+        r = network.get(self.uri, headers={'Range': byte_range, 'Accept-Encoding': 'identity'}, stream=True,
+                        timeout=self.timeout)
+        try:
+            if r.status_code == 416 and self.size is None:
+                # Asking for more of the end of the file than exists is fine for most servers, but not all.
+                raise RangeNotSupportedException("{0} refused a suffix range request.".format(self.uri))
+            if r.status_code != 206:
+                r.raise_for_status()
+                raise RangeNotSupportedException("{0} does not support range requests.".format(self.uri))
+
+            match = _CONTENT_RANGE.match(r.headers.get('Content-Range', ""))
+            if match is None:
+                raise RangeNotSupportedException("{0} responded with an unreadable Content-Range.".format(self.uri))
+            start, end, size = (int(group) for group in match.groups())
+
+            data = r.content
+        finally:
+            r.close()
+
+        if len(data) != end - start + 1:
+            raise RangeNotSupportedException("{0} responded with a malformed range.".format(self.uri))
+
+        metrics.current.record_bytes(len(data))
+        self.bytes_fetched += len(data)
+        self.size = size
+        self.segments.append((start, data))
+        return start, data
+
+    def _read_range(self, start, n):
+        """Helper function. Returns `n` bytes starting at `start`, fetching them if they have not been already."""
+        for segment_start, segment in self.segments:
+            if segment_start <= start and start + n <= segment_start + len(segment):
+                return segment[start - segment_start:start - segment_start + n]
+
+        segment_start, segment = self._fetch("bytes={0}-{1}".format(start, start + n - 1))
+        return segment[start - segment_start:start - segment_start + n]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({0}).".format(whence))
+
+        if self.position < 0:
+            raise OSError("Cannot seek to a negative position.")
+        return self.position
+
+    def readinto(self, b):
+        n = min(len(b), max(self.size - self.position, 0))
+        if n == 0:
+            return 0
+
+        data = self._read_range(self.position, n)
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def list_remote_zip(uri, timeout=60):
+    """
+    Lists the members of the remote ZIP archive at the given URI, reading only its central directory.
+
+    Returns a list of `zipfile.ZipInfo` objects, one per member (directories excluded). Raises a
+    `RangeNotSupportedException` if the server does not support `Range` requests, and a `zipfile.BadZipFile` if the
+    resource is not a ZIP archive.
+    """
+    with RemoteFile(uri, timeout=timeout) as remote_file:
+        with zipfile.ZipFile(remote_file) as z:
+            return [info for info in z.infolist() if not info.is_dir()]
+
+
+def size_up_remote_zip(uri, timeout=60):
+    """
+    Returns sizing information on the members of the remote ZIP archive at the given URI, in the format of
+    `utils.get_sizings`, reading only its central directory. Types are guessed from member filenames.
+
+    Each entry is of the following format:
+
+        {'filesize': float, 'compressed_filesize': float, 'dataset': str, 'mimetype': str, 'extension': str,
+         'fingerprint': dict}
+
+    Where `filesize` is the member's uncompressed size and `compressed_filesize` is its size within the archive, both
+    in KB, and `fingerprint` is that of the archive as a whole (see `fingerprint.fingerprint_members`). Raises the same
+    errors as `list_remote_zip`.
+    """
+    infos = list_remote_zip(uri, timeout=timeout)
+    archive_fingerprint = fingerprint.fingerprint_members(infos)
+
+    sizings = []
+    for info in infos:
+        mimetype, _ = mimetypes.guess_type(info.filename, strict=False)
+        extension = info.filename.rsplit(".", 1)[-1].lower() if "." in info.filename.split("/")[-1] else None
+        sizings.append({
+            'filesize': info.file_size / 1024,
+            'compressed_filesize': info.compress_size / 1024,
+            'dataset': info.filename,
+            'mimetype': mimetype or 'application/octet-stream',
+            'extension': extension,
+            'fingerprint': archive_fingerprint
+        })
+    return sizings
@@ -0,0 +1,157 @@
+"""
+Row and column estimation for delimited (CSV and TSV) resources, from a sample of their first few kilobytes.
+
+Socrata tells us how many rows and columns its tables have, but other portals do not, and downloading whole files just
+to count their lines is what we are trying to avoid. Instead we fetch a prefix of the file---using a `Range` request
+if the server supports it, and cutting the download short if it does not---parse its header and the rows that follow,
+and extrapolate the number of rows from the total size of the file, as given by its headers.
+
+Estimates carry a `rows_confidence` of:
+
+* "exact", if the prefix is the whole file, in which case nothing was estimated.
+* "high", if the sample has at least `MIN_CONFIDENT_ROWS` rows whose lengths vary little.
+* "low", otherwise (few rows, or rows of very uneven length).
+
+If the total size of the file is not known, only the columns are known, and `rows` is left `None`.
+"""
+
+import csv
+import io
+import statistics
+import warnings
+
+import requests
+
+from urban_physiology_toolkit.glossarizers import network
+
+SAMPLE_SIZE = 64 * 1024
+PREVIEW_ROWS = 5
+
+# The least number of sampled rows, and the greatest coefficient of variation in their lengths, of a confident estimate.
+MIN_CONFIDENT_ROWS = 100
+MAX_CONFIDENT_VARIATION = 0.5
+
+DELIMITERS = {'csv': ",", 'tsv': "\t"}
+MIMETYPE_FORMATS = {'text/csv': 'csv', 'application/csv': 'csv', 'text/tab-separated-values': 'tsv'}
+
+
+def delimiter_for(entry):
+    """
+    Returns the delimiter of the given glossary entry's resource, going by its `preferred_format` and
+    `preferred_mimetype`, or `None` if it is not a delimited file.
+    """
+    fmt = entry.get('preferred_format')
+    if fmt is None and entry.get('preferred_mimetype'):
+        fmt = MIMETYPE_FORMATS.get(entry['preferred_mimetype'].split(";")[0].strip().lower())
+    return DELIMITERS.get(fmt.lower()) if fmt else None
+
+
+def fetch_prefix(uri, size=SAMPLE_SIZE, timeout=60):
+    """
+    Fetches the first `size` bytes of the resource at the given URI, using a `Range` request, or by cutting the
+    download short if the server ignores it.
+
+    Returns a `(prefix, total_size, complete)` tuple. `total_size` is the size of the resource in bytes, from the
+    `Content-Range` or `Content-Length` header, or `None` if neither tells us. `complete` is whether or not the prefix
+    is the entire resource.
+    """
+    prefix, r = network.get_prefix(uri, size, timeout=timeout)
+
+    total_size = None
+    if r.status_code == 206:
+        total = r.headers.get('Content-Range', "").rpartition("/")[2]
+        total_size = int(total) if total.isdigit() else None
+    elif 'Content-Length' in r.headers and 'Content-Encoding' not in r.headers:
+        # The length of an encoded (e.g. gzipped) body is not the length of the file.
+        total_size = int(r.headers['Content-Length'])
+
+    complete = len(prefix) < size or (total_size is not None and len(prefix) >= total_size)
+    return prefix, total_size, complete
+
+
+def estimate_shape(prefix, total_size=None, complete=False, delimiter=",", encoding="utf-8"):
+    """
+    Estimates the shape of a delimited file from a prefix of it. The first row is taken to be the header.
+
+    Parameters
+    ----------
+    prefix: bytes, required
+        The beginning of the file.
+    total_size: int, optional
+        The size of the entire file, in bytes. Without it, rows cannot be estimated.
+    complete: bool, default False
+        Whether or not the prefix is the entire file.
+    delimiter: str, default ","
+        The field delimiter.
+    encoding: str, default "utf-8"
+        The text encoding of the file.
+
+    Returns
+    -------
+    A dict of the following format:
+
+        {'rows': int, 'columns': int, 'column_names': list, 'rows_confidence': str, 'preview': list}
+
+    Where `preview` is a list of the first `PREVIEW_ROWS` rows after the header, each a list of field values.
+    """
+    lines = prefix.decode(encoding, errors="replace").splitlines(keepends=True)
+    if not complete and lines and not lines[-1].endswith(("\n", "\r")):
+        # The last line was cut off.
+        lines = lines[:-1]
+
+    records = list(csv.reader(io.StringIO("".join(lines)), delimiter=delimiter))
+    records = [record for record in records if record]
+    if not records:
+        return {'rows': 0 if complete else None, 'columns': 0 if complete else None, 'column_names': [],
+                'rows_confidence': "exact" if complete else None, 'preview': []}
+
+    header, body = records[0], records[1:]
+    shape = {'columns': len(header), 'column_names': header, 'preview': body[:PREVIEW_ROWS]}
+
+    if complete:
+        shape.update({'rows': len(body), 'rows_confidence': "exact"})
+    elif total_size is None or not body:
+        shape.update({'rows': None, 'rows_confidence': None})
+    else:
+        # Extrapolate from the average row size. Quoted fields may span lines, so divide by records, not lines.
+        header_size = len(lines[0].encode(encoding))
+        body_size = sum(len(line.encode(encoding)) for line in lines[1:])
+        rows = round((total_size - header_size) / (body_size / len(body)))
+
+        line_lengths = [len(line) for line in lines[1:]]
+        variation = statistics.pstdev(line_lengths) / statistics.mean(line_lengths) if line_lengths else 0
+        confident = len(body) >= MIN_CONFIDENT_ROWS and variation <= MAX_CONFIDENT_VARIATION
+        shape.update({'rows': max(rows, len(body)), 'rows_confidence': "high" if confident else "low"})
+
+    return shape
+
+
+def sample(uri, delimiter=",", total_size=None, timeout=60, size=SAMPLE_SIZE):
+    """
+    Estimates the shape of the delimited file at the given URI from its first `size` bytes. If `total_size` is given it
+    takes precedence over the size given by the server. See further `fetch_prefix` and `estimate_shape`.
+    """
+    prefix, fetched_total_size, complete = fetch_prefix(uri, size=size, timeout=timeout)
+    total_size = total_size if total_size is not None else fetched_total_size
+    return estimate_shape(prefix, total_size=total_size, complete=complete, delimiter=delimiter)
+
+
+def sample_glossary_entry(entry, total_size=None, timeout=60):
+    """
+    Fills in the `rows`, `columns`, `column_names`, `rows_confidence`, and `preview` fields of the given glossary
+    entry, if it is a single delimited file. Sampling is best-effort: if it fails, a warning is raised and the entry
+    is left as-is.
+    """
+    delimiter = delimiter_for(entry)
+    if delimiter is None or entry.get('dataset', '.') != '.':
+        return entry
+
+    try:
+        shape = network.with_retries(lambda: sample(entry['resource'], delimiter=delimiter, total_size=total_size,
+                                                    timeout=timeout), entry['resource'])
+    except (requests.exceptions.RequestException, network.CircuitOpenException, csv.Error) as err:
+        warnings.warn("Couldn't sample the '{0}' resource: {1}".format(entry['resource'], err))
+        return entry
+
+    entry.update(shape)
+    return entry
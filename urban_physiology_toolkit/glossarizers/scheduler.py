@@ -0,0 +1,187 @@
+"""
+Multi-portal scheduler. Runs the resource list and glossary stages of many portals at once, each in its own process,
+under a global worker budget.
+
+Portals are described by a manifest: a JSON list with one entry per portal, of the form:
+
+    {
+        "domain": "data.cityofnewyork.us",
+        "glossarizer": "socrata",
+        "resource_filename": "nyc/resource-list.json",
+        "glossary_filename": "nyc/glossary.json",
+        "credentials": "auth/nyc-open-data.json",
+        "glossary_domain": "opendata.cityofnewyork.us",
+        "timeout": 60,
+        "use_cache": true
+    }
+
+Only `domain`, `glossarizer`, `resource_filename`, and `glossary_filename` are required. `credentials` is only
+meaningful for (and required by) Socrata portals, `protocol` is only meaningful for CKAN portals, and
+`glossary_domain` (the landing page domain, see `socrata.write_glossary`) defaults to `domain`.
+"""
+
+import datetime
+import importlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+GLOSSARIZERS = {
+    'socrata': 'urban_physiology_toolkit.glossarizers.socrata',
+    'ckan': 'urban_physiology_toolkit.glossarizers.ckan',
+    'html': 'urban_physiology_toolkit.glossarizers.html'
+}
+
+REQUIRED_FIELDS = ['domain', 'glossarizer', 'resource_filename', 'glossary_filename']
+
+
+def read_manifest(manifest_filename):
+    """
+    Reads, validates, and returns a portal manifest.
+    """
+    with open(manifest_filename, "r") as fp:
+        manifest = json.load(fp)
+
+    validate_manifest(manifest)
+    return manifest
+
+
+def validate_manifest(manifest):
+    """
+    Validates a portal manifest. Raises a `ValueError` if a portal entry is missing a required field, names an unknown
+    glossarizer, or shares an output file with another portal (two portals writing to the same file would overwrite
+    each other's output).
+    """
+    output_filenames = set()
+    for portal in manifest:
+        missing = [field for field in REQUIRED_FIELDS if field not in portal]
+        if missing:
+            raise ValueError("The manifest entry for {0} is missing the required {1} field(s).".format(
+                portal.get('domain'), ", ".join(missing)))
+
+        if portal['glossarizer'] not in GLOSSARIZERS:
+            raise ValueError("The manifest entry for {0} names an unknown glossarizer, '{1}'. Valid options are "
+                             "{2}.".format(portal['domain'], portal['glossarizer'], ", ".join(GLOSSARIZERS)))
+
+        if portal['glossarizer'] == 'socrata' and 'credentials' not in portal:
+            raise ValueError("The manifest entry for {0} is a Socrata portal, and so requires a credentials "
+                             "file.".format(portal['domain']))
+
+        for field in ['resource_filename', 'glossary_filename']:
+            filename = os.path.abspath(portal[field])
+            if filename in output_filenames:
+                raise ValueError("The {0} output file is shared by multiple portals in the manifest.".format(
+                    portal[field]))
+            output_filenames.add(filename)
+
+
+def run_portal(portal):
+    """
+    Runs the resource list and glossary stages for a single manifest entry, returning a status report for the portal.
+    Errors are caught and recorded in the report, so that one failing portal does not bring down the others.
+    """
+    status = {
+        'domain': portal['domain'],
+        'glossarizer': portal['glossarizer'],
+        'status': 'running',
+        'stage': None,
+        'started': datetime.datetime.now().isoformat(),
+        'finished': None,
+        'elapsed': None,
+        'resources': None,
+        'glossary_entries': None,
+        'error': None
+    }
+    start = time.time()
+
+    try:
+        glossarizer = importlib.import_module(GLOSSARIZERS[portal['glossarizer']])
+        use_cache = portal.get('use_cache', True)
+
+        status['stage'] = 'resource list'
+        resource_list_kwargs = {'domain': portal['domain'], 'filename': portal['resource_filename'],
+                                'use_cache': use_cache}
+        if portal['glossarizer'] == 'socrata':
+            resource_list_kwargs['credentials'] = portal['credentials']
+        elif portal['glossarizer'] == 'ckan' and 'protocol' in portal:
+            resource_list_kwargs['protocol'] = portal['protocol']
+        glossarizer.write_resource_list(**resource_list_kwargs)
+
+        status['stage'] = 'glossary'
+        glossarizer.write_glossary(domain=portal.get('glossary_domain', portal['domain']),
+                                   resource_filename=portal['resource_filename'],
+                                   glossary_filename=portal['glossary_filename'],
+                                   use_cache=use_cache, timeout=portal.get('timeout', 60))
+
+        status['status'] = 'succeeded'
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except Exception as err:
+        status['status'] = 'failed'
+        status['error'] = "".join(traceback.format_exception_only(type(err), err)).strip()
+    finally:
+        status['finished'] = datetime.datetime.now().isoformat()
+        status['elapsed'] = time.time() - start
+
+    for field, key in [('resource_filename', 'resources'), ('glossary_filename', 'glossary_entries')]:
+        if os.path.isfile(portal[field]):
+            with open(portal[field], "r") as fp:
+                status[key] = len(json.load(fp))
+
+    return status
+
+
+def _write_report(report, report_filename):
+    with open(report_filename, "w") as fp:
+        json.dump(report, fp, indent=4)
+
+
+def run_manifest(manifest, workers=4, report_filename=None):
+    """
+    Runs every portal in a manifest, up to `workers` at a time.
+
+    Parameters
+    ----------
+    manifest: str or list, required
+        A path to a manifest file, or an already-loaded manifest. See the module docstring for the format.
+    workers: int, default 4
+        The global worker budget: the maximum number of portals processed at any one time.
+    report_filename: str, optional
+        If provided, a per-portal status report is written to this file. The report is rewritten every time a portal
+        finishes, so it may be inspected while the run is still in progress.
+
+    Returns
+    -------
+    The per-portal status report, as a list of dicts, in manifest order.
+
+    Notes
+    -----
+    Each portal runs in a fresh process (worker processes are never reused). This isolates portals from one another:
+    glossarizers keep module-level state, like the Socrata pager's headless browser, which is not safe to share.
+    """
+    if isinstance(manifest, str):
+        manifest = read_manifest(manifest)
+    else:
+        validate_manifest(manifest)
+
+    report = [{'domain': portal['domain'], 'glossarizer': portal['glossarizer'], 'status': 'pending'}
+              for portal in manifest]
+    if report_filename:
+        _write_report(report, report_filename)
+
+    with multiprocessing.Pool(processes=workers, maxtasksperchild=1) as pool:
+        results = pool.imap_unordered(_run_indexed_portal, enumerate(manifest))
+        for i, status in results:
+            report[i] = status
+            if report_filename:
+                _write_report(report, report_filename)
+
+    return report
+
+
+def _run_indexed_portal(indexed_portal):
+    """Helper function. Runs a portal, keeping track of its place in the manifest."""
+    i, portal = indexed_portal
+    return i, run_portal(portal)
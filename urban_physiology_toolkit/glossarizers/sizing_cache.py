@@ -0,0 +1,222 @@
+"""
+A persistent cache of `utils.get_sizings` results, so that sizing up a resource again (after a `use_cache=False` run,
+say, or after a resource loses its "processed" flag) need not download and inspect it all over again.
+
+Cached sizings are keyed by resource URL, and stored alongside the HTTP validators (`ETag`, `Last-Modified`, and
+`Content-Length`) the resource was served with. Before cached sizings are reused, the resource is revalidated with a
+`HEAD` request: they are reused only if the validators it reports match the stored ones. Resources served without an
+`ETag` or a `Last-Modified` header cannot be revalidated, and so are never cached.
+
+The cache is off by default. To turn it on, set the `UPT_SIZING_CACHE_DIR` environment variable to a folder path, or
+call `enable` with one. Each cached resource is a small JSON file in that folder. Entries older than `MAX_AGE` seconds
+are ignored and evicted, and the oldest entries are evicted whenever the folder grows beyond `MAX_SIZE` bytes.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+from urban_physiology_toolkit import tracing
+from urban_physiology_toolkit.glossarizers import metrics, network
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = "UPT_SIZING_CACHE_DIR"
+
+# Entries older than a month are ignored, and the cache is kept to 64 MB.
+MAX_AGE = 30 * 24 * 60 * 60
+MAX_SIZE = 64 * 1024 * 1024
+
+# The cache folder is swept for evictable entries once every this many writes.
+EVICTION_INTERVAL = 100
+
+# Entries stored in any other format (with fingerprints computed some other way, say) are ignored.
+FORMAT = 2
+
+VALIDATORS = ('ETag', 'Last-Modified', 'Content-Length')
+STRONG_VALIDATORS = ('ETag', 'Last-Modified')
+
+_cache_dir = None
+_caches = dict()
+
+
+def enable(cache_dir):
+    """
+    Turns the sizing cache on, keeping it in the given folder. Takes precedence over the `UPT_SIZING_CACHE_DIR`
+    environment variable.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def disable():
+    """
+    Turns off the sizing cache turned on by `enable`. A cache turned on by the `UPT_SIZING_CACHE_DIR` environment
+    variable stays on.
+    """
+    global _cache_dir
+    _cache_dir = None
+
+
+def cache_dir():
+    """
+    Returns the folder the sizing cache is kept in, or `None` if the cache is off.
+    """
+    return _cache_dir or os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE) or None
+
+
+def current():
+    """
+    Returns the `SizingCache` kept in the current cache folder, or `None` if the cache is off.
+    """
+    folder = cache_dir()
+    if folder is None:
+        return None
+    if folder not in _caches:
+        _caches[folder] = SizingCache(folder)
+    return _caches[folder]
+
+
+def validators_of(headers):
+    """
+    Returns the validators found in the given response headers, as a `{header: value}` dict. Returns `None` if there
+    are not enough of them to revalidate the resource with: that is, neither an `ETag` nor a `Last-Modified` header.
+    """
+    validators = {header: headers[header] for header in VALIDATORS if headers.get(header)}
+    if not any(header in validators for header in STRONG_VALIDATORS):
+        return None
+    return validators
+
+
+def fetch_validators(uri, timeout):
+    """
+    Revalidates a resource with a `HEAD` request, returning its current validators (see `validators_of`). Returns
+    `None` if the request fails, or if the server does not send any usable validators.
+    """
+    try:
+        r = network.head(uri, allow_redirects=True, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None
+    if not r.ok:
+        return None
+    return validators_of(r.headers)
+
+
+class SizingCache:
+    """
+    A folder of cached sizings.
+
+    Parameters
+    ----------
+    folder: str, required
+        The folder to keep the cache in. It is created when the first entry is written, if it does not exist.
+    max_age: int, optional
+        The number of seconds after which cached sizings expire. Defaults to `MAX_AGE`.
+    max_size: int, optional
+        The number of bytes the cache folder may grow to. Defaults to `MAX_SIZE`.
+    clock: callable, optional
+        The time source to use. This exists for testing purposes.
+    """
+    def __init__(self, folder, max_age=MAX_AGE, max_size=MAX_SIZE, clock=time.time):
+        self.folder = folder
+        self.max_age = max_age
+        self.max_size = max_size
+        self.clock = clock
+        self._writes = 0
+
+    def _path(self, uri):
+        return os.path.join(self.folder, hashlib.sha256(uri.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, uri, validators):
+        """
+        Returns the cached sizings for the given resource, if there are any, they have not expired, and they were
+        stored with the given validators. Returns `None` otherwise.
+        """
+        if validators is None:
+            return None
+        try:
+            with open(self._path(uri), "r") as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('format') != FORMAT or entry.get('uri') != uri:
+            return None
+        if self.clock() - entry.get('stored', 0) > self.max_age:
+            return None
+        if entry.get('validators') != validators:
+            return None
+        return entry['sizings']
+
+    def put(self, uri, validators, sizings):
+        """
+        Caches the sizings of the given resource, as served with the given validators. Does nothing if there are no
+        validators to revalidate the cached sizings with later.
+        """
+        if validators is None:
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+        stored = self.clock()
+        path = self._path(uri)
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp_path, "w") as fp:
+            json.dump({'format': FORMAT, 'uri': uri, 'validators': validators, 'stored': stored, 'sizings': sizings},
+                      fp)
+        # Eviction goes by modification time, so that it need not read every entry.
+        os.utime(temp_path, (stored, stored))
+        os.replace(temp_path, path)
+
+        if self._writes % EVICTION_INTERVAL == 0:
+            self.evict()
+        self._writes += 1
+
+    def evict(self):
+        """
+        Evicts expired entries from the cache, and then the oldest remaining entries until the cache fits within its
+        maximum size.
+        """
+        entries = []
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.folder, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = self.clock()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if now - mtime <= self.max_age and size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+
+def cached_sizings(uri, size_up, timeout):
+    """
+    Returns the sizings of the given resource, as computed by the `size_up` callable, consulting the sizing cache (if
+    it is on) first and filling it in afterwards.
+    """
+    cache = current()
+    if cache is None:
+        return size_up(uri)
+
+    with tracing.span("revalidate", "sizing", uri=uri):
+        validators = fetch_validators(uri, timeout)
+    sizings = cache.get(uri, validators)
+    if sizings is not None:
+        metrics.current.record_sizing_cache('hit')
+        return sizings
+
+    metrics.current.record_sizing_cache('miss' if validators is not None else 'uncacheable')
+    sizings = size_up(uri)
+    cache.put(uri, validators, sizings)
+    return sizings
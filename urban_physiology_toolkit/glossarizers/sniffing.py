@@ -0,0 +1,67 @@
+"""
+Early detection of HTML landing pages.
+
+External links very often point at landing pages rather than at data. `datafy` tells us as much, but only after
+downloading the whole page (and spending the resource's timeout budget doing so), after which the glossarizers throw
+the result away. Instead, when a resource's URI does not tell us what kind of file it is, we read its first few
+kilobytes and run the same `magic` type detection `datafy` does on them, along with the `Content-Type` header, and
+abort the transfer right there if it is HTML.
+"""
+
+import mimetypes
+import urllib.parse
+
+from urban_physiology_toolkit.glossarizers import network
+
+SNIFF_SIZE = 4 * 1024
+HTML_MIMETYPES = {'text/html', 'application/xhtml+xml'}
+
+# Query parameters which name the type of the resource served.
+FORMAT_PARAMETERS = {'format'}
+
+
+def needs_sniffing(uri):
+    """
+    Returns whether or not the given URI should be sniffed before it is downloaded: that is, whether it does not name
+    a file of some type other than HTML, whether in its path or in its query string (Socrata blob links, for example,
+    carry a `filename` parameter). A `format` query parameter (as in Socrata geospatial exports, e.g.
+    `?method=export&format=GeoJSON`) names the type just as an extension does; formats which `mimetypes` does not know
+    of are taken not to be HTML.
+    """
+    url = urllib.parse.urlsplit(uri)
+    parameters = urllib.parse.parse_qsl(url.query)
+    candidates = [url.path] + [value for _, value in parameters]
+    for candidate in candidates:
+        mimetype, _ = mimetypes.guess_type(candidate, strict=False)
+        if mimetype is not None:
+            return mimetype in HTML_MIMETYPES
+    for key, value in parameters:
+        if key.lower() in FORMAT_PARAMETERS and value:
+            mimetype, _ = mimetypes.guess_type("resource." + value.lower(), strict=False)
+            return mimetype in HTML_MIMETYPES
+    return True
+
+
+def is_html(prefix, content_type=None):
+    """
+    Returns whether or not the given prefix of a resource, served up with the given `Content-Type`, is HTML.
+    """
+    import magic
+
+    if not prefix:
+        return False
+    guessed = magic.from_buffer(prefix, mime=True)
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    # magic takes a page which starts with a bare fragment for plain text, so markup served as HTML counts too. Anything
+    # else magic recognizes is taken at its word, as datafy does, since servers mislabel data as HTML as well.
+    fragment = guessed == "text/plain" and prefix.lstrip().startswith(b"<")
+    return guessed in HTML_MIMETYPES or (content_type in HTML_MIMETYPES and fragment)
+
+
+def sniff_html(uri, size=SNIFF_SIZE, timeout=60):
+    """
+    Reads the first `size` bytes of the resource at the given URI, and returns whether or not it is HTML. Raises an
+    `HTTPError` if the request fails.
+    """
+    prefix, r = network.get_prefix(uri, size, timeout=timeout)
+    return is_html(prefix, r.headers.get('Content-Type'))
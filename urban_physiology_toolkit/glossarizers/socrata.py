@@ -4,26 +4,129 @@ https://github.com/ResidentMario/urban-physiology-toolkit/wiki/Glossarization-No
 """
 
 import json
-import pandas as pd
-import pysocrata
-from selenium.common.exceptions import TimeoutException
+import time
 from tqdm import tqdm
 
+from urban_physiology_toolkit import profiling, tracing
+from urban_physiology_toolkit.glossarizers import costs, metrics, network
+from urban_physiology_toolkit.glossarizers.budget import RunBudget, within_budget
 from urban_physiology_toolkit.glossarizers.utils import (preexisting_cache, load_glossary_todo,
-                                                         write_resource_file, write_glossary_file, get_sizings)
+                                                         write_resource_file, write_glossary_file, get_sizings,
+                                                         defer, undefer, mark_processed)
+
+
+# Socrata endpoint types, mapped to our vocabulary.
+RESOURCE_TYPES = {'dataset': 'table', 'href': 'link', 'map': 'geospatial dataset', 'file': 'blob'}
+
+
+def _normalize_timestamps(timestamps):
+    """
+    Normalizes a list of timestamp strings into the format `str(pd.Timestamp(...))` writes them in, parsing them all in
+    one go. Internal subroutine of `_resourcify_batch`.
+    """
+    import pandas as pd
+
+    if len(timestamps) > 1:
+        try:
+            return [str(timestamp) for timestamp in pd.to_datetime(pd.Series(timestamps, dtype=object))]
+        except (ValueError, TypeError):
+            pass
+
+    # A lone timestamp is quicker to parse by itself, and timestamps with mixed UTC offsets can't share a column.
+    return [str(pd.Timestamp(timestamp)) for timestamp in timestamps]
+
+
+def _resourcify_batch(records, domain):
+    """
+    Given a list of raw Socrata API metadata records (e.g. a page of catalog API results), and their domain, returns
+    resource-ified entries for the endpoints, for inclusion in the resource listing. Timestamps are normalized for the
+    whole batch at once.
+
+    The download links of blobs and links are not in their metadata, and have to be paged for on their landing pages,
+    which is slow. Their entries are left with a `resource` of `None` instead, and are returned separately, to be
+    resolved afterwards with `_resolve_resource_links`.
+
+    Internal subroutine of `get_resource_list`.
+
+    Parameters
+    ----------
+    records: list, required
+        Socrata portal metadata entries, as returned by the catalog API.
+
+    domain: str, required
+        The Socrata portal domain. See the notes in the `write_resource_list` docstring.
+
+    Returns
+    -------
+    A tuple of two lists of resource list entries: the resolved ones (tables and geospatial datasets), and the ones
+    still needing resolution (blobs and links).
+    """
+    if not records:
+        return [], []
+
+    resources = [metadata['resource'] for metadata in records]
+    created = _normalize_timestamps([resource['createdAt'] for resource in resources])
+    last_updated = _normalize_timestamps([resource['updatedAt'] for resource in resources])
+
+    resolved, unresolved = [], []
+    for i, (metadata, resource) in enumerate(zip(records, resources)):
+        resource_type = RESOURCE_TYPES[resource['type']]
+        endpoint = resource['id']
+
+        # The slug format depends on the API signature, which is in turn dependent on the dataset type.
+        if resource_type == "table":
+            slug = "https://" + domain + "/api/views/" + endpoint + "/rows.csv?accessType=DOWNLOAD"
+        elif resource_type == "geospatial dataset":
+            slug = "https://" + domain + "/api/geospatial/" + endpoint + "?method=export&format=GeoJSON"
+        else:  # resource_type == "blob" or resource_type == "link":
+            slug = None
+
+        # Endpoints which do not have any domain categories assigned to them do not report this field whatsoever in
+        # the API output. To verify this, try inspecting the fields of the data returned from a catalog API query.
+        classification = metadata['classification']
+        topics_provided = [classification['domain_category']] if 'domain_category' in classification else []
+
+        entry = {
+            # The landing_page format is standard.
+            'landing_page': "https://{0}/d/{1}".format(domain, endpoint),
+            'resource': slug,
+            'resource_type': resource_type,
+            'protocol': 'https',
+            'name': resource['name'],
+            'description': resource['description'],
+            'sources': [resource['attribution']],
+            'created': created[i],
+            'last_updated': last_updated[i],
+            'page_views': resource['page_views']['page_views_total'],
+            'column_names': resource['columns_name'],
+            'topics_provided': topics_provided,
+            'keywords_provided': classification['domain_tags'],
+            'flags': []
+        }
+        (resolved if slug is not None else unresolved).append(entry)
+
+    return resolved, unresolved
+
+
+def _resolve_resource_links(entries, domain):
+    """
+    Pages for and fills in the download links of the given blob and link resource entries, as left unresolved by
+    `_resourcify_batch`, yielding each entry as it is resolved.
+    """
+    for entry in entries:
+        entry['resource'] = _page_for_resource_link(domain, entry['landing_page'])
+        yield entry
 
 
 def _resourcify(metadata, domain):
     """
     Given raw Socrata API metadata about a certain endpoint, and its domain, return a resource-ified entry for the
-    endpoint for inclusion in the resource listing.
-
-    Internal subroutine of the user-facing `write_resource_list`.
+    endpoint for inclusion in the resource listing. Single-record wrapper of `_resourcify_batch`.
 
     Parameters
     ----------
     metadata: dict, required
-        A Socrata portal metadata entry, as would be returned (in a list) by `pysocrata.get_datasets`.
+        A Socrata portal metadata entry, as would be returned (in a list) by the catalog API.
 
     domain: str, required
         The Socrata portal domain. See the notes in the `write_resource_list` docstring.
@@ -32,106 +135,173 @@ def _resourcify(metadata, domain):
     -------
     A resource list entry for the given resource.
     """
-    # Munge the Socrata API output a bit beforehand: in this case reworking the name references to match our volcab.
-    type = metadata['resource']['type']
-    volcab_map = {'dataset': 'table', 'href': 'link', 'map': 'geospatial dataset', 'file': 'blob'}
-    resource_type = volcab_map[type]
+    resolved, unresolved = _resourcify_batch([metadata], domain)
+    return resolved[0] if resolved else next(_resolve_resource_links(unresolved, domain))
 
-    # Conditional pager import (this inits PhantomJS, don't necessarily want to if we don't have to).
-    if resource_type == "blob" or resource_type == "link":
-        from .pager import page_socrata_for_resource_link
 
-    endpoint = metadata['resource']['id']
+# The Socrata discovery (catalog) API. The `only` parameter limits results to the endpoint types `_resourcify` knows
+# how to handle, which excludes stories (and charts, filters, and the like) on the server side.
+CATALOG_API_ENDPOINT = "https://api.us.socrata.com/api/catalog/v1"
+CATALOG_API_ENDPOINT_TYPES = "dataset,file,href,map"
 
-    # The landing_page format is standard.
-    landing_page = "https://{0}/d/{1}".format(domain, endpoint)
 
-    # The slug format depends on the API signature, which is in turn dependent on the dataset type.
-    if resource_type == "table":
-        slug = "https://" + domain + "/api/views/" + endpoint + "/rows.csv?accessType=DOWNLOAD"
-    elif resource_type == "geospatial dataset":
-        slug = "https://" + domain + "/api/geospatial/" + endpoint + "?method=export&format=GeoJSON"
-    else:  # endpoint_type == "blob" or endpoint_type == "link":
-        # noinspection PyUnboundLocalVariable
-        slug = page_socrata_for_resource_link(domain, landing_page)
+@profiling.profiled("paging")
+def _page_for_resource_link(domain, landing_page, timeout=10):
+    """
+    Given the domain and landing page of a link or blob on a Socrata portal, returns a download link for that resource.
+    The link is read from the state embedded in the landing page if possible, falling back to the Selenium pager (which
+    starts up PhantomJS on first use) otherwise. Time spent waiting on the pagers is reported to `metrics`.
+    """
+    from requests.exceptions import RequestException
+    from .pager import page_socrata_state_for_resource_link, EmbeddedStateException
 
-    name = metadata['resource']['name']
-    description = metadata['resource']['description']
-    sources = [metadata['resource']['attribution']]
+    timings = dict()
+    start = time.perf_counter()
+    try:
+        with tracing.span("embedded pager", "paging", landing_page=landing_page):
+            return page_socrata_state_for_resource_link(domain, landing_page, timeout=timeout)
+    except (EmbeddedStateException, RequestException):
+        from .pager import page_socrata_for_resource_link
+        with tracing.span("selenium pager", "paging", landing_page=landing_page):
+            return page_socrata_for_resource_link(domain, landing_page, timeout=timeout, timings=timings)
+    finally:
+        timings.setdefault('embedded', time.perf_counter() - start - sum(timings.values()))
+        metrics.current.record_pager_waits(timings)
 
-    created = str(pd.Timestamp(metadata['resource']['createdAt']))
-    last_updated = str(pd.Timestamp(metadata['resource']['updatedAt']))
-    page_views = metadata['resource']['page_views']['page_views_total']
 
-    column_names = metadata['resource']['columns_name']
+@profiling.profiled("paging")
+def _page_for_endpoint_size(domain, landing_page, timeout=10):
+    """
+    Given the domain and landing page of a table on a Socrata portal, returns its number of rows and columns. These are
+    read from the state embedded in the landing page if possible, falling back to the Selenium pager (which starts up
+    PhantomJS on first use) otherwise. Time spent waiting on the pagers is reported to `metrics`.
+    """
+    from requests.exceptions import RequestException
+    from .pager import page_socrata_state_for_endpoint_size, EmbeddedStateException
 
-    # Endpoints which do not have any domain categories assigned to them do not report this field whatsoever in the
-    # API output. To verify this, try inspecting the fields of the data returned from a `pysocrata.get_datasets` run.
+    timings = dict()
+    start = time.perf_counter()
     try:
-        topics_provided = [metadata['classification']['domain_category']]
-    except KeyError:
-        topics_provided = []
-
-    keywords_provided = metadata['classification']['domain_tags']
-
-    return {
-        'landing_page': landing_page,
-        'resource': slug,
-        'resource_type': resource_type,
-        'protocol': 'https',
-        'name': name,
-        'description': description,
-        'sources': sources,
-        'created': created,
-        'last_updated': last_updated,
-        'page_views': page_views,
-        'column_names': column_names,
-        'topics_provided': topics_provided,
-        'keywords_provided': keywords_provided,
-        'flags': []
-    }
+        with tracing.span("embedded pager", "paging", landing_page=landing_page):
+            return page_socrata_state_for_endpoint_size(domain, landing_page, timeout=timeout)
+    except (EmbeddedStateException, RequestException):
+        from .pager import page_socrata_for_endpoint_size
+        with tracing.span("selenium pager", "paging", landing_page=landing_page):
+            return page_socrata_for_endpoint_size(domain, landing_page, timeout=timeout, timings=timings)
+    finally:
+        timings.setdefault('embedded', time.perf_counter() - start - sum(timings.values()))
+        metrics.current.record_pager_waits(timings)
 
 
-def _get_portal_metadata(domain, credentials):
+def _get_portal_metadata_page(domain, token, offset, page_size):
+    """
+    Fetches and returns a single page of portal metadata from the Socrata catalog API. Internal subroutine of
+    `_stream_portal_metadata`.
     """
-    Given a domain, Socrata API credentials for that domain, and a type of endpoint of interest, returns the metadata
-    provided by the portal. Internal subroutine of the user-facing `write_resource_list` method. Wraps
-    `pysocrata.get_datasets`.
+    r = network.get_with_retries(CATALOG_API_ENDPOINT, headers={"X-App-Token": token},
+                                 params={'domains': domain, 'only': CATALOG_API_ENDPOINT_TYPES, 'offset': offset,
+                                         'limit': page_size})
+    r.raise_for_status()
+    return r.json()
+
+
+def _stream_portal_metadata_pages(domain, credentials, page_size=1000, workers=4):
     """
+    Given a domain and Socrata API credentials for that domain, streams the metadata provided by the portal, a page of
+    records at a time. Internal subroutine of the user-facing `write_resource_list` method.
+
+    The first page of results is fetched on its own in order to learn the size of the catalog; the remaining pages are
+    then requested concurrently, using up to `workers` threads, and their records are yielded as each page arrives.
+    Pages will therefore not necessarily be yielded in catalog order.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
     # Load credentials.
     with open(credentials, "r") as fp:
         auth = json.load(fp)
-    auth['domain'] = domain
+    token = auth['token']
+
+    # Socrata's catalog API wraps around to the beginning of the list again when it runs out of endpoints, and is
+    # prone to off-by-one errors at page boundaries, so we keep our own set of endpoints seen thus far. Cf.
+    # https://github.com/ResidentMario/pysocrata/issues/1.
+    seen = set()
+
+    def records(page):
+        kept = []
+        for metadata in page['results']:
+            endpoint = metadata['resource']['id']
+
+            if endpoint in seen:
+                continue
+            seen.add(endpoint)
+
+            # We exclude stories---this is a type of resource the Socrata API considers to be a dataset that we are
+            # not interested in.
+            if metadata['resource']['type'] == 'story':
+                continue
+
+            # We also exclude community-generated datasets.
+            if metadata['resource']['provenance'] == 'community':
+                continue
+
+            kept.append(metadata)
+        return kept
+
+    first_page = _get_portal_metadata_page(domain, token, 0, page_size)
+    yield records(first_page)
+
+    offsets = range(page_size, first_page['resultSetSize'], page_size)
+    if len(offsets) == 0:
+        return
 
-    # If the metadata doesn't already exist, use pysocrata to fetch portal metadata. Otherwise, use what's provided.
-    resources = pysocrata.get_datasets(**auth)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = [executor.submit(_get_portal_metadata_page, domain, token, offset, page_size) for offset in offsets]
+        try:
+            for page in as_completed(pages):
+                yield records(page.result())
+        finally:
+            # If the consumer stops early (or a page fails), don't bother fetching what is left.
+            for page in pages:
+                page.cancel()
 
-    # We exclude stories---this is a type of resource the Socrata API considers to be a dataset that we are not
-    # interested in.
-    resources = [d for d in resources if d['resource']['type'] != 'story']
 
-    # We also exclude community-generated datasets.
-    resources = [r for r in resources if r['resource']['provenance'] != 'community']
+def _stream_portal_metadata(domain, credentials, page_size=1000, workers=4):
+    """
+    Given a domain and Socrata API credentials for that domain, streams the metadata provided by the portal, a record
+    at a time. Record-wise wrapper of `_stream_portal_metadata_pages`.
+    """
+    for page in _stream_portal_metadata_pages(domain, credentials, page_size=page_size, workers=workers):
+        yield from page
 
-    return resources
+
+def _get_portal_metadata(domain, credentials):
+    """
+    Given a domain and Socrata API credentials for that domain, returns the metadata provided by the portal as a list.
+    List-valued wrapper of `_stream_portal_metadata`.
+    """
+    return list(_stream_portal_metadata(domain, credentials))
 
 
 def get_resource_list(domain, credentials):
     """
-    Given a portal domain and login credentials thereof, generate and return a resource list for this domain.
+    Given a portal domain and login credentials thereof, generate a resource list for this domain. This method is a
+    generator: resource entries are yielded as soon as the portal metadata they are built from arrives.
 
     Non-IO subroutine of the user-facing `write_resource_list` method.
     """
-    resources_metadata = _get_portal_metadata(domain, credentials)
-
-    # Convert the pysocrata output to our data representation using resourcify.
-    resources = []
-    for metadata in tqdm(resources_metadata):
-        resources.append(_resourcify(metadata, domain))
+    # Convert the catalog API output to our data representation a page at a time. Blobs and links have to be paged
+    # for, so they are held back until every page has been converted, and come last.
+    unresolved = []
+    for page in _stream_portal_metadata_pages(domain, credentials):
+        resolved, page_unresolved = _resourcify_batch(page, domain)
+        unresolved += page_unresolved
+        yield from resolved
 
-    return resources
+    yield from tqdm(_resolve_resource_links(unresolved, domain), total=len(unresolved))
 
 
+@profiling.profiled("resource-list")
+@tracing.traced("socrata.write_resource_list")
 def write_resource_list(domain="data.cityofnewyork.us", filename="resource-list.json", use_cache=True,
                         credentials=None):
     """
@@ -156,16 +326,14 @@ def write_resource_list(domain="data.cityofnewyork.us", filename="resource-list.
     if preexisting_cache(filename, use_cache):
         return
 
-    # Otherwise generate to file and exit.
-    roi_repr = []
-    roi_repr += get_resource_list(domain, credentials)
-    write_resource_file(roi_repr, filename)
+    # Otherwise generate to file and exit. Resource entries are streamed to disc as they are generated.
+    write_resource_file(get_resource_list(domain, credentials), filename)
 
 
-def _glossarize_table(resource_entry, domain, driver=None, timeout=60):
+def _glossarize_table(resource_entry, domain, quit_driver=True, timeout=60):
     """
-    Given a tabular resource entry, a domain, and a PhantomJS driver, creates and returns a glossary entry for that
-    resource. Internal subroutine to `_write_glossary`.
+    Given a tabular resource entry and a domain, creates and returns a glossary entry for that resource. Internal
+    subroutine to `_write_glossary`.
 
     Parameters
     ----------
@@ -174,10 +342,11 @@ def _glossarize_table(resource_entry, domain, driver=None, timeout=60):
         key.
     domain: str, required
         The open data portal landing page URI. See the `_write_glossary` docstring for particularities.
-    driver: PhantomJS driver, recommended
-        A `selenium` PhantomJS driver. If this parameter is left blank a new driver will be created and then exited
-        out of during the course of running this method. This is useful in testing but heavily inadvisable in
-        production.
+    quit_driver: bool, default True
+        Sizing information is read from the state embedded in the landing page where possible, but if that fails,
+        the Selenium pager is used instead, starting up a PhantomJS driver. If this parameter is left `True` that
+        driver will be exited out of before returning. This is useful in testing but heavily inadvisable in
+        production, where the driver should be kept open across resources.
     timeout: int, default 60
         A timeout on how long the glossarizer can spend attempting to download a Socrata portal dataset landing page
         before giving up. This UI scrape is necessary to "size up" the table and provide `rows` and `columns` fields
@@ -189,18 +358,20 @@ def _glossarize_table(resource_entry, domain, driver=None, timeout=60):
     in the given glossary. If the method fails because the endpoint in question was removed or made private (in
     which case a 301 Redirect to the portal landing page is issued), prints (!) a warning and returns an empty list.
     If the method fails because the headless request to the resource landing page took too long, prints (!) a
-    warning and returns a similarly empty list.
+    warning and returns a similarly empty list. If the portal is down, flags the resource as deferred and returns an
+    empty list.
     """
-    from .pager import page_socrata_for_endpoint_size, DeletedEndpointException
+    from selenium.common.exceptions import TimeoutException
+    from .pager import DeletedEndpointException
 
-    # If a PhantomJS driver has not been initialized (via import), initialize it now.
-    driver_passed = bool(driver)
-    if not driver_passed:
-        from .pager import driver
+    undefer(resource_entry)
 
     # TODO: Raise actual warnings here (instead of emitting print statements).
     try:
-        rowcol = page_socrata_for_endpoint_size(domain, resource_entry['landing_page'], timeout=timeout)
+        rowcol = _page_for_endpoint_size(domain, resource_entry['landing_page'], timeout=timeout)
+    except network.CircuitOpenException:
+        defer(resource_entry)
+        return []
     except DeletedEndpointException:
         print("WARNING: the '{0}' endpoint was deleted.".format(resource_entry['landing_page']))
         resource_entry['flags'].append('removed')
@@ -229,8 +400,9 @@ def _glossarize_table(resource_entry, domain, driver=None, timeout=60):
     # If a fatal error was caught the data gets sent to the outer (`get_glossary`) finally block.
     glossarized_resource['dataset'] = '.'
 
-    if not driver_passed:
-        driver.quit()
+    if quit_driver:
+        from .pager import quit_driver as quit_pager_driver
+        quit_pager_driver()
 
     return [glossarized_resource]
 
@@ -255,7 +427,7 @@ def _glossarize_nontable(resource_entry, timeout=60):
     -------
     If the method executes successfully, returns a glossary entry for the given resource that is fit for inclusion
     in the given glossary. If the method fails because an error was raised, prints (!) a warning and returns an empty
-    list.
+    list. If the resource's host is down, flags the resource as deferred and returns an empty list.
     """
 
     # TODO: Refactor this convoluted method into a simpler `utils.generic_glossarize_resource` wrapper.
@@ -263,10 +435,14 @@ def _glossarize_nontable(resource_entry, timeout=60):
     import zipfile
     from requests.exceptions import ChunkedEncodingError
 
+    undefer(resource_entry)
+
     try:
-        sizings = get_sizings(
-            resource_entry['resource'], timeout=timeout
-        )
+        sizings = network.with_retries(lambda remaining: get_sizings(resource_entry['resource'], timeout=remaining),
+                                       resource_entry['resource'], timeout=timeout)
+    except network.CircuitOpenException:
+        defer(resource_entry)
+        return []
     except zipfile.BadZipfile:
         # cf. https://github.com/ResidentMario/datafy/issues/2
         # print("WARNING: the '{0}' endpoint is either misformatted or contains multiple levels of "
@@ -322,6 +498,8 @@ def _glossarize_nontable(resource_entry, timeout=60):
                 # If no repairable errors were caught, write in the information.
                 # (if a non-repairable error was caught the data gets sent to the outer finally block)
                 glossarized_resource_element['dataset'] = sizing['dataset']
+                if 'fingerprint' in sizing:
+                    glossarized_resource_element['fingerprint'] = sizing['fingerprint']
 
                 glossarized_resource.append(glossarized_resource_element)
 
@@ -343,46 +521,49 @@ def _glossarize_nontable(resource_entry, timeout=60):
         return [glossarized_resource_element]
 
 
-def get_glossary(resource_list, glossary, domain='opendata.cityofnewyork.us', timeout=60):
+@tracing.traced("socrata.get_glossary")
+def get_glossary(resource_list, glossary, domain='opendata.cityofnewyork.us', timeout=60, priority=None,
+                 history=None, budget=None):
     """
     Given a resource list and an extant glossary, generate and return an updated glossary.
 
+    Resources are glossarized cheapest first, tables and non-tables alike, unless a `priority` function says otherwise
+    (see `costs.schedule`). `history` is a list of past resource timings, as returned by `costs.load_history`.
+    Resources which the `budget` (a `budget.RunBudget`) does not afford are deferred.
+
     Non-IO subroutine of the user-facing `write_glossary` method.
     """
     try:
-        tables = [r for r in resource_list if r['resource_type'] == "table"]
-        nontables = [r for r in resource_list if r['resource_type'] != "table"]
-
-        # tables:
-        from .pager import driver
-
-        for resource in tqdm(tables):
-            glossarized_resource = _glossarize_table(resource, domain, driver=driver)
-            glossary += glossarized_resource
-
-            # Update the resource list to make note of the fact that this job has been processed.
-            if "processed" not in resource['flags']:
-                resource['flags'].append("processed")
-
-        # geospatial datasets, blobs, links:
-        for resource in tqdm(nontables):
-            glossarized_resource = _glossarize_nontable(resource, timeout=timeout)
+        model = costs.CostModel(history, timeout=timeout)
+        scheduled = costs.schedule(resource_list, priority=priority, model=model)
+
+        # Resources on hosts which are down are pushed to the end of the run.
+        for resource in tqdm(within_budget(network.available_first(scheduled), budget, model), total=len(scheduled)):
+            with tracing.span(resource['name'], "resource", resource=resource['resource']), \
+                    metrics.current.measure(resource) as measurement:
+                if resource['resource_type'] == "table":
+                    glossarized_resource = _glossarize_table(resource, domain, quit_driver=False)
+                else:  # geospatial datasets, blobs, links
+                    glossarized_resource = _glossarize_nontable(resource, timeout=timeout)
+                measurement.entries = glossarized_resource
             glossary += glossarized_resource
 
             # Update the resource list to make note of the fact that this job has been processed.
-            if "processed" not in resource['flags']:
-                resource['flags'].append("processed")
+            mark_processed(resource)
 
     # Whether we succeeded or got caught on a fatal error, in either case clean up.
     finally:
         # If a driver was open, close the driver instance.
-        # noinspection PyUnboundLocalVariable
-        driver.quit()  # pager.driver
+        from .pager import quit_driver as quit_pager_driver
+        with tracing.span("quit driver"):
+            quit_pager_driver()
     return resource_list, glossary
 
 
+@profiling.profiled("glossary")
+@tracing.traced("socrata.write_glossary")
 def write_glossary(domain='opendata.cityofnewyork.us', resource_filename=None, glossary_filename=None,
-                   use_cache=True, timeout=60):
+                   use_cache=True, timeout=60, priority=None, time_budget=None, byte_budget=None):
     """
     Use a resource file to write a glossary to disc.
 
@@ -407,17 +588,35 @@ def write_glossary(domain='opendata.cityofnewyork.us', resource_filename=None, g
         A timeout on how long the glossarizer can spend downloading a resource before timing it out. This prevents
         occasional very large datasets from overwhelming your CPU. Resources that time out will be populated in the
         glossary with a `filesize` field indicating how long they were downloading for before timing out.
+    priority: callable, optional
+        A function mapping each resource to a number. Resources with higher priorities are glossarized first;
+        otherwise resources are glossarized cheapest first, going by their types and by the timings recorded in the
+        previous run's metrics summary. See further `costs.schedule`.
+    time_budget: float, optional
+        A wall-clock budget for the run, in seconds. Once the time left is less than a resource is expected to take,
+        it is deferred rather than started. See further `budget`.
+    byte_budget: int, optional
+        A budget on the number of bytes transferred by the run. Once it is spent, all remaining resources are
+        deferred. Deferred resources are flagged as such in the resource file, and are picked up first by the next
+        run.
     """
 
     # Load the glossarization to-do list.
     resource_list, glossary = load_glossary_todo(resource_filename, glossary_filename, use_cache)
+    # The previous run's timings are overwritten by this run's, so read them first.
+    history = costs.load_history(metrics.summary_filename(glossary_filename))
+    metrics.start_run('socrata', domain)
+    budget = RunBudget(seconds=time_budget, bytes=byte_budget)
 
     # Generate the glossaries.
     try:
-        resource_list, glossary = get_glossary(resource_list, glossary, domain=domain,
-                                               timeout=timeout)
+        resource_list, glossary = get_glossary(resource_list, glossary, domain=domain, timeout=timeout,
+                                               priority=priority, history=history, budget=budget)
 
     # Save output.
     finally:
-        write_resource_file(resource_list, resource_filename)
-        write_glossary_file(glossary, glossary_filename)
+        with tracing.span("write resource file", "io"):
+            write_resource_file(resource_list, resource_filename, update=True)
+        with tracing.span("write glossary file", "io"):
+            write_glossary_file(glossary, glossary_filename)
+        metrics.finish_run(glossary_filename)
@@ -5,7 +5,14 @@ Generic methods common across multiple glossarizers.
 import os
 import json
 import errno
+import io
+import itertools
+import math
 import warnings
+import zipfile
+
+from urban_physiology_toolkit import profiling, tracing
+from urban_physiology_toolkit.glossarizers import fingerprint, metrics, network, remote_zip, sizing_cache, sniffing
 
 ############
 # FILE I/O #
@@ -19,26 +26,57 @@ def preexisting_cache(folder_filepath, use_cache):
     return use_cache and os.path.isfile(folder_filepath)
 
 
-def write_resource_file(resource_listings, resource_filename):
+def _dump_json_list(entries, fp):
+    """
+    Writes an iterable of entries to an open file as a JSON list, one entry at a time. The output is identical to
+    that of `json.dump(list(entries), fp, indent=4)`, but the entries never need to be held in memory all at once.
+    """
+    fp.write("[")
+    empty = True
+    for entry in entries:
+        fp.write("\n    " if empty else ",\n    ")
+        fp.write(json.dumps(entry, indent=4).replace("\n", "\n    "))
+        empty = False
+    fp.write("]" if empty else "\n]")
+
+
+def write_resource_file(resource_listings, resource_filename, update=False):
     """
     Writes a resource list to a file. Handles merging duplicate and preexisting records.
+
+    `resource_listings` may be any iterable, including a generator; entries are streamed to disc as they arrive. The
+    output is written to a temporary file first and moved into place once complete, so a failure partway through
+    leaves any preexisting resource file untouched.
+
+    By default, resources already in the file are left as they are, and only new ones are added. If `update` is
+    `True`, resources already in the file are replaced by their counterparts in `resource_listings` instead, so that
+    changes to their flags (made whilst glossarizing them, say) are kept.
     """
     # If a resource file already exists, only write in resources in the current resource listing that do not already
     # exist in the file.
     if os.path.isfile(resource_filename):
         with open(resource_filename, 'r') as fp:
             existing_resources = json.load(fp)
-        existing_resource_uris = {r['resource'] for r in existing_resources}
-        resources_to_be_added = [r for r in resource_listings if r['resource'] not in existing_resource_uris]
 
-        resource_list = existing_resources + resources_to_be_added
-        with open(resource_filename, 'w') as fp:
-            json.dump(resource_list, fp, indent=4)
+        if update:
+            # Updated resources have to be matched to existing ones before anything can be written.
+            updates = {r['resource']: r for r in resource_listings}
+            existing_resources = [updates.pop(r['resource'], r) for r in existing_resources]
+            resources_to_be_added = updates.values()
+        else:
+            existing_resource_uris = {r['resource'] for r in existing_resources}
+            resources_to_be_added = (r for r in resource_listings if r['resource'] not in existing_resource_uris)
+
+        resource_list = itertools.chain(existing_resources, resources_to_be_added)
 
     # If the resource file does not already exist, simply write what we get to file.
     else:
-        with open(resource_filename, 'w') as fp:
-            json.dump(resource_listings, fp, indent=4)
+        resource_list = resource_listings
+
+    temp_filename = resource_filename + ".tmp"
+    with open(temp_filename, 'w') as fp:
+        _dump_json_list(resource_list, fp)
+    os.replace(temp_filename, resource_filename)
 
 
 def write_glossary_file(glossary_repr, glossary_filename):
@@ -76,6 +114,29 @@ def load_glossary_todo(resource_filename, glossary_filename, use_cache=True):
 
     return resource_list, glossary
 
+
+def defer(resource):
+    """
+    Flags a resource as deferred: it could not be processed during this run, and should be picked up by the next one.
+    """
+    if 'deferred' not in resource['flags']:
+        resource['flags'].append('deferred')
+
+
+def undefer(resource):
+    """
+    Clears the deferral flag from a resource which is about to be (re)processed.
+    """
+    resource['flags'] = [flag for flag in resource['flags'] if flag != 'deferred']
+
+
+def mark_processed(resource):
+    """
+    Flags a resource as processed, unless its processing was deferred.
+    """
+    if 'processed' not in resource['flags'] and 'deferred' not in resource['flags']:
+        resource['flags'].append('processed')
+
 ####################
 # SIZING PROCESSES #
 ####################
@@ -132,6 +193,7 @@ def __timeout_process(seconds=10, error_message=os.strerror(errno.ETIME)):
     return decorator
 
 
+@profiling.profiled("sizing")
 def get_sizings(uri, timeout=60):
     """
     Given a URI, attempts to download it within `timeout` seconds. On success, returns size and format information on
@@ -153,11 +215,21 @@ def get_sizings(uri, timeout=60):
     dicts of size and type-related metadata on the downloaded file. Each entry in the list will be of the following
     format:
 
-        {'filesize': int, 'filepath': str, 'mimetype': str, 'extension': str}
+        {'filesize': int, 'filepath': str, 'mimetype': str, 'extension': str, 'fingerprint': dict}
 
     The list will consist of only one entry if the resource contains a single file, and multiple entries if the
-    resource contains many files. Note that as packaged resources may contain metadata and junk files,
-    not just data, the references contained in this list are not datasets *per se*.
+    resource contains many files. Note that as packaged resources may contain metadata and junk files, not just data,
+    the references contained in this list are not datasets *per se*. Every entry carries the same `fingerprint`, that
+    of the resource (see `fingerprint`): for archives, that of the archive, not of the member.
+
+    ZIP archives hosted by servers which support `Range` requests are sized up from their central directory (see
+    `remote_zip`), without downloading them; these entries carry the uncompressed `filesize` of each member, and a
+    `compressed_filesize` as well. Resources which might be HTML landing pages are sniffed first (see `sniffing`); for
+    those that are, a single entry with a `text/html` mimetype and a `None` filesize is returned without the page
+    being downloaded.
+
+    If the sizing cache is on (see `sizing_cache`), and the resource has not changed since it was last sized up,
+    cached sizings are returned instead, at the cost of a single `HEAD` request.
 
     If the download times out, raises a `requests.exceptions.ChunkedEncodingError`, a generic error returned
     whenever `requests` is cut off whilst downloading (see further the `__timeout_process` docstring). All other
@@ -166,20 +238,66 @@ def get_sizings(uri, timeout=60):
     import datafy
     import sys
 
-    @__timeout_process(timeout)
+    # Alarms are set in whole seconds.
+    @__timeout_process(max(int(math.ceil(timeout)), 1))
     def _size_up(uri):
-        resource = datafy.get(uri)
+        # ZIP archives can be sized up from their central directory alone, if the server lets us read just that.
+        if remote_zip.looks_like_zip(uri):
+            try:
+                with tracing.span("central directory", "sizing", uri=uri):
+                    return remote_zip.size_up_remote_zip(uri, timeout=timeout)
+            except (remote_zip.RangeNotSupportedException, zipfile.BadZipFile):
+                pass
+
+        # Links often point at HTML landing pages, which every caller throws away, so don't download those in full.
+        if sniffing.needs_sniffing(uri):
+            with tracing.span("sniff", "sizing", uri=uri):
+                html = sniffing.sniff_html(uri, timeout=timeout)
+            if html:
+                return [{'filesize': None, 'dataset': '.', 'mimetype': 'text/html', 'extension': 'html'}]
+
+        # datafy makes its own requests, so we can only hold it to the host rate limit from the outside.
+        network.limiter.acquire(uri)
+        # datafy returns one response per component: the download itself, for a single file, or a local read of each
+        # member extracted from it, for an archive. Only the download went over the network, so catch it as it comes
+        # in, and hold only it to the rate limiter and the byte count.
+        downloads = []
+
+        def _catch_download(r, *args, **kwargs):
+            if not r.url.startswith("file://"):
+                downloads.append(r)
+
+        hooks = datafy.datafy.requests_session.hooks['response']
+        hooks.append(_catch_download)
+        try:
+            with tracing.span("download", "sizing", uri=uri):
+                resource = datafy.get(uri)
+        finally:
+            hooks.remove(_catch_download)
+        responses = [component['data'] for component in resource]
+        # Redirects are caught on their way to the final response, which comes last.
+        download = downloads[-1] if downloads else responses[0]
+        network.limiter.feedback(uri, download.status_code, download.headers.get('Retry-After'))
+        metrics.current.record_bytes(len(download.content))
+        # datafy happily sizes up error pages, so check that we actually got the resource.
+        download.raise_for_status()
+        # Fingerprint the resource the same way it would be fingerprinted from its central directory or once deposited.
+        if len(resource) == 1 and resource[0]['filepath'] == '.':
+            resource_fingerprint = fingerprint.fingerprint_file(io.BytesIO(responses[0].content))
+        else:
+            resource_fingerprint = fingerprint.fingerprint_member_contents(r.content for r in responses)
         resource_components = []
         for resource_component in resource:
             resource_components.append({
                 'filesize': sys.getsizeof(resource_component['data'].content) / 1024,
                 'dataset': resource_component['filepath'],
                 'mimetype': resource_component['mimetype'],
-                'extension': resource_component['extension']
+                'extension': resource_component['extension'],
+                'fingerprint': resource_fingerprint
             })
         return resource_components
 
-    return _size_up(uri)
+    return sizing_cache.cached_sizings(uri, _size_up, timeout)
 
 
 def generic_glossarize_resource(resource, timeout):
@@ -215,23 +333,30 @@ def generic_glossarize_resource(resource, timeout):
     If the process fails during processing because of bad data formatting in a compressed file, a warning will the
     raised and an "error" string is again appended to the resource flags. An empty list will be returned.
 
+    Downloads which fail transiently are retried (see `network.with_retries`). If the resource's host is down (its
+    circuit breaker is open), a "deferred" string is appended to the resource flags and an empty list is returned.
+
     If the process succeeds, but we discover that our result is an HTML file (this occurs in the case of external
     links to landing pages), an empty list will be returned.
     """
     import zipfile
     from requests.exceptions import ChunkedEncodingError
 
+    undefer(resource)
+
     try:
-        sizings = get_sizings(
-            resource['resource'], timeout=timeout
-        )
+        sizings = network.with_retries(lambda remaining: get_sizings(resource['resource'], timeout=remaining),
+                                       resource['resource'], timeout=timeout)
     except (KeyboardInterrupt, SystemExit):
         raise
+    except network.CircuitOpenException:
+        defer(resource)
+        return resource, []
     except zipfile.BadZipfile:
         # cf. https://github.com/ResidentMario/datafy/issues/2
         warnings.warn("The '{0}' resource is either misformatted or contains multiple levels of "
                       "compression, and failed to process. This resource will be flagged as an error in the "
-                      "resource list".format(resource['landing_page']))
+                      "resource list".format(resource.get('landing_page', resource['resource'])))
         resource['flags'].append('error')
         return resource, []
     # This error is raised when the process takes too long.
@@ -246,7 +371,7 @@ def generic_glossarize_resource(resource, timeout):
         # try to visit them. During testing this occurred with e.g. https://data.cityofnewyork.us/d/sah3-jw2y. It's
         # impossible to exclude everything; best we can do is raise a warning.
         warnings.warn("An error was raised while processing the '{0}' resource. This resource will be flagged as an "
-                      "error in the resource list.".format(resource['landing_page']))
+                      "error in the resource list.".format(resource.get('landing_page', resource['resource'])))
         resource['flags'].append('error')
         return resource, []
 
@@ -285,6 +410,8 @@ def generic_glossarize_resource(resource, timeout):
                 glossarized_resource_element['preferred_format'] = sizing['extension']
                 glossarized_resource_element['preferred_mimetype'] = sizing['mimetype']
                 glossarized_resource_element['dataset'] = sizing['dataset']
+                if 'fingerprint' in sizing:
+                    glossarized_resource_element['fingerprint'] = sizing['fingerprint']
 
                 glossarized_resource.append(glossarized_resource_element)
 
@@ -0,0 +1,334 @@
+"""
+A lease-based work queue, for glossarizing a single portal with many worker processes at once.
+
+`write_glossary` assumes that it is the only process reading from the resource file and writing to the glossary file.
+To spread the glossarization of a large portal over several processes (or machines sharing a filesystem), start
+`run_worker` in each of them instead, pointed at the same resource and glossary files:
+
+    workqueue.run_worker('ckan', domain="data.gov.sg", resource_filename="resource-list.json",
+                         glossary_filename="glossary.json")
+
+The work queue is an SQLite database kept next to the resource file (see `queue_filename`). The first worker to start
+fills it with the resources left to glossarize; the rest find them already there. Each worker then repeatedly claims a
+batch of unclaimed resources, glossarizes them, and records the results in the queue. A claim is a lease, which the
+worker renews in the background for as long as it is working on the batch. If a worker dies, its lease lapses after
+`lease_seconds`, and its batch is reclaimed by another worker.
+
+When a worker runs out of resources to claim, it merges the results recorded so far into the resource and glossary
+files. Merges are serialized by the database lock, and each result is merged exactly once. Once every resource has been
+merged, the queue file may be deleted; a queue which is kept around remembers what it has already processed, even if
+`use_cache` is `False`. Resources which were deferred (because their host was down, say) are merged with their
+"deferred" flag, as `write_glossary` would write them, and are queued up again by the next run.
+
+Each worker writes its own metrics summary, `<glossary>.<worker>.metrics.json`. `costs.load_history` reads these
+along with the usual summary, so the next run is scheduled using the timings of every worker.
+
+SQLite locking relies on the filesystem's own locks, which some network filesystems implement poorly. For that reason
+the queue uses SQLite's default rollback journal, and not its write-ahead log, which requires shared memory.
+"""
+
+import contextlib
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from urban_physiology_toolkit import tracing
+from urban_physiology_toolkit.glossarizers import costs, metrics
+from urban_physiology_toolkit.glossarizers.scheduler import GLOSSARIZERS
+from urban_physiology_toolkit.glossarizers.utils import load_glossary_todo, write_glossary_file, write_resource_file
+
+BATCH_SIZE = 10
+LEASE_SECONDS = 10 * 60
+
+# How long to wait on another process holding the database lock before giving up, in seconds.
+LOCK_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    position INTEGER PRIMARY KEY,
+    uri TEXT UNIQUE NOT NULL,
+    resource TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    entries TEXT
+);
+CREATE INDEX IF NOT EXISTS resources_by_state ON resources (state, position);
+"""
+
+# A resource is 'pending' until it is claimed, 'leased' while a worker holds it, 'done' once its results have been
+# recorded, and 'merged' once those results have been written to the resource and glossary files.
+STATES = ('pending', 'leased', 'done', 'merged')
+
+
+def queue_filename(resource_filename):
+    """
+    Returns the path of the work queue for the given resource file.
+    """
+    return os.path.splitext(resource_filename)[0] + ".queue.sqlite"
+
+
+def default_worker_name():
+    """
+    Returns a name for this worker process which is unique across the machines sharing the queue.
+    """
+    return "{0}-{1}".format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+    A lease-based queue of resources to glossarize, kept in an SQLite database.
+
+    Parameters
+    ----------
+    filename: str, required
+        The path to the queue database. It is created if it does not exist.
+    worker: str, optional
+        The name this worker holds leases under. Defaults to `default_worker_name()`.
+    lease_seconds: int, optional
+        How long a claim on a batch lasts before it must be renewed. Defaults to `LEASE_SECONDS`.
+    clock: callable, optional
+        The time source to use. This exists for testing purposes.
+    """
+    def __init__(self, filename, worker=None, lease_seconds=LEASE_SECONDS, clock=time.time):
+        self.filename = filename
+        self.worker = worker or default_worker_name()
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self._connection = self._connect()
+        self._connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        # Transactions are managed explicitly, with BEGIN IMMEDIATE, so that claims never race one another.
+        return sqlite3.connect(self.filename, timeout=LOCK_TIMEOUT, isolation_level=None)
+
+    @contextlib.contextmanager
+    def _transaction(self, connection=None):
+        connection = connection or self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self):
+        self._connection.close()
+
+    def populate(self, resources):
+        """
+        Adds the given resources to the queue, skipping any which are already in it. Resources which a previous run
+        deferred (see `utils.defer`) are already in the queue, but were never glossarized, so those among the given
+        resources are queued up again. Returns the number of resources added or queued up again.
+        """
+        uris = {resource['resource'] for resource in resources}
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO resources (uri, resource) VALUES (?, ?)",
+                                   ((resource['resource'], json.dumps(resource)) for resource in resources))
+            deferred = [uri for uri, resource in
+                        connection.execute("SELECT uri, resource FROM resources WHERE state = 'merged'")
+                        if uri in uris and 'deferred' in json.loads(resource)['flags']]
+            connection.executemany("UPDATE resources SET state = 'pending', entries = NULL WHERE uri = ?",
+                                   ((uri,) for uri in deferred))
+            return connection.total_changes - before
+
+    def claim(self, size=BATCH_SIZE):
+        """
+        Leases up to `size` resources to this worker, returning them. Resources whose leases have lapsed are reclaimed
+        along with those never claimed, in resource list order. Returns an empty list once there are none left.
+        """
+        now = self.clock()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT position, resource FROM resources "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY position LIMIT ?", (now, size)).fetchall()
+            connection.executemany(
+                "UPDATE resources SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE position = ?", ((self.worker, now + self.lease_seconds, position) for position, _ in rows))
+        return [json.loads(resource) for _, resource in rows]
+
+    def renew(self, connection=None):
+        """
+        Renews every lease held by this worker. Returns the number of leases renewed.
+        """
+        connection = connection or self._connection
+        with self._transaction(connection):
+            return connection.execute(
+                "UPDATE resources SET lease_expires = ? WHERE state = 'leased' AND worker = ?",
+                (self.clock() + self.lease_seconds, self.worker)).rowcount
+
+    @contextlib.contextmanager
+    def heartbeat(self, interval=None):
+        """
+        Renews this worker's leases from a background thread, every `interval` seconds (a third of the lease length, by
+        default), for as long as the context is open. Use as follows:
+
+            with queue.heartbeat():
+                glossarize(queue.claim())
+        """
+        interval = self.lease_seconds / 3 if interval is None else interval
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            # SQLite connections may not be shared between threads.
+            connection = self._connect()
+            try:
+                while not stop.wait(interval):
+                    self.renew(connection)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=renew_until_stopped, name="lease heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, resource, entries):
+        """
+        Records the results of glossarizing a resource: the resource itself, with its flags updated, and the glossary
+        entries generated for it. Returns `False`, discarding the results, if this worker's lease on the resource has
+        been lost to another worker in the meantime.
+        """
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE resources SET state = 'done', resource = ?, entries = ?, worker = NULL, lease_expires = NULL "
+                "WHERE uri = ? AND state = 'leased' AND worker = ?",
+                (json.dumps(resource), json.dumps(entries), resource['resource'], self.worker)).rowcount == 1
+
+    def release(self, resources):
+        """
+        Gives up this worker's leases on the given resources, so that other workers may claim them straight away.
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE resources SET state = 'pending', worker = NULL, lease_expires = NULL "
+                "WHERE uri = ? AND state = 'leased' AND worker = ?",
+                ((resource['resource'], self.worker) for resource in resources))
+
+    def counts(self):
+        """
+        Returns the number of resources in each state, as a `{state: count}` dict.
+        """
+        counts = {state: 0 for state in STATES}
+        counts.update(self._connection.execute("SELECT state, COUNT(*) FROM resources GROUP BY state").fetchall())
+        return counts
+
+    def merge(self, resource_filename, glossary_filename):
+        """
+        Writes the results recorded in the queue, but not yet merged, into the resource and glossary files: resource
+        entries are updated in place, and glossary entries are appended in resource list order. Returns the number of
+        resources merged.
+        """
+        with self._transaction() as connection:
+            rows = connection.execute("SELECT position, resource, entries FROM resources WHERE state = 'done' "
+                                      "ORDER BY position").fetchall()
+            if not rows:
+                return 0
+
+            write_resource_file([json.loads(row[1]) for row in rows], resource_filename, update=True)
+
+            glossary = []
+            if os.path.isfile(glossary_filename):
+                with open(glossary_filename, "r") as fp:
+                    glossary = json.load(fp)
+            for row in rows:
+                glossary += json.loads(row[2])
+            write_glossary_file(glossary, glossary_filename)
+
+            connection.executemany("UPDATE resources SET state = 'merged' WHERE position = ?",
+                                   ((row[0],) for row in rows))
+        return len(rows)
+
+
+def _group_entries(resources, glossary):
+    """Helper function. Assigns each glossary entry to the resource it was generated from."""
+    entries = {resource['resource']: [] for resource in resources}
+    for entry in glossary:
+        entries[entry['resource']].append(entry)
+    return entries
+
+
+def run_worker(glossarizer, domain, resource_filename, glossary_filename, timeout=60, use_cache=True,
+               batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS, worker=None, priority=None):
+    """
+    Glossarizes resources claimed from the work queue of the given resource file until there are none left, then
+    merges the results into the resource and glossary files. Any number of workers may be run at once, on any number
+    of machines sharing the files.
+
+    Parameters
+    ----------
+    glossarizer: str, required
+        The name of the glossarizer to run: "socrata", "ckan", or "html".
+    domain: str, required
+        The domain being glossarized, as would be passed to the glossarizer's `write_glossary`.
+    resource_filename: str, required
+        A path to a resource file to read processing jobs from.
+    glossary_filename: str, required
+        A path to a glossary file to write output to.
+    timeout: int, default 60
+        A timeout on how long the glossarizer can spend downloading a resource before timing it out.
+    use_cache: bool, default True
+        Whether or not to skip resources already flagged as processed, when filling the queue. See further the
+        glossarizer's `write_glossary`.
+    batch_size: int, default `BATCH_SIZE`
+        The number of resources claimed at once.
+    lease_seconds: int, default `LEASE_SECONDS`
+        How long a worker's claim on a batch lasts without renewal. A worker which dies has its batch picked up by
+        another once this much time has passed.
+    worker: str, optional
+        The name this worker holds leases under. Defaults to `default_worker_name()`.
+    priority: callable, optional
+        A function mapping each resource to a number. Resources with higher priorities are queued first; otherwise
+        resources are queued cheapest first. Only the worker which fills the queue orders it. See further
+        `costs.schedule`.
+
+    Returns
+    -------
+    The number of resources in each state once this worker is done, as a `{state: count}` dict.
+    """
+    module = importlib.import_module(GLOSSARIZERS[glossarizer])
+
+    queue = WorkQueue(queue_filename(resource_filename), worker=worker, lease_seconds=lease_seconds)
+    try:
+        resource_list, _ = load_glossary_todo(resource_filename, glossary_filename, use_cache)
+        history = costs.load_history(metrics.summary_filename(glossary_filename))
+        queue.populate(costs.schedule(resource_list, priority=priority, history=history, timeout=timeout))
+
+        metrics.start_run(glossarizer, domain)
+        try:
+            while True:
+                batch = queue.claim(batch_size)
+                if not batch:
+                    break
+
+                try:
+                    with tracing.span("batch", "queue", resources=len(batch)), queue.heartbeat():
+                        batch, glossary = module.get_glossary(resource_list=batch, glossary=[], domain=domain,
+                                                              timeout=timeout)
+                except BaseException:
+                    queue.release(batch)
+                    raise
+
+                entries = _group_entries(batch, glossary)
+                for resource in batch:
+                    queue.complete(resource, entries[resource['resource']])
+        finally:
+            with tracing.span("merge", "io"):
+                queue.merge(resource_filename, glossary_filename)
+            # Workers would overwrite one another's metrics summaries, so each writes its own.
+            metrics.finish_run("{0}.{1}.json".format(os.path.splitext(glossary_filename)[0], queue.worker))
+
+        return queue.counts()
+    finally:
+        queue.close()
@@ -0,0 +1,180 @@
+"""
+Opt-in profiling of the pipeline stages: resource listing, sizing, paging, glossarization, catalog initialization, and
+DAG updates.
+
+Profiling is off by default. To turn it on, set the `UPT_PROFILE_DIR` environment variable to a folder path, or call
+`enable` with one. Every run of an outermost stage (e.g. a `write_glossary` call) then writes a profile folder to that
+path, containing, for each stage run within it:
+
+* `<stage>.prof`, the stage's `cProfile` statistics, which may be loaded with `pstats` or a viewer like SnakeViz.
+* `<stage>.txt`, a summary: the number of times the stage ran, the time and peak memory it took, its most expensive
+  functions, and its top `tracemalloc` allocations.
+
+Stages nest (sizing happens within glossarization, for example). Only one `cProfile` profiler may be active at once, so
+an enclosing stage's profiler is paused while a nested stage runs: each stage's `cProfile` statistics cover only the
+time spent in that stage itself, while its wall time covers the nested stages too. Taking `tracemalloc` snapshots is
+expensive, so top allocations are recorded for the first run of each stage only. Stages entered from threads other
+than the main thread are not profiled.
+"""
+
+import contextlib
+import cProfile
+import datetime
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+PROFILE_DIR_ENVIRONMENT_VARIABLE = "UPT_PROFILE_DIR"
+
+# The number of frames tracemalloc records per allocation, and the number of functions and allocations summarized.
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_profile_dir = None
+_profiles = dict()
+_stack = []
+
+
+def enable(profile_dir):
+    """
+    Turns profiling on, writing profiles to the given folder. Takes precedence over the `UPT_PROFILE_DIR` environment
+    variable.
+    """
+    global _profile_dir
+    _profile_dir = profile_dir
+
+
+def disable():
+    """
+    Turns off profiling turned on by `enable`. Profiling turned on by the `UPT_PROFILE_DIR` environment variable
+    stays on.
+    """
+    global _profile_dir
+    _profile_dir = None
+
+
+def profile_dir():
+    """
+    Returns the folder profiles are written to, or `None` if profiling is off.
+    """
+    return _profile_dir or os.environ.get(PROFILE_DIR_ENVIRONMENT_VARIABLE) or None
+
+
+class _StageProfile:
+    """
+    The profile of every run of a stage within an outermost stage. Internal to `stage`.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.runs = 0
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self.snapshots = None
+
+    def resume(self):
+        tracemalloc.reset_peak()
+        self.profiler.enable()
+
+    def pause(self):
+        self.profiler.disable()
+        self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+
+    def write(self, folder):
+        self.profiler.dump_stats("{0}/{1}.prof".format(folder, self.name))
+
+        stream = io.StringIO()
+        stream.write("Stage: {0}\nRuns: {1}\nWall time: {2:.3f}s\nPeak traced memory: {3:.1f} KB\n\n".format(
+            self.name, self.runs, self.seconds, self.peak_memory / 1024))
+
+        stream.write("Top functions by cumulative time (excluding nested stages):\n")
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        if self.snapshots:
+            stream.write("Top allocations (first run only):\n")
+            before, after = self.snapshots
+            for statistic in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                stream.write("{0}\n".format(statistic))
+
+        with open("{0}/{1}.txt".format(folder, self.name), "w") as fp:
+            fp.write(stream.getvalue())
+
+
+def _snapshot():
+    """Helper function. Takes a tracemalloc snapshot, leaving out tracemalloc's own allocations."""
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Profiles the code run within it as the given pipeline stage, if profiling is turned on. When the outermost stage
+    exits, the profiles of every stage run within it are written out. See the module docstring for details.
+    """
+    folder = profile_dir()
+    if folder is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    outermost = not _stack
+    if outermost:
+        _profiles.clear()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+    else:
+        _stack[-1].pause()
+
+    if name not in _profiles:
+        _profiles[name] = _StageProfile(name)
+    profile = _profiles[name]
+    before = _snapshot() if profile.runs == 0 else None
+
+    _stack.append(profile)
+    start = time.perf_counter()
+    profile.resume()
+    try:
+        yield
+    finally:
+        profile.pause()
+        profile.seconds += time.perf_counter() - start
+        profile.runs += 1
+        if before is not None:
+            profile.snapshots = (before, _snapshot())
+        _stack.pop()
+
+        if outermost:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            _write_profiles(folder, name)
+        else:
+            _stack[-1].resume()
+
+
+def profiled(name):
+    """
+    Decorator. Profiles every call to the decorated function as the given pipeline stage. See further `stage`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write_profiles(folder, name):
+    """Helper function. Writes out the profiles of the stages run within an outermost stage."""
+    run_folder = "{0}/{1}-{2}-{3}".format(folder, datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f"), os.getpid(),
+                                          name)
+    os.makedirs(run_folder, exist_ok=True)
+    for profile in _profiles.values():
+        profile.write(run_folder)
+    _profiles.clear()
@@ -0,0 +1,233 @@
+"""
+Make-style freshness tracking for catalog tasks.
+
+A catalog task is a depositor or transform script in a task folder, `<root>/tasks/<folder>/`. Its outputs are the
+files declared on the last line of the script (see `task_outputs`), and its inputs are those of the depositor in its
+folder, if it is a transform. Depositors have no local inputs.
+
+When a task is run through `run_task` (which is what the DAG written by `update_dag(incremental=True)` does), a record
+of its script, inputs and outputs is written to `<root>/.taskstate/<folder>-<depositor|transform>.json` on success.
+A task is fresh if it has a record, and its script, inputs and outputs all match that record: nothing has changed
+since the task last ran. Fresh tasks are skipped.
+
+Files are identified by the SHA-256 digest of their contents. Hashing large outputs over and over again is expensive,
+so as with `make` the file size and modification time are checked first, and a file whose size and modification time
+match its record is taken to be unchanged without being re-read. Folder outputs are digested file by file.
+
+Depositors download data from remote sources, whose changes a local record cannot see. A `max_age` may be given to
+treat records older than that as stale, so that depositors are re-run every so often all the same.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from ast import literal_eval
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+STATE_FOLDER = ".taskstate"
+
+# Files are read this many bytes at a time when digesting them.
+CHUNK_SIZE = 2 ** 20
+
+
+def _munge_path(path):
+    """Helper function. Makes relative filepaths absolute."""
+    if os.path.isabs(path):
+        return path
+    else:
+        return str(Path(path).resolve())
+
+
+def task_outputs(filename):
+    """
+    Reads and returns the outputs a task script declares on its last line: `outputs = [...]` for Python scripts and
+    Jupyter notebooks, and `OUTPUTS=(...)` for Bash scripts. Relative paths are made absolute.
+    """
+    format = filename.rsplit(".")[-1]
+    with open(filename, "r") as f:
+        if format == 'py':
+            last_line = f.readlines()[-1]
+            outputs = literal_eval(last_line.split("=")[-1].strip())
+        elif format == 'sh':
+            last_line = f.readlines()[-1]
+            array = last_line.split("=")[-1].strip().replace("(", "").replace(")", "")
+            # Bash arrays may contain variables both with and without quotation strings.
+            # e.g. OUTPUTS=(Foo Bar "Foo Bar") is legal, and needs to be mapped to ("Foo", "Bar", "Foo Bar").
+            vars = array.split(" ")
+            outputs = []
+            for var in vars:
+                if len(var) > 0:  # avoid parsing multi-spaces
+                    outputs.append(var.replace('"', '').replace("'", ''))
+        else:  # ipynb
+            import nbformat
+            nb = nbformat.read(filename, as_version=4)
+            last_line = nb['cells'][-1]['source']
+            outputs = literal_eval(last_line.split("=")[-1].strip())  # same as py at this point
+
+    return [_munge_path(out) for out in outputs]
+
+
+def _task_kind(filename):
+    """Helper function. Returns whether the given task script is a depositor or a transform."""
+    return "depositor" if "depositor" in os.path.basename(filename) else "transform"
+
+
+def _task_folder(filename):
+    """Helper function. Returns the catalog root and task folder name of the given task script."""
+    task_folder = os.path.dirname(os.path.abspath(filename))
+    return os.path.dirname(os.path.dirname(task_folder)), os.path.basename(task_folder)
+
+
+def task_inputs(filename):
+    """
+    Returns the inputs of the given task script: the outputs of the depositor in its task folder, if it is a
+    transform, and nothing if it is a depositor.
+    """
+    if _task_kind(filename) == "depositor":
+        return []
+
+    task_folder = os.path.dirname(os.path.abspath(filename))
+    depositor = next((f for f in sorted(os.listdir(task_folder)) if "depositor" in f), None)
+    return task_outputs(os.path.join(task_folder, depositor)) if depositor else []
+
+
+def record_filename(filename):
+    """Returns the path to the freshness record of the given task script."""
+    root, folder = _task_folder(filename)
+    return os.path.join(root, STATE_FOLDER, "{0}-{1}.json".format(folder, _task_kind(filename)))
+
+
+def digest(path, known=None):
+    """
+    Digests a file or folder, returning a `{'size': int, 'mtime_ns': int, 'sha256': str}` dict, or `None` if there is
+    nothing at the path. If a `known` digest with the same size and modification time is given, it is returned as-is
+    rather than re-reading the file.
+    """
+    if os.path.isdir(path):
+        files = sorted(os.path.join(dirpath, f) for dirpath, _, filenames in os.walk(path) for f in filenames)
+        stats = [os.stat(f) for f in files]
+        size, mtime_ns = sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)
+    elif os.path.isfile(path):
+        files = [path]
+        stat = os.stat(path)
+        size, mtime_ns = stat.st_size, stat.st_mtime_ns
+    else:
+        return None
+
+    if known and known['size'] == size and known['mtime_ns'] == mtime_ns:
+        return known
+
+    sha256 = hashlib.sha256()
+    for f in files:
+        if f != path:
+            sha256.update(os.path.relpath(f, path).encode("utf-8"))
+        with open(f, "rb") as fp:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+
+    return {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256.hexdigest()}
+
+
+def _digests(paths, known=None):
+    """Helper function. Digests each of the given paths, reusing known digests where they are still good."""
+    known = known or dict()
+    return {path: digest(path, known.get(path)) for path in paths}
+
+
+def _unchanged(paths, known):
+    """
+    Helper function. Returns whether or not the contents of the given paths match their known digests. Files which
+    were rewritten with the same contents (by a depositor re-downloading unchanged data, say) are unchanged.
+    """
+    if set(paths) != set(known):
+        return False
+    current = _digests(paths, known)
+    return all(current[path] is not None and known[path] is not None and
+               current[path]['sha256'] == known[path]['sha256'] for path in paths)
+
+
+def read_record(filename):
+    """Returns the freshness record of the given task script, or `None` if there is none."""
+    try:
+        with open(record_filename(filename), "r") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def record(filename):
+    """
+    Writes the freshness record of the given task script, which has just been run successfully.
+    """
+    previous = read_record(filename) or dict()
+    state = {
+        'script': digest(filename, previous.get('script')),
+        'inputs': _digests(task_inputs(filename), previous.get('inputs')),
+        'outputs': _digests(task_outputs(filename), previous.get('outputs')),
+        'time': time.time()
+    }
+
+    state_filename = record_filename(filename)
+    os.makedirs(os.path.dirname(state_filename), exist_ok=True)
+    with open(state_filename + ".tmp", "w") as fp:
+        json.dump(state, fp, indent=4)
+    os.replace(state_filename + ".tmp", state_filename)
+
+
+def is_fresh(filename, max_age=None):
+    """
+    Returns whether or not the given task script is fresh: whether it has been run before, and neither it nor its
+    inputs or outputs have changed since. If a `max_age` (in seconds) is given, records older than that are stale.
+    """
+    state = read_record(filename)
+    if state is None:
+        return False
+    if max_age is not None and time.time() - state['time'] > max_age:
+        return False
+
+    # A missing file is never unchanged, even if it was missing when the record was written.
+    return (_unchanged([filename], {filename: state['script']}) and
+            _unchanged(task_outputs(filename), state['outputs']) and
+            _unchanged(task_inputs(filename), state['inputs']))
+
+
+def run_task(filename, max_age=None):
+    """
+    Runs the given task script, unless it is fresh, and records its state if it succeeds. Returns the script's exit
+    code (zero if it was skipped).
+    """
+    if is_fresh(filename, max_age=max_age):
+        print("Skipping {0}: it is up to date.".format(filename))
+        return 0
+
+    format = filename.rsplit(".")[-1]
+    if format == 'py':
+        command = [sys.executable, filename]
+    elif format == 'sh':
+        command = ["bash", filename]
+    elif format == 'ipynb':
+        command = ["jupyter", "nbconvert", "--to", "notebook", "--execute", filename]
+    else:
+        raise NotImplementedError("The given operation type was not understood.")
+
+    returncode = subprocess.call(command)
+    if returncode == 0:
+        record(filename)
+    return returncode
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run a catalog task, unless it is up to date.")
+    parser.add_argument("filename", help="The depositor or transform script to run.")
+    parser.add_argument("--max-age", type=float, default=None,
+                        help="Re-run the task if it was last run more than this many seconds ago.")
+    args = parser.parse_args(args)
+    return run_task(args.filename, max_age=args.max_age)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
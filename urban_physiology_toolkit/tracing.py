@@ -0,0 +1,148 @@
+"""
+Timeline tracing of glossarization and catalog runs.
+
+Where `glossarizers.metrics` aggregates, tracing records when things happened: a span for each pipeline stage, each
+resource processed, each page load, each download, and each file write. Spans are written out as a Chrome trace-event
+JSON file, which may be opened in Perfetto (https://ui.perfetto.dev) or in Chrome's `about:tracing`.
+
+Tracing is off by default. To turn it on, set the `UPT_TRACE_FILE` environment variable to the path of the trace file
+to write, or call `enable` with one. The trace file is rewritten with every span recorded so far each time an outermost
+span (one with no enclosing span on its thread) finishes, and once more when the process exits. When tracing runs
+spread over several processes (see `glossarizers.scheduler`), include `{pid}` in the path, and each process will write
+its own trace file.
+
+When tracing is off, `span` returns a shared do-nothing object, so an untraced span costs little more than a function
+call.
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_FILE_ENVIRONMENT_VARIABLE = "UPT_TRACE_FILE"
+
+_trace_file = os.environ.get(TRACE_FILE_ENVIRONMENT_VARIABLE) or None
+_events = []
+_thread_names = dict()
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def enable(trace_file):
+    """
+    Turns tracing on, writing the trace to the given file. Takes precedence over the `UPT_TRACE_FILE` environment
+    variable.
+    """
+    global _trace_file
+    _trace_file = trace_file
+
+
+def disable():
+    """
+    Turns tracing off, discarding any spans which have not been written out yet.
+    """
+    global _trace_file
+    _trace_file = None
+    with _lock:
+        _events.clear()
+        _thread_names.clear()
+
+
+def _now():
+    """Helper function. Returns the current time in microseconds, the unit trace events are timestamped in."""
+    return time.perf_counter_ns() / 1000
+
+
+class _NullSpan:
+    """
+    The span handed out when tracing is off. Does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """
+    A span being traced. Becomes a complete ("X") trace event when it exits.
+    """
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.depth = getattr(_local, 'depth', 0)
+        _local.depth = self.depth + 1
+        self.start = _now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = _now()
+        _local.depth = self.depth
+
+        thread = threading.current_thread()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        _events.append({'name': self.name, 'cat': self.category, 'ph': 'X', 'ts': self.start,
+                        'dur': end - self.start, 'pid': os.getpid(), 'tid': thread.ident, 'args': self.args})
+        _thread_names[thread.ident] = thread.name
+
+        if self.depth == 0:
+            flush()
+        return False
+
+
+def span(name, category="stage", **args):
+    """
+    Returns a context manager which traces the code run within it as a span with the given name, category, and
+    arguments. Categories in use are "stage", "resource", "paging", "sizing", "request", and "io".
+    """
+    if _trace_file is None:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(name, category="stage"):
+    """
+    Decorator. Traces every call to the decorated function as a span. See further `span`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def flush():
+    """
+    Writes every span recorded so far to the trace file, if tracing is on.
+    """
+    if _trace_file is None:
+        return
+    trace_file = _trace_file.replace("{pid}", str(os.getpid()))
+
+    with _lock:
+        events = list(_events)
+        thread_names = dict(_thread_names)
+
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                for tid, name in thread_names.items()]
+
+    temp_filename = trace_file + ".tmp"
+    with open(temp_filename, "w") as fp:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, fp)
+    os.replace(temp_filename, trace_file)
+
+
+atexit.register(flush)
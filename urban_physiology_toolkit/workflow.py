@@ -3,12 +3,16 @@ Methodology for the portal localization workflow. Excludes glossarizer-specific
 in `glossarizer_utils`.
 """
 
-from ast import literal_eval
+import hashlib
 import json
 import os
-from pathlib import Path
+import re
+import shlex
 import shutil
-import nbformat
+import sys
+
+from urban_physiology_toolkit import profiling, taskstate, tracing
+from urban_physiology_toolkit.glossarizers import fingerprint
 
 
 def slugify(value):
@@ -72,6 +76,10 @@ def generate_data_package_from_glossary_entry(entry):
                   'landing_page', 'last_updated', 'protocol', 'created']:
         package[field] = entry[field] if field in entry else None
 
+    # mirrors of the same data folded into this one by `init_catalog`, if any.
+    if 'aliases' in entry:
+        package['aliases'] = entry['aliases']
+
     # populate the resources field directly, if appropriate.
     if no_transform_needed:
         package['resources'] = [
@@ -81,7 +89,49 @@ def generate_data_package_from_glossary_entry(entry):
     return package
 
 
-def init_catalog(glossary_filepath, root, max_filesize=None, max_columns=None):
+def fold_duplicates(glossary):
+    """
+    Folds glossary entries for resources whose content is identical (going by their `fingerprint` fields) into the
+    entries of the first such resource, whose entries gain an `aliases` field listing the URLs of the others. Resources
+    with entries lacking a fingerprint are left as they are.
+
+    Parameters
+    ----------
+    glossary: list, required
+        The glossary entries.
+
+    Returns
+    -------
+    The glossary, with duplicates folded.
+    """
+    # A resource may have several entries (one per archive member), so resources are compared by all of them at once.
+    resource_keys = dict()
+    for entry in glossary:
+        resource_keys.setdefault(entry['resource'], set()).add(fingerprint.fingerprint_key(entry.get('fingerprint')))
+
+    canonical_resources = dict()
+    aliases = dict()
+    for resource, keys in resource_keys.items():
+        if None in keys:
+            continue
+        canonical = canonical_resources.setdefault(frozenset(keys), resource)
+        if canonical != resource:
+            aliases.setdefault(canonical, []).append(resource)
+
+    duplicates = {alias for resource_aliases in aliases.values() for alias in resource_aliases}
+    folded = []
+    for entry in glossary:
+        if entry['resource'] in duplicates:
+            continue
+        if entry['resource'] in aliases:
+            entry = dict(entry, aliases=aliases[entry['resource']])
+        folded.append(entry)
+    return folded
+
+
+@profiling.profiled("init-catalog")
+@tracing.traced("init_catalog")
+def init_catalog(glossary_filepath, root, max_filesize=None, max_columns=None, dedupe=False):
     """
     Initializes a catalog's folder structure.
 
@@ -99,6 +149,10 @@ def init_catalog(glossary_filepath, root, max_filesize=None, max_columns=None):
         If specified, only glossary entries for resources less than this length in terms of number of columns will be
         written to the catalog.  Otherwise, write everything. Note that glossary entries lacking a non-null `columns`
         field will not be filtered out.
+    dedupe: bool, default False
+        If `True`, resources whose content is identical to that of another resource in the glossary (going by their
+        `fingerprint` fields) are folded into a single deposit, whose data package lists the URLs of the others as
+        `aliases`. See further `fold_duplicates`.
     """
     from pathlib import Path
     import os
@@ -125,6 +179,10 @@ def init_catalog(glossary_filepath, root, max_filesize=None, max_columns=None):
         glossary = [resource for resource in glossary if (('columns' in resource and resource['columns'] < max_columns)
                                                           or 'columns' not in resource)]
 
+    # Fold mirrors of the same data together.
+    if dedupe:
+        glossary = fold_duplicates(glossary)
+
     # Resource names are not necessarily unique; only resource URLs are. We need to modify our resource names
     # as we go along to ensure that all of our elements end up in the right places, folder-wise.
     resources = [entry['resource'] for entry in glossary]
@@ -164,13 +222,26 @@ def init_catalog(glossary_filepath, root, max_filesize=None, max_columns=None):
             dataset_filepath = "{0}/catalog/{1}/{2}".format(root, resource_folder_name, data_filename)
             depositor_filepath = root + "/tasks" + "/{0}".format(resource_folder_name) + "/depositor.py"
 
+            # The depositor fingerprints the data the same way it was fingerprinted when it was glossarized (see
+            # `glossarizers.fingerprint`). The fingerprint is an output, so that it is tracked along with the data.
             with open(depositor_filepath, "w") as f:
-                f.write("""import requests
-r = requests.get("{0}")
-with open("{1}", "wb") as f:
-    f.write(r.content)
+                f.write("""import json
+import requests
+
+from urban_physiology_toolkit.glossarizers import fingerprint
 
-outputs = ["{1}"]
+r = requests.get("{0}", stream=True)
+# Error pages are not data, so don't write them over it.
+r.raise_for_status()
+with open("{1}", "wb") as f:
+    for chunk in r.iter_content(chunk_size=1024 * 1024):
+        f.write(chunk)
+with open("{1}", "rb") as f:
+    data_fingerprint = fingerprint.fingerprint_file(f)
+with open("{1}.fingerprint.json", "w") as f:
+    json.dump(data_fingerprint, f)
+
+outputs = ["{1}", "{1}.fingerprint.json"]
 """.format(entry['resource'], dataset_filepath))
 
     # Write the transform task folders. We do this by first organizing our entries into three categories:
@@ -179,10 +250,15 @@ outputs = ["{1}"]
     #    the glossary. Right now the limitation in place is that if we have an archival file, we assume that it is
     #    provided in a ZIP format (as opposed to, say, a TAR, or some other archive). Significant re-engineering
     #    still needs to be done in order to enable alternative file formats. See the GitHub issues. Anyway,
-    #    if it's an assumed ZIP file, an incomplete transform is written that unzips the file and prepares a data
-    #    package.
+    #    if it's an assumed ZIP file, a transform is written that extracts the archive members named in the
+    #    resource's entries (see `_archive_transform`).
     # 3. Other resources. These are single-dataset resources which are not CSV or geospatial files. An incomplete
     #    transform is written in these cases too.
+    archive_members = dict()
+    for entry, resource_folder_name in zip(glossary, resource_folder_names):
+        if entry['dataset'] != "." and entry['dataset'] not in archive_members.get(resource_folder_name, []):
+            archive_members.setdefault(resource_folder_name, []).append(entry['dataset'])
+
     folders = set()
     for entry, resource_folder_name in zip(glossary, resource_folder_names):
         if resource_folder_name not in folders:
@@ -198,12 +274,8 @@ outputs = ["{1}"]
                 pass
             elif entry['dataset'] != ".":  # Case 2
                 with open(transform_filepath, "w") as f:
-                    f.write("""# TODO: Finish implementing!
-from zipfile import ZipFile
-z = ZipFile("{0}", "r")
-
-outputs = []
-""".format(dataset_filepath))
+                    f.write(_archive_transform(dataset_filepath, catalog_filepath + "/data",
+                                               archive_members[resource_folder_name]))
             else:  # Case 3
                 with open(transform_filepath, "w") as f:
                     f.write("""# TODO: Finish implementing!
@@ -213,98 +285,355 @@ outputs = []
 """.format(dataset_filepath))
 
 
-def update_dag(root="."):
+def _archive_transform(archive, destination, members):
+    """
+    Helper function. Returns the source of a transform which extracts the given members of a ZIP archive into the
+    given destination folder, keeping their paths within the archive. Subroutine of `init_catalog`.
+
+    Members are streamed out of the archive one at a time, a bounded chunk at a time, so that neither the archive nor
+    any one member need fit in memory. Members already extracted, going by their size and CRC-32 checksum, are
+    skipped, so re-running the transform only extracts what is missing or has changed. Members whose paths would land
+    outside of the destination folder (e.g. "../../etc/passwd", a "zip slip") are left out of the transform.
+
+    Member names sized up by `datafy` may not match those in the archive (they can carry a leftover temporary folder
+    prefix), so members which are not in the archive under their own name are looked up by their basename. Members
+    which still cannot be found, or are ambiguous, are skipped with a warning.
+    """
+    destination = os.path.normpath(destination)
+    safe_members, outputs = [], []
+    for member in members:
+        target = os.path.normpath(os.path.join(destination, member))
+        if os.path.isabs(member) or os.path.commonpath([target, destination]) != destination:
+            continue
+        safe_members.append(member)
+        outputs.append(target)
+
+    # The outputs must be declared on the last line as a literal, see `taskstate.task_outputs`.
+    return """import os
+import shutil
+import warnings
+import zlib
+from zipfile import ZipFile
+
+# Members are streamed out of the archive this many bytes at a time.
+CHUNK_SIZE = 1024 * 1024
+
+archive = {0!r}
+destination = os.path.realpath({1!r})
+members = {2!r}
+
+
+def crc32(filepath):
+    crc = 0
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def find_member(z, member):
+    try:
+        return z.getinfo(member)
+    except KeyError:
+        matches = [info for info in z.infolist()
+                   if not info.is_dir() and os.path.basename(info.filename) == os.path.basename(member)]
+        return matches[0] if len(matches) == 1 else None
+
+
+with ZipFile(archive, "r") as z:
+    for member in members:
+        info = find_member(z, member)
+        if info is None:
+            warnings.warn("The archive member {{0}} could not be found in {{1}}, skipping it.".format(member, archive))
+            continue
+        target = os.path.realpath(os.path.join(destination, member))
+        if os.path.commonpath([target, destination]) != destination:
+            raise ValueError("The archive member {{0}} lies outside of {{1}}.".format(member, destination))
+
+        if os.path.isfile(target) and os.path.getsize(target) == info.file_size and crc32(target) == info.CRC:
+            continue
+
+        # Extract to a scratch file first, so that an interrupted extraction is never mistaken for a finished one.
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with z.open(info) as source, open(target + ".part", "wb") as sink:
+            shutil.copyfileobj(source, sink, CHUNK_SIZE)
+        os.replace(target + ".part", target)
+
+outputs = {3!r}
+""".format(archive, destination, safe_members, outputs)
+
+
+def _shard_of(key, shards):
+    """Helper function. Assigns a key to a shard. Unlike `hash`, this is stable from one process to the next."""
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16) % shards
+
+
+def _source_host(root, folder):
+    """
+    Helper function. Returns the host a task folder's depositor downloads from: that of the first URL in the depositor
+    file. Returns `None` if there is no depositor, or no URL in it.
+    """
+    task_folder = "{0}/tasks/{1}".format(root, folder)
+    depositor = next((f for f in os.listdir(task_folder) if "depositor" in f), None)
+    if depositor is None:
+        return None
+
+    with open("{0}/{1}".format(task_folder, depositor), "r") as f:
+        match = re.search(r"https?://([^/\s\"'\\]+)", f.read())
+    return match.group(1).lower() if match else None
+
+
+def _host_pools(folders, hosts, host_slots=None, max_downloads=None):
+    """
+    Helper function. Assigns the depositors in the given task folders to per-host Airflow pools. Returns a
+    `{folder: pool}` dict and the pools themselves, in the format `airflow pools import` reads. See `update_dag` for
+    how slots are allotted.
+    """
+    folder_pools, pool_hosts = dict(), dict()
+    for folder in folders:
+        host = hosts.get(folder) or "unknown"
+        folder_pools[folder] = "downloads_" + re.sub(r"[^a-z0-9]+", "_", host)
+        pool_hosts[folder_pools[folder]] = host
+
+    # Busier pools are listed first, so that they get first dibs on any slots left over when splitting up the cap.
+    depositor_counts = dict()
+    for pool in folder_pools.values():
+        depositor_counts[pool] = depositor_counts.get(pool, 0) + 1
+    pools = sorted(depositor_counts, key=lambda pool: (-depositor_counts[pool], pool))
+
+    pool_specs = dict()
+    for i, pool in enumerate(pools):
+        slots = host_slots or depositor_counts[pool]
+        if max_downloads is not None:
+            share = max_downloads // len(pools) + (1 if i < max_downloads % len(pools) else 0)
+            slots = min(slots, share)
+        pool_specs[pool] = {'slots': max(slots, 1),
+                            'description': "Concurrent downloads from {0}.".format(pool_hosts[pool])}
+
+    return folder_pools, pool_specs
+
+
+def _run_task_command(filename, max_age=None):
+    """Helper function. Returns the Bash command running the given task script through `taskstate.run_task`."""
+    command = "{0} -m urban_physiology_toolkit.taskstate {1}".format(shlex.quote(sys.executable),
+                                                                     shlex.quote(filename))
+    if max_age is not None:
+        command += " --max-age {0}".format(max_age)
+    return command
+
+
+def _dag_string(tasks, dag_id="airscooter_dag", task_pools=None, task_commands=None):
+    """
+    Helper function. Returns the Airflow DAG file for the given tasks, with the given DAG ID. Tasks named in the
+    `task_pools` dict are run in the pool given for them, and tasks named in the `task_commands` dict are run with the
+    Bash command given for them.
+    """
+    from airscooter.orchestration import create_airflow_string
+
+    task_pools, task_commands = task_pools or dict(), task_commands or dict()
+    dag = create_airflow_string(tasks).replace("DAG('airscooter_dag'", "DAG('{0}'".format(dag_id))
+
+    # Airscooter has no notion of pools or wrapped commands, but every operator it writes ends in "dag=dag)", so the
+    # operators in question may be rewritten.
+    for task in tasks:
+        if task.name not in task_pools and task.name not in task_commands:
+            continue
+
+        operator = task.as_airflow_string()
+        if task.name in task_commands:
+            rewritten = 'BashOperator(bash_command={0!r}, task_id="{1}", dag=dag'.format(task_commands[task.name],
+                                                                                     task.name)
+        else:
+            rewritten = operator[:-1]
+        if task.name in task_pools:
+            rewritten += ", pool='{0}'".format(task_pools[task.name])
+        dag = dag.replace("{0} = {1}".format(task.name, operator), "{0} = {1})".format(task.name, rewritten))
+
+    return dag
+
+
+def _remove_stale(filenames):
+    """Helper function. Removes DAG files left over from a previous `update_dag` run which were not rewritten."""
+    for filename in filenames:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+@profiling.profiled("update-dag")
+@tracing.traced("update_dag")
+def update_dag(root=".", shards=None, shard_by="folder", host_slots=None, max_downloads=None, incremental=False,
+               max_age=None):
     """
     Updates the Airscooter DAG so that it reflects the current state of the catalog. This operation creates the
     `.airflow` folder, initializes the `airflow` DAG, and adds all discoverable tasks to the DAG.
 
-    Note
+    By default every task is written into a single DAG: its serialized task list goes to `.airflow/airscooter.yml`,
+    and the DAG itself to `.airflow/dags/airscooter_dag.py`. For large catalogs this one file takes Airflow a long time
+    to parse, so the DAG may instead be split into `shards` DAGs, each in its own file. Shard `i` has its task list
+    written to `.airflow/shards/airscooter_{i}.yml`, and its DAG (with a DAG ID of `airscooter_dag_{i}`) to
+    `.airflow/dags/airscooter_dag_{i}.py`, where `i` is zero-padded to the width of the largest shard number. A task
+    folder's depositor and transform always end up in the same shard. DAG files left over from a previous run with a
+    different number of shards are removed.
 
     Parameters
     ----------
     root: str, required
         A folder path to the catalog root folder.
+    shards: int, optional
+        The number of DAG files to split the tasks into. If not provided, a single unsharded DAG is written.
+    shard_by: {'folder', 'host'}, default 'folder'
+        How task folders are assigned to shards: by a hash of the task folder name, which spreads tasks evenly, or by
+        a hash of the host their depositor downloads from, which keeps the tasks of each source together.
+    host_slots: int, optional
+        The maximum number of depositors which may download from any one host at once. If this or `max_downloads` is
+        provided, every depositor is run in an Airflow pool for the host in its resource URL (named
+        `downloads_{host}`, with non-alphanumeric characters replaced by underscores), and the pools are written to
+        `.airflow/pools.json`, ready for `airflow pools import`. Pools are shared across shards. If neither is
+        provided, depositors are not pooled, and a pools file left over from a previous run is removed.
+    max_downloads: int, optional
+        The maximum number of depositors which may download at once, across all hosts. The cap is split evenly
+        between the host pools, with any remainder going to the pools with the most depositors, and no pool getting
+        more than `host_slots` slots. Every pool gets at least one slot, so if there are more hosts than
+        `max_downloads` the cap is exceeded by the difference.
+    incremental: bool, default False
+        Whether or not to skip up-to-date tasks (see `taskstate`). If set, tasks which are fresh are left out of the
+        DAG (a transform is only left out if its depositor is too), and the tasks which remain are run through
+        `taskstate.run_task`, which records their state when they succeed, and skips them if they have become fresh
+        in the meantime.
+    max_age: float, optional
+        When `incremental` is set, the number of seconds after which a depositor's last run is too old to be fresh,
+        however unchanged it is locally: the data it downloads may have changed remotely. If not provided, depositors
+        are re-run only when their script or outputs change. Transforms are unaffected, as they are re-run whenever
+        their depositor changes their inputs.
     """
     from airscooter.orchestration import Depositor, Transform
 
-    resource_folders = os.listdir("{0}/tasks/".format(root))
-    tasks = []
+    if shard_by not in ('folder', 'host'):
+        raise ValueError("Tasks may be sharded by 'folder' or by 'host', not by '{0}'.".format(shard_by))
 
-    def munge_path(path):
-        """Helper function. Makes relative filepaths absolute."""
-        if os.path.isabs(path):
-            return path
-        else:
-            return str(Path(path).resolve())
-
-    def read_output(fp):
-        """Helper function. Reads and returns task outputs."""
-        format = fp.rsplit(".")[-1]
-        with open(filename, "r") as f:
-            if format == 'py':
-                last_line = f.readlines()[-1]
-                outputs = literal_eval(last_line.split("=")[-1].strip())
-            elif format == 'sh':
-                last_line = f.readlines()[-1]
-                array = last_line.split("=")[-1].strip().replace("(", "").replace(")", "")
-                # Bash arrays may contain variables both with and without quotation strings.
-                # e.g. OUTPUTS=(Foo Bar "Foo Bar") is legal, and needs to be mapped to ("Foo", "Bar", "Foo Bar").
-                vars = array.split(" ")
-                outputs = []
-                for var in vars:
-                    if len(var) > 0:  # avoid parsing multi-spaces
-                        outputs.append(var.replace('"', '').replace("'", ''))
-            else:  # ipynb
-                nb = nbformat.read(fp, as_version=4)
-                last_line = nb['cells'][-1]['source']
-                outputs = literal_eval(last_line.split("=")[-1].strip())  # same as py at this point
-
-        return [munge_path(out) for out in outputs]
+    resource_folders = sorted(os.listdir("{0}/tasks/".format(root)))
 
-    for folder in resource_folders:
+    def read_tasks(folders):
+        """Helper function. Reads and returns the tasks in the given task folders."""
+        tasks = []
+
+        for folder in folders:
 
-        todo = os.listdir("{0}/tasks/{1}".format(root, folder))
+            todo = os.listdir("{0}/tasks/{1}".format(root, folder))
 
-        try:
-            depositor = next(f for f in todo if "depositor" in f)
-        except StopIteration:
-            depositor = None
-        try:
-            transform = next(f for f in todo if "transform" in f)
-        except StopIteration:
-            transform = None
+            try:
+                depositor = next(f for f in todo if "depositor" in f)
+            except StopIteration:
+                depositor = None
+            try:
+                transform = next(f for f in todo if "transform" in f)
+            except StopIteration:
+                transform = None
 
-        if depositor:
-            name = "{0}-depositor".format(folder)
-            filename = "{0}/tasks/{1}/{2}".format(root, folder, depositor)
+            depositor_prior = None
+            if depositor:
+                name = "{0}-depositor".format(folder)
+                filename = "{0}/tasks/{1}/{2}".format(root, folder, depositor)
 
-            outputs = read_output(filename)
+                # A transform can only be left out if its depositor is too, as the depositor may change its inputs.
+                if not (incremental and taskstate.is_fresh(filename, max_age=max_age)):
+                    outputs = taskstate.task_outputs(filename)
 
-            py_name = "var_" + name.replace("-", "_")  # clean up the URL slug name so that it can be used as a var
-            dep = Depositor(py_name, filename, outputs)
-            tasks.append(dep)
+                    py_name = "var_" + name.replace("-", "_")  # clean up the URL slug name so that it can be a var
+                    depositor_prior = Depositor(py_name, filename, outputs)
+                    tasks.append(depositor_prior)
+                    if folder in folder_pools:
+                        task_pools[py_name] = folder_pools[folder]
+                    if incremental:
+                        task_commands[py_name] = _run_task_command(filename, max_age=max_age)
 
-        if transform:
-            name = "{0}-transform".format(folder)
-            filename = "{0}/tasks/{1}/{2}".format(root, folder, transform)
-            depositor_prior = tasks[-1]
-            inputs = tasks[-1].output
+            if transform:
+                name = "{0}-transform".format(folder)
+                filename = "{0}/tasks/{1}/{2}".format(root, folder, transform)
 
-            outputs = read_output(filename)
+                if depositor_prior is None and incremental and taskstate.is_fresh(filename):
+                    continue
+
+                inputs = depositor_prior.output if depositor_prior else taskstate.task_inputs(filename)
+                outputs = taskstate.task_outputs(filename)
 
-            py_name = "var_" + name.replace("-", "_")  # clean up the URL slug name so that it can be used as a var
-            trans = Transform(py_name, filename, inputs, outputs, requirements=[depositor_prior])
-            tasks.append(trans)
+                py_name = "var_" + name.replace("-", "_")  # clean up the URL slug name so that it can be used as a var
+                trans = Transform(py_name, filename, inputs, outputs,
+                                  requirements=[depositor_prior] if depositor_prior else [])
+                tasks.append(trans)
+                if incremental:
+                    task_commands[py_name] = _run_task_command(filename)
 
-    from airscooter.orchestration import (serialize_to_file, write_airflow_string)
+        return tasks
 
-    serialize_to_file(tasks, "{0}/.airflow/airscooter.yml".format(root))
+    from airscooter.orchestration import serialize_to_file
 
     if not os.path.isdir("{0}/.airflow/dags/".format(root)):
         os.mkdir("{0}/.airflow/dags/".format(root))
-    write_airflow_string(tasks, "{0}/.airflow/dags/airscooter_dag.py".format(root))
-
 
+    # Hosts are needed to shard by host and to pool by host, and both are best done from a single read.
+    if shard_by == 'host' or host_slots is not None or max_downloads is not None:
+        hosts = {folder: _source_host(root, folder) for folder in resource_folders}
+    else:
+        hosts = dict()
+
+    folder_pools, task_pools, task_commands = dict(), dict(), dict()
+    pools_filename = "{0}/.airflow/pools.json".format(root)
+    if host_slots is not None or max_downloads is not None:
+        depositor_folders = [folder for folder in resource_folders if
+                             any("depositor" in f for f in os.listdir("{0}/tasks/{1}".format(root, folder)))]
+        folder_pools, pools = _host_pools(depositor_folders, hosts, host_slots, max_downloads)
+        with open(pools_filename, "w") as f:
+            json.dump(pools, f, indent=4, sort_keys=True)
+    else:
+        _remove_stale([pools_filename])
+
+    shard_dag_pattern = re.compile(r"^airscooter_dag_\d+\.py$")
+    shard_dags = {f for f in os.listdir("{0}/.airflow/dags/".format(root)) if shard_dag_pattern.match(f)}
+
+    if shards is None:
+        tasks = read_tasks(resource_folders)
+        serialize_to_file(tasks, "{0}/.airflow/airscooter.yml".format(root))
+        with open("{0}/.airflow/dags/airscooter_dag.py".format(root), "w") as f:
+            f.write(_dag_string(tasks, task_pools=task_pools, task_commands=task_commands))
+
+        _remove_stale("{0}/.airflow/dags/{1}".format(root, f) for f in shard_dags)
+        if os.path.isdir("{0}/.airflow/shards".format(root)):
+            shutil.rmtree("{0}/.airflow/shards".format(root))
+        return
+
+    # Assign task folders to shards up front, so that only one shard's tasks need be held in memory at once.
+    shard_folders = [[] for _ in range(shards)]
+    for folder in resource_folders:
+        key = hosts.get(folder) if shard_by == 'host' else None
+        shard_folders[_shard_of(key or folder, shards)].append(folder)
+
+    if not os.path.isdir("{0}/.airflow/shards/".format(root)):
+        os.mkdir("{0}/.airflow/shards/".format(root))
+    digits = len(str(shards - 1))
+
+    written_dags = set()
+    for i, folders in enumerate(shard_folders):
+        with tracing.span("shard {0}".format(i), tasks=len(folders)):
+            shard = str(i).zfill(digits)
+            tasks = read_tasks(folders)
+            serialize_to_file(tasks, "{0}/.airflow/shards/airscooter_{1}.yml".format(root, shard))
+
+            # Every DAG needs an ID of its own.
+            dag_filename = "airscooter_dag_{0}.py".format(shard)
+            with open("{0}/.airflow/dags/{1}".format(root, dag_filename), "w") as f:
+                f.write(_dag_string(tasks, dag_id="airscooter_dag_{0}".format(shard), task_pools=task_pools,
+                                    task_commands=task_commands))
+            written_dags.add(dag_filename)
+
+    _remove_stale(["{0}/.airflow/airscooter.yml".format(root), "{0}/.airflow/dags/airscooter_dag.py".format(root)])
+    _remove_stale("{0}/.airflow/dags/{1}".format(root, f) for f in shard_dags - written_dags)
+    written_ymls = {"airscooter_{0}.yml".format(str(i).zfill(digits)) for i in range(shards)}
+    _remove_stale("{0}/.airflow/shards/{1}".format(root, f) for f in
+                  set(os.listdir("{0}/.airflow/shards/".format(root))) - written_ymls)
+
+
+@tracing.traced("finalize_catalog")
 def finalize_catalog(root="."):
     """
     Removes any catalog and task folders that are in an incomplete state. This operation will not touch the